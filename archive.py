@@ -0,0 +1,164 @@
+
+# Game archive
+# binary file of games stored as 16 bit moves, a few bytes per ply instead of hundreds
+
+# FILE FORMAT:
+#   8 byte magic, then one record per game, back to back:
+#       plies:    u16, number of moves
+#       result:   u8, RESULT_* code
+#       reserved: u8, 0
+#       moves:    plies * u16, packed moves exactly as ChessGame.moves holds them (see encode_move:
+#                 from square, to square, and 4 flag bits for captures, castles, en passant, promotions)
+#   everything little endian, so a game with 80 plies is 164 bytes
+
+# HOW IT WORKS:
+#   encoding a game is one numpy conversion of ChessGame.moves, decoding is a numpy view straight
+#   into the memory mapped file, so a full scan never copies or parses a move until it's used
+#   the moves are already legal and fully resolved (no SAN to disambiguate), replaying them is
+#   just make_move
+
+# USAGE:
+#   python archive.py games.pgn games.arc
+
+
+import argparse
+import mmap
+import os
+import time
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from chess_game import ChessGame, ChessMove
+from pgn_reader import read_pgn
+
+
+MAGIC = b"CHESSARC"
+GAME_HEADER_BYTES = 4
+
+RESULT_UNKNOWN = 0
+RESULT_WHITE = 1
+RESULT_BLACK = 2
+RESULT_DRAW = 3
+
+RESULTS = {"*": RESULT_UNKNOWN, "1-0": RESULT_WHITE, "0-1": RESULT_BLACK, "1/2-1/2": RESULT_DRAW}
+
+
+# one game read back from an archive
+#   moves: numpy u16 array of packed moves (a view into the mapped file)
+class ArchivedGame:
+
+    __slots__ = ("moves", "result")
+
+    def __init__(self, moves, result):
+        self.moves = moves
+        self.result = result
+
+    # replay the moves onto a new ChessGame (so game.moves holds the same history)
+    def to_game(self) -> ChessGame:
+        game = ChessGame()
+        for move in self.moves.tolist():
+            game.make_move(move)
+        return game
+
+    def __repr__(self):
+        return f"ArchivedGame(plies={len(self.moves)}, result={self.result})"
+
+
+# bytes for one game (packed moves as in ChessGame.moves)
+def encode_game(moves, result = RESULT_UNKNOWN) -> bytes:
+
+    moves = np.asarray(moves, dtype="<u2")
+    if len(moves) > 0xFFFF:
+        raise ValueError("too many plies for one game")
+    return len(moves).to_bytes(2, "little") + bytes((result, 0)) + moves.tobytes()
+
+
+# write a whole archive
+#   games: ChessGame objects, move lists, or (moves, result) pairs
+# returns the number of games written
+def write_archive(path, games: Iterable) -> int:
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        return _write_games(f, games)
+
+
+# append games to an existing archive (or start a new one)
+def append_archive(path, games: Iterable) -> int:
+
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return write_archive(path, games)
+
+    with open(path, "ab") as f:
+        return _write_games(f, games)
+
+
+def _write_games(f, games) -> int:
+
+    count = 0
+    for game in games:
+        result = RESULT_UNKNOWN
+        if isinstance(game, tuple):
+            game, result = game
+        moves = game.moves if isinstance(game, ChessGame) else game
+        f.write(encode_game(moves, result))
+        count += 1
+    return count
+
+
+# every game in an archive, lazily, in file order
+# the move arrays are views into the mapping, which stays open for as long as any of them is alive
+def read_archive(path) -> Iterator[ArchivedGame]:
+
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a game archive")
+        if os.path.getsize(path) == len(MAGIC):
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    pos = len(MAGIC)
+    end = len(mm)
+    while pos < end:
+        plies = mm[pos] | mm[pos + 1] << 8
+        result = mm[pos + 2]
+        pos += GAME_HEADER_BYTES
+        yield ArchivedGame(np.frombuffer(mm, dtype="<u2", count=plies, offset=pos), result)
+        pos += plies * 2
+
+
+# convert a PGN file, games with an illegal move are stored up to that move
+def archive_pgn(pgn_path, path) -> int:
+
+    def games():
+        for pgn in read_pgn(pgn_path):
+            game = ChessGame()
+            for ply, move in enumerate(pgn.moves):
+                try:
+                    m = ChessMove.parse_fast(move, ply % 2 == 0)
+                except ValueError:
+                    break
+                if not game.validate_move(m):
+                    break
+            yield game.moves, RESULTS.get(pgn.headers.get("Result", "*"), RESULT_UNKNOWN)
+
+    return write_archive(path, games())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="convert a PGN file to a binary game archive")
+    parser.add_argument("pgn")
+    parser.add_argument("archive")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = archive_pgn(args.pgn, args.archive)
+    elapsed = time.perf_counter() - start
+    print(f"{count} games written in {elapsed:.2f}s")
+    print(f"{os.path.getsize(args.pgn)} bytes of PGN -> {os.path.getsize(args.archive)} bytes archived")
+
+    start = time.perf_counter()
+    plies = sum(len(game.moves) for game in read_archive(args.archive))
+    print(f"read back {plies} plies in {time.perf_counter() - start:.3f}s")
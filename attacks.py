@@ -0,0 +1,167 @@
+
+# Precomputed attack tables shared by the validators and the move generator
+
+# SQUARES:
+#   squares are indexed 0-63 as rank_idx * 8 + file_idx (a1 -> 0, h1 -> 7, a8 -> 56, h8 -> 63)
+#   a bitboard is an int where bit i is set if square i is in the set
+#   tables are plain lists indexed by square, built once when the module loads
+
+
+# build a table for a piece that jumps by fixed (file, rank) offsets
+# for each square, OR together every offset that stays on the board
+def _leaper_table(offsets):
+
+    table = []
+    for sq in range(64):
+        f = sq % 8
+        r = sq // 8
+
+        mask = 0
+        for df, dr in offsets:
+            if 0 <= f + df <= 7 and 0 <= r + dr <= 7:
+                mask |= 1 << ((r + dr) * 8 + f + df)
+        table.append(mask)
+
+    return table
+
+
+# (file, rank) offsets
+KNIGHT_OFFSETS = (
+    (2, 1), (1, 2),
+    (-2, 1), (-1, 2),
+    (2, -1), (1, -2),
+    (-2, -1), (-1, -2),
+)
+KING_OFFSETS = (
+    (-1, -1), (0, -1), (1, -1),
+    (-1, 0), (1, 0),
+    (-1, 1), (0, 1), (1, 1),
+)
+
+# knight and king moves are symmetric, so the table also answers
+# "which squares could a knight/king have come from to reach this square"
+KNIGHT_ATTACKS = _leaper_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _leaper_table(KING_OFFSETS)
+
+# pawns only attack diagonally forward, so white and black need their own tables
+# index by color first (False/0 -> black, True/1 -> white) then square
+# reversed, PAWN_ATTACKS[not is_white][sq] gives the squares a pawn of color is_white attacks sq from
+PAWN_ATTACKS = [
+    _leaper_table(((-1, -1), (1, -1))),
+    _leaper_table(((-1, 1), (1, 1))),
+]
+
+
+# SLIDING PIECES:
+#   a rook/bishop attack set depends on which squares along its rays are occupied
+#   only the squares strictly inside each ray matter (the edge square is attacked either way),
+#   so for every square we keep a "relevant" mask and a table from (occupied & mask) -> attacks
+#   this is the magic bitboard layout, except python's dict hash stands in for the magic multiply
+#   (multiplying 64 bit ints in python costs more than the dict lookup it would replace)
+
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+# walk each ray out from the square, stopping at (and including) the first blocker
+def _slide(sq, occupied, directions):
+
+    attacks = 0
+    for df, dr in directions:
+        f = sq % 8 + df
+        r = sq // 8 + dr
+        while 0 <= f <= 7 and 0 <= r <= 7:
+            bit = 1 << (r * 8 + f)
+            attacks |= bit
+            if occupied & bit:
+                break
+            f += df
+            r += dr
+
+    return attacks
+
+
+# squares along the rays that can block, leaving off the last square of each ray
+def _relevant_mask(sq, directions):
+
+    mask = 0
+    for df, dr in directions:
+        f = sq % 8 + df
+        r = sq // 8 + dr
+        while 0 <= f + df <= 7 and 0 <= r + dr <= 7:
+            mask |= 1 << (r * 8 + f)
+            f += df
+            r += dr
+
+    return mask
+
+
+# build the per square masks and occupancy -> attacks tables for one kind of slider
+# enumerates every subset of the relevant mask with the carry-rippler trick
+def _slider_tables(directions):
+
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = _relevant_mask(sq, directions)
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _slide(sq, subset, directions)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+
+    return masks, tables
+
+
+ROOK_MASKS, ROOK_TABLES = _slider_tables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _slider_tables(BISHOP_DIRECTIONS)
+
+
+# attack sets for a slider on sq given the full occupancy bitboard
+# like the leapers these are symmetric: rook_attacks(sq, occ) & rooks finds the rooks that see sq
+def rook_attacks(sq, occupied):
+    return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+
+def bishop_attacks(sq, occupied):
+    return BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+def queen_attacks(sq, occupied):
+    return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] | BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+
+# every square on a file / rank, handy for narrowing down ambiguous moves (Nbd2, R1a3)
+FILE_MASKS = [0x0101010101010101 << f for f in range(8)]
+RANK_MASKS = [0xFF << (8 * r) for r in range(8)]
+
+
+# LINES:
+#   BETWEEN[a][b]: squares strictly between a and b if they share a rank, file or diagonal (else 0)
+#   LINE[a][b]: the whole rank/file/diagonal through a and b, edge to edge (else 0)
+#   used for check blocking (put something between king and checker) and pins (stay on the pin line)
+def _line_tables():
+
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+
+    for a in range(64):
+        for df, dr in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            full = _slide(a, 0, ((df, dr), (-df, -dr))) | (1 << a)
+            passed = 0
+            f = a % 8 + df
+            r = a // 8 + dr
+            while 0 <= f <= 7 and 0 <= r <= 7:
+                b = r * 8 + f
+                between[a][b] = passed
+                line[a][b] = full
+                passed |= 1 << b
+                f += df
+                r += dr
+
+    return between, line
+
+
+BETWEEN, LINE = _line_tables()
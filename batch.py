@@ -0,0 +1,195 @@
+
+# Batch helpers for working with lots of moves at once
+# instead of one ChessMove object per move, moves are stored column by column in a numpy structured array
+
+# MOVE ARRAY COLUMNS:
+#   same fields ChessMove parses, just stored as small numbers
+#   piece is the (white) board value: pawn 1, knight 2, bishop 3, rook 4, queen 5, king 6
+#       castles store 6 since the king is the piece that moves
+#   starting_file_idx / starting_rank_idx are -1 when the notation doesn't give them (None in ChessMove)
+#   is_king_side is only meaningful when is_castle is set
+#   promotion is the piece value a pawn promotes to, 0 if not a promotion
+
+
+import numpy as np
+from functools import lru_cache
+
+from chess_game import ChessMove, split_move_number
+
+
+MOVE_DTYPE = np.dtype([
+    ("number", np.int32),
+    ("is_white", np.bool_),
+    ("piece", np.int8),
+    ("file_idx", np.int8),
+    ("rank_idx", np.int8),
+    ("is_capture", np.bool_),
+    ("is_pawn_capture", np.bool_),
+    ("is_ambiguous", np.bool_),
+    ("starting_file_idx", np.int8),
+    ("starting_rank_idx", np.int8),
+    ("is_castle", np.bool_),
+    ("is_king_side", np.bool_),
+    ("is_check", np.bool_),
+    ("is_mate", np.bool_),
+    ("promotion", np.int8),
+])
+
+# notation letter -> piece value
+PIECE_CODES = {"": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+
+
+# one row of the move array minus the move number, cached on the SAN part + color the same way parse_fast is
+@lru_cache(maxsize=8192)
+def _move_row(san: str, is_white: bool) -> tuple:
+
+    m = ChessMove.parse_san(san, is_white)
+    return (
+        is_white,
+        6 if m.is_castle else PIECE_CODES[m.piece],
+        m.file_idx,
+        m.rank_idx,
+        m.is_capture,
+        m.is_pawn_capture,
+        m.is_ambiguous,
+        -1 if m.starting_file_idx is None else m.starting_file_idx,
+        -1 if m.starting_rank_idx is None else m.starting_rank_idx,
+        m.is_castle,
+        bool(m.is_king_side),
+        m.is_check,
+        m.is_mate,
+        0 if m.promotion is None else PIECE_CODES[m.promotion],
+    )
+
+
+# parse a whole game (or any list of consecutive moves) into one structured array
+# colors alternate starting from first_is_white, just like the move list of a game
+#   i.e. ["1.e4", "1.e5", "2.Nf3"] -> white, black, white
+def parse_moves(moves, first_is_white: bool = True) -> np.ndarray:
+
+    rows = []
+    for i, move in enumerate(moves):
+        number, san = split_move_number(move)
+        rows.append((number,) + _move_row(san, (i % 2 == 0) == first_is_white))
+    return np.array(rows, dtype=MOVE_DTYPE)
+
+
+# BATCH VALIDATION:
+#   the same piece checks ChessGame.validate_*_move runs, done with array ops over N boards at once
+#   boards: (N, 8, 8) array laid out like ChessGame.board, moves: N rows of MOVE_DTYPE (one per board)
+#   a bare board has no castling rights, en passant square or move history, so:
+#       castles only check that king and rook are home with nothing between them
+#       pawn captures need an enemy piece on the target square
+#   like the validators this doesn't look at check, ChessGame.validate_check covers that per game
+
+KNIGHT_STEPS = ((2, 1), (1, 2), (-2, 1), (-1, 2), (2, -1), (1, -2), (-2, -1), (-1, -2))
+KING_STEPS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+DIAGONAL_STEPS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+STRAIGHT_STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+# values on (file, rank) for each board, 0 where the square is off the board
+def _gather(boards, idx, files, ranks):
+
+    on_board = (files >= 0) & (files <= 7) & (ranks >= 0) & (ranks <= 7)
+    values = boards[idx, np.clip(ranks, 0, 7), np.clip(files, 0, 7)]
+    return np.where(on_board, values, 0), on_board
+
+
+# validity of each (board, move) pair as a boolean array
+def validate_moves(boards, moves) -> np.ndarray:
+
+    boards = np.asarray(boards).astype(np.int16, copy=False)
+    n = len(moves)
+    if boards.shape != (n, 8, 8):
+        raise ValueError(f"expected boards of shape ({n}, 8, 8), got {boards.shape}")
+
+    idx = np.arange(n)
+    f = moves["file_idx"].astype(np.int16)
+    r = moves["rank_idx"].astype(np.int16)
+    piece = moves["piece"].astype(np.int16)
+    sign = np.where(moves["is_white"], 1, -1).astype(np.int16)
+    mover = piece * sign
+    is_castle = moves["is_castle"]
+
+    # what's on the target square decides between moving and capturing
+    target = boards[idx, r, f]
+    square_ok = np.where(moves["is_capture"], target * sign < 0, target == 0)
+
+    found = np.zeros(n, dtype=bool)
+
+    # file/rank the notation gives for the moving piece (Nbd7, R1e2), -1 when it doesn't
+    start_files = moves["starting_file_idx"].astype(np.int16)
+    start_ranks = moves["starting_rank_idx"].astype(np.int16)
+
+    # whether a piece on (file, rank) fits that disambiguation, same as ChessGame._candidates
+    def fits(sel, files, ranks):
+        sf, sr = start_files[sel], start_ranks[sel]
+        return ((sf < 0) | (sf == files)) & ((sr < 0) | (sr == ranks))
+
+    # PAWNS
+    sel = np.nonzero((piece == 1) & ~is_castle)[0]
+    if len(sel):
+        fs, rs, ss, ms = f[sel], r[sel], sign[sel], moves[sel]
+
+        # pushes: one square back, or two from the double push rank with the square between empty
+        one_back, _ = _gather(boards, sel, fs, rs - ss)
+        two_back, _ = _gather(boards, sel, fs, rs - 2 * ss)
+        double_rank = np.where(ss > 0, 3, 4)
+        pushes = (one_back == ss) | ((rs == double_rank) & (two_back == ss) & (one_back == 0))
+
+        # captures: diagonally behind on the starting file
+        start_file = ms["starting_file_idx"].astype(np.int16)
+        behind, _ = _gather(boards, sel, start_file, rs - ss)
+        captures = (np.abs(start_file - fs) == 1) & (behind == ss)
+
+        found[sel] = np.where(ms["is_pawn_capture"], captures, pushes)
+
+    # KNIGHTS AND KINGS: any matching piece one step away
+    for value, steps in ((2, KNIGHT_STEPS), (6, KING_STEPS)):
+        sel = np.nonzero((piece == value) & ~is_castle)[0]
+        if not len(sel):
+            continue
+        hit = np.zeros(len(sel), dtype=bool)
+        for df, dr in steps:
+            files, ranks = f[sel] + df, r[sel] + dr
+            values, _ = _gather(boards, sel, files, ranks)
+            hit |= (values == mover[sel]) & fits(sel, files, ranks)
+        found[sel] = hit
+
+    # SLIDERS: walk every ray out from the target until something is in the way
+    sel = np.nonzero((piece >= 3) & (piece <= 5))[0]
+    if len(sel):
+        ps = piece[sel]
+        hit = np.zeros(len(sel), dtype=bool)
+        for steps, uses in ((DIAGONAL_STEPS, ps != 4), (STRAIGHT_STEPS, ps != 3)):
+            for df, dr in steps:
+                open_ray = uses.copy()
+                for k in range(1, 8):
+                    files, ranks = f[sel] + k * df, r[sel] + k * dr
+                    values, on_board = _gather(boards, sel, files, ranks)
+                    hit |= open_ray & (values == mover[sel]) & fits(sel, files, ranks)
+                    open_ray &= on_board & (values == 0)
+                    if not open_ray.any():
+                        break
+        found[sel] = hit
+
+    valid = found & square_ok
+
+    # CASTLES: king and rook on their home squares, nothing between
+    sel = np.nonzero(is_castle)[0]
+    if len(sel):
+        ss = sign[sel]
+        home = np.where(ss > 0, 0, 7)
+        king_side = moves["is_king_side"][sel]
+
+        castle_ok = boards[sel, home, 4] == 6 * ss
+        castle_ok &= boards[sel, home, np.where(king_side, 7, 0)] == 4 * ss
+        castle_ok &= np.where(
+            king_side,
+            (boards[sel, home, 5] == 0) & (boards[sel, home, 6] == 0),
+            (boards[sel, home, 1] == 0) & (boards[sel, home, 2] == 0) & (boards[sel, home, 3] == 0),
+        )
+        valid[sel] = castle_ok
+
+    return valid
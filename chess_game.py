@@ -8,6 +8,7 @@
 #   Capture – Add an 'x' between the piece being moved and the square coordinates
 #   Pawn Capture – First use the file the pawn started on: (bxc6) means pawn from b captured on c6
 #   Castle – kingside: (0-0), queenside (0-0-0)
+#   Promotion – append '=' and the new piece to the pawn move (e8=Q, dxe8=N)
 #   Check – append a '+' to the end of the move (Bc6+)
 #   Checkmate – append a '#' to the end of the move
 #   Results – white wins: (1-0), black wins: (0-1), draw: (1/2-1/2)
@@ -33,9 +34,19 @@
 
 import numpy as np
 from pydantic import BaseModel
+from array import array
 import json
+import random
+import re
+from functools import lru_cache
 from typing import List
 
+from attacks import (
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, FILE_MASKS, RANK_MASKS, BETWEEN, LINE,
+    rook_attacks, bishop_attacks, queen_attacks,
+)
+from evaluation import MG_TABLE, EG_TABLE, PHASE_TABLE
+
 # use this for parsing moves into my board format
 class ChessMove(BaseModel):
 
@@ -74,6 +85,9 @@ class ChessMove(BaseModel):
     is_check: bool
     is_mate: bool
 
+    # piece letter a pawn promotes to (None if not a promotion)
+    promotion: str | None
+
     # DO: Create some methods to automatically parse move data based on the chess notation
     # Shouldn't be based on board
     # We need to figure out color based on game context though (should be passed in)
@@ -87,6 +101,7 @@ class ChessMove(BaseModel):
     #   other capture -----> 6.Bxg7
     #   ambiguous capture -> 8.Kdxf5
     #   castle ------------> 5.0-0
+    #   promotion ---------> 30.e8=Q
     #   then check/checkmate just have +/# at the end
 
     def __init__(self, **data):
@@ -108,7 +123,8 @@ class ChessMove(BaseModel):
             "is_castle": False,
             "is_king_side": None,
             "is_check": False,
-            "is_mate": False
+            "is_mate": False,
+            "promotion": None
         })
 
 
@@ -120,6 +136,12 @@ class ChessMove(BaseModel):
 
         # get the actual move text
         move_text = split_move[1]
+
+        # pull off the promotion piece so the rest of the parsing only sees the square
+        if "=" in move_text:
+            promotion_idx = move_text.index("=")
+            data.update({"promotion": move_text[promotion_idx+1]})
+            move_text = move_text[:promotion_idx] + move_text[promotion_idx+2:]
         
 
 
@@ -127,27 +149,19 @@ class ChessMove(BaseModel):
 
         # castle validation (note that castle can still lead to check & mate)
         # handle this first since the notation is so different we can just check directly
-        if move_text == "0-0":
-            data.update({"is_castle": True})
-            data.update({"is_king_side": True})
-            if move_text.endswith("+"):
-                data.update({"is_check": True})
-            if move_text.endswith("#"):
-                data.update({"is_mate": True})
-            return
-        
-        if move_text == "0-0-0" :
+        castle_text = move_text.rstrip("+#")
+        if castle_text == "0-0" or castle_text == "0-0-0":
             data.update({"is_castle": True})
-            data.update({"is_king_side": False})
+            data.update({"is_king_side": castle_text == "0-0"})
             if move_text.endswith("+"):
                 data.update({"is_check": True})
             if move_text.endswith("#"):
                 data.update({"is_mate": True})
+            if data.get("promotion") is not None:
+                raise ValueError(f"could not parse move {move!r}")
+            super().__init__(**data)
             return
 
-                
-        
-
         # look for piece info
         c = move_text[0]
         if c.isupper():
@@ -205,6 +219,10 @@ class ChessMove(BaseModel):
                     "file_idx": ord(move_text[0]) - 97,
                     "rank_idx": int(move_text[1]) - 1
                 })
+                if move_text.endswith("#"):
+                    data.update({"is_mate": True})
+                if move_text.endswith("+"):
+                    data.update({"is_check": True})
             
             # with piece, standard move is Bb4 (len = 3)
             # ambiguous move becomes Bcb4 or B3b4
@@ -237,12 +255,228 @@ class ChessMove(BaseModel):
                         "rank_idx": int(move_text[3]) - 1
                     })
                     if ord((move_text)[1]) < 65:
-                        data.update({"starting_rank": (move_text)[1]})
+                        data.update({"starting_rank": (move_text)[1], "starting_rank_idx": int((move_text)[1])-1})
                     else:
-                        data.update({"starting_file": (move_text)[1]}) 
+                        data.update({"starting_file": (move_text)[1], "starting_file_idx": ord((move_text)[1])-97})
+
+        # only a pawn reaching the last rank promotes, and then it has to say to what
+        last_rank = "8" if data.get("is_white") else "1"
+        if (data.get("promotion") is not None) != (data.get("piece") == "" and data.get("rank") == last_rank):
+            raise ValueError(f"could not parse move {move!r}")
 
         super().__init__(**data)
 
+    # fast path that skips pydantic entirely
+    # returns a FastMove with the same fields (minus the move number), cached on the SAN part + color
+    # so 1.Nf3 and 12.Nf3 are one cache entry, the same few thousand SAN strings make up almost every game
+    # NOTE: cached moves are shared, don't mutate them
+    @classmethod
+    def parse_fast(cls, move: str, is_white: bool) -> "FastMove":
+        return _parse_san(split_move_number(move)[1], is_white)
+
+    # same as parse_fast for a move without its number, i.e. "Nf3"
+    @classmethod
+    def parse_san(cls, san: str, is_white: bool) -> "FastMove":
+        return _parse_san(san, is_white)
+
+
+# lightweight stand-in for ChessMove
+# same attribute names so the validators accept either one
+# the move number isn't kept (it would split the cache per number), see split_move_number
+class FastMove:
+
+    __slots__ = (
+        "is_white", "piece",
+        "file", "rank", "file_idx", "rank_idx",
+        "is_capture", "is_pawn_capture", "is_ambiguous",
+        "starting_file", "starting_file_idx", "starting_rank", "starting_rank_idx",
+        "is_castle", "is_king_side", "is_check", "is_mate",
+        "promotion",
+    )
+
+    def __init__(self, **data):
+        for name in self.__slots__:
+            setattr(self, name, data[name])
+
+    def __repr__(self):
+        return "FastMove(" + " ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__) + ")"
+
+
+# one regex for every kind of SAN move in the notation above (the part after the move number)
+#   group 1: castle (0-0 or 0-0-0)
+#   groups 2-4: piece, starting file, starting rank
+#   group 5: x for captures
+#   groups 6-7: file and rank of the square we move to
+#   group 8: promotion piece
+#   group 9: + or #
+SAN_MOVE_REGEX = re.compile(
+    r"(?:(0-0-0|0-0)|([KQRBN])?([a-h])?([1-8])?(x)?([a-h])([1-8])(?:=([QRBN]))?)([+#])?$"
+)
+
+
+# "12.Nf3" -> (12, "Nf3")
+def split_move_number(move: str):
+
+    number, dot, san = move.partition(".")
+    if not dot or not number.isdecimal() or not number.isascii():
+        raise ValueError(f"could not parse move {move!r}")
+    return int(number), san
+
+
+@lru_cache(maxsize=8192)
+def _parse_san(san: str, is_white: bool) -> FastMove:
+
+    match = SAN_MOVE_REGEX.match(san)
+    if match is None:
+        raise ValueError(f"could not parse move {san!r}")
+    castle, piece, start_file, start_rank, capture, file, rank, promotion, check = match.groups()
+
+    # castles don't have a square, so keep the same defaults as ChessMove
+    if castle is not None:
+        return FastMove(
+            is_white=is_white, piece="",
+            file="a", rank="1", file_idx=0, rank_idx=0,
+            is_capture=False, is_pawn_capture=False, is_ambiguous=False,
+            starting_file=None, starting_file_idx=None, starting_rank=None, starting_rank_idx=None,
+            is_castle=True, is_king_side=(castle == "0-0"),
+            is_check=(check == "+"), is_mate=(check == "#"),
+            promotion=None,
+        )
+
+    piece = piece or ""
+    is_capture = capture is not None
+
+    # same grammar as ChessMove: a pawn capture names its file and nothing else, a pawn push names nothing,
+    # and a piece names at most one of file or rank
+    if piece == "":
+        if start_rank is not None or (start_file is None) == is_capture:
+            raise ValueError(f"could not parse move {san!r}")
+    elif start_file is not None and start_rank is not None:
+        raise ValueError(f"could not parse move {san!r}")
+
+    # only a pawn reaching the last rank promotes, and then it has to say to what
+    if (promotion is not None) != (piece == "" and rank == ("8" if is_white else "1")):
+        raise ValueError(f"could not parse move {san!r}")
+
+    # pawn captures always give the starting file, other pieces only when ambiguous
+    is_pawn_capture = is_capture and piece == ""
+    is_ambiguous = piece != "" and (start_file is not None or start_rank is not None)
+
+    return FastMove(
+        is_white=is_white, piece=piece,
+        file=file, rank=rank, file_idx=ord(file) - 97, rank_idx=int(rank) - 1,
+        is_capture=is_capture, is_pawn_capture=is_pawn_capture, is_ambiguous=is_ambiguous,
+        starting_file=start_file,
+        starting_file_idx=None if start_file is None else ord(start_file) - 97,
+        starting_rank=start_rank,
+        starting_rank_idx=None if start_rank is None else int(start_rank) - 1,
+        is_castle=False, is_king_side=None,
+        is_check=(check == "+"), is_mate=(check == "#"),
+        promotion=promotion,
+    )
+
+
+
+# INTERNAL MOVES:
+#   once a move has been matched against the board it gets packed into a 16 bit int
+#   bits 0-5: from square, bits 6-11: to square, bits 12-15: flag
+#   squares are rank_idx * 8 + file_idx (same as the bitboards)
+#   flags:
+#     0 quiet, 1 double pawn push, 2 king side castle, 3 queen side castle
+#     4 capture, 5 en passant capture
+#     8-11 promotion to knight/bishop/rook/queen, 12-15 the same promotions with a capture
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8
+
+# low 2 bits of a promotion flag <-> piece
+PROMOTION_PIECES = (2, 3, 4, 5)
+PROMOTION_CODES = {"N": 0, "B": 1, "R": 2, "Q": 3}
+
+# notation letter -> (white) piece value
+PIECE_VALUES = {"": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+
+# squares whose king/rook moving (or being captured) loses a castling right
+WHITE_KING_SIDE = (1 << 4) | (1 << 7)
+WHITE_QUEEN_SIDE = (1 << 4) | (1 << 0)
+BLACK_KING_SIDE = (1 << 60) | (1 << 63)
+BLACK_QUEEN_SIDE = (1 << 60) | (1 << 56)
+CASTLING_SQUARES = WHITE_KING_SIDE | WHITE_QUEEN_SIDE | BLACK_KING_SIDE | BLACK_QUEEN_SIDE
+
+
+def encode_move(from_sq, to_sq, flag = QUIET) -> int:
+    return from_sq | (to_sq << 6) | (flag << 12)
+
+# readable from/to form of a packed move, i.e. e2e4 or e7e8q
+def move_to_uci(move: int) -> str:
+
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    flag = move >> 12
+
+    text = "abcdefgh"[from_sq & 7] + str((from_sq >> 3) + 1) + "abcdefgh"[to_sq & 7] + str((to_sq >> 3) + 1)
+    if flag & PROMOTION:
+        text += "nbrq"[flag & 3]
+    return text
+
+# ZOBRIST HASHING:
+#   every (piece, square), the side to move, each castling rights combo and each en passant file
+#   gets a random 64 bit number, and a position's hash is the XOR of the ones that apply
+#   XOR undoes itself, so moving a piece is just two XORs instead of rehashing the board
+#   seeded so hashes are the same in every process (and on disk)
+_zobrist_rng = random.Random(20240611)
+
+# index by piece value + 6 then square (row 6 is the empty square and stays 0)
+ZOBRIST_PIECES = [
+    [0] * 64 if p == 6 else [_zobrist_rng.getrandbits(64) for _ in range(64)]
+    for p in range(13)
+]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(64)
+
+# index by castling rights as 4 bits (white k = 1, white q = 2, black k = 4, black q = 8)
+ZOBRIST_CASTLING = [0] + [_zobrist_rng.getrandbits(64) for _ in range(15)]
+
+# index by the file of the en passant square
+ZOBRIST_EN_PASSANT = [_zobrist_rng.getrandbits(64) for _ in range(8)]
+
+
+# FEN:
+#   pieces rank 8 -> rank 1, side to move, castling rights, en passant square, halfmove clock, fullmove number
+#   i.e. "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+FEN_PIECES = {
+    "P": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6,
+    "p": -1, "n": -2, "b": -3, "r": -4, "q": -5, "k": -6,
+}
+FEN_LETTERS = {value: letter for letter, value in FEN_PIECES.items()}
+
+
+# UNDO RECORDS:
+#   everything make_move can't work backwards from, packed into one 64 bit int per move
+#   bits 0-3: captured piece + 6, 4-7: castling rights, 8-14: en passant square (NO_EN_PASSANT for none),
+#   15: white to move, 16 and up: halfmove clock
+#   the move itself and the hash before it are kept in ChessGame.moves / ChessGame.hashes
+#   so a ply of history is 18 bytes instead of a tuple of python ints (~180 bytes)
+NO_EN_PASSANT = 64
+
+
+# int8 is plenty for values -6..6 and 8x smaller than numpy's default int64
+START_BOARD = np.array([
+    [4, 2, 3, 5, 6, 3, 2, 4],
+    [1, 1, 1, 1, 1, 1, 1, 1],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [-1, -1, -1, -1, -1, -1, -1, -1],
+    [-4, -2, -3, -5, -6, -3, -2, -4]
+], dtype=np.int8)
+
 
 
 
@@ -250,78 +484,454 @@ class ChessMove(BaseModel):
 
 class ChessGame:
 
+    # fixed attributes, no per game __dict__ (a server keeps a lot of these around)
+    __slots__ = (
+        "board", "moves", "hashes", "undo_stack", "white_to_move", "halfmove_clock", "fullmove_number",
+        "en_passant", "white_can_castle_k", "white_can_castle_q", "black_can_castle_k", "black_can_castle_q",
+        "bitboards", "occupancy", "occupied", "hash", "mg_score", "eg_score", "phase",
+    )
+
     # defines a numpy board with pieces in initial positions (use a number for each piece)
     # initializes an array of chess notation moves for the game
     def __init__(self, board = None):
 
-        # board
+        # board (int8, a board given in any other dtype is converted)
         # index by self.board[rank_idx, file_idx]
-        self.board = np.array([
-            [4, 2, 3, 5, 6, 3, 2, 4],
-            [1, 1, 1, 1, 1, 1, 1, 1],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [-1, -1, -1, -1, -1, -1, -1, -1],
-            [-4, -2, -3, -5, -6, -3, -2, -4]
-        ]) if board is None else board
-
-        # history of move objects
-        self.moves = []
+        self.board = START_BOARD.copy() if board is None else np.asarray(board, dtype=np.int8)
+
+        # history of moves played (packed u16, see encode_move)
+        self.moves = array("H")
+
+        # position history, hashes[i] is the hash of the position before moves[i]
+        self.hashes = array("Q")
+
+        # one packed record per move played (see UNDO RECORDS)
+        self.undo_stack = array("Q")
+
+        # side to move
+        self.white_to_move = True
+
+        # plies since the last capture or pawn move (fifty move rule), and the FEN move number
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+
+        # square a pawn can capture onto en passant (the one it skipped)
+        # None unless the last move was a double push that an enemy pawn can actually capture
+        self.en_passant = None
 
         # kingside and queenside castling rights
         self.white_can_castle_k = True
         self.white_can_castle_q = True
         self.black_can_castle_k = True
         self.black_can_castle_q = True
-        pass
+
+        # bitboards (kept in sync with self.board)
+        # one 64 bit mask per piece, indexed by piece value + 6 (black king -> 0, white king -> 12)
+        # bit i is set when the piece is on square i = rank_idx * 8 + file_idx (a1 -> 0, h8 -> 63)
+        self.bitboards = [0] * 13
+
+        # occupancy masks indexed by color (False/0 -> black, True/1 -> white)
+        self.occupancy = [0, 0]
+        self.occupied = 0
+
+        # zobrist hash of the position, updated on every move (see ZOBRIST_PIECES)
+        self.hash = 0
+
+        # running evaluation sums, updated on every move (see evaluation.py)
+        # middlegame and endgame score from white's point of view, and the phase they're blended by
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        self.sync_bitboards()
+
+    # rebuild every bitboard (and the hash and evaluation sums) from self.board
+    # only needed if self.board was edited directly instead of through set_square
+    def sync_bitboards(self):
+
+        # one pass over the board as plain ints (much cheaper than indexing the array square by square)
+        self.bitboards = [0] * 13
+        for sq, value in enumerate(self.board.ravel().tolist()):
+            if value:
+                self.bitboards[value + 6] |= 1 << sq
+
+        self.occupancy = [0, 0]
+        for p in range(1, 7):
+            self.occupancy[1] |= self.bitboards[p + 6]
+            self.occupancy[0] |= self.bitboards[-p + 6]
+        self.occupied = self.occupancy[0] | self.occupancy[1]
+
+        self.sync_hash()
+        self.sync_eval()
+
+    # recompute the hash from scratch
+    # needed after setting white_to_move, en_passant or the castling flags by hand
+    def sync_hash(self):
+        self.hash = self.compute_hash()
+
+    # full zobrist hash of the current position (make_move keeps self.hash equal to this incrementally)
+    def compute_hash(self) -> int:
+
+        h = 0
+        for p in range(13):
+            remaining = self.bitboards[p]
+            keys = ZOBRIST_PIECES[p]
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                h ^= keys[bit.bit_length() - 1]
+
+        if not self.white_to_move:
+            h ^= ZOBRIST_BLACK_TO_MOVE
+        h ^= ZOBRIST_CASTLING[self.castling_rights()]
+        if self.en_passant is not None:
+            h ^= ZOBRIST_EN_PASSANT[self.en_passant & 7]
+        return h
+
+    # recompute the evaluation sums from scratch (make_move keeps them equal to this incrementally)
+    def sync_eval(self):
+
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        for p in range(13):
+            remaining = self.bitboards[p]
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                sq = bit.bit_length() - 1
+                self.mg_score += MG_TABLE[p][sq]
+                self.eg_score += EG_TABLE[p][sq]
+                self.phase += PHASE_TABLE[p]
+
+    # build a game from a FEN string (board, side to move, castling, en passant and both move counters)
+    @classmethod
+    def from_fen(cls, fen: str) -> "ChessGame":
+
+        fields = fen.split()
+        if len(fields) < 4 or len(fields) > 6:
+            raise ValueError(f"bad FEN: {fen!r}")
+
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError(f"bad FEN: {fen!r}")
+
+        # FEN lists rank 8 first, the board wants rank 1 first
+        squares = []
+        for row in reversed(rows):
+            start = len(squares)
+            for c in row:
+                if c in FEN_PIECES:
+                    squares.append(FEN_PIECES[c])
+                elif c in "12345678":
+                    squares.extend([0] * int(c))
+                else:
+                    raise ValueError(f"bad FEN: {fen!r}")
+            if len(squares) - start != 8:
+                raise ValueError(f"bad FEN: {fen!r}")
+
+        game = cls(np.array(squares, dtype=np.int8).reshape(8, 8))
+
+        if fields[1] not in ("w", "b"):
+            raise ValueError(f"bad FEN: {fen!r}")
+        game.white_to_move = fields[1] == "w"
+
+        castling = fields[2]
+        if castling != "-" and (not castling or set(castling) - set("KQkq")):
+            raise ValueError(f"bad FEN: {fen!r}")
+        game.white_can_castle_k = "K" in castling
+        game.white_can_castle_q = "Q" in castling
+        game.black_can_castle_k = "k" in castling
+        game.black_can_castle_q = "q" in castling
+
+        # the square has to be one an enemy pawn just skipped: rank 6 with white to move (rank 3 with black),
+        # the pawn in front of it, and both the square and the pawn's start square empty
+        # only kept when a pawn can actually take (same as make_move)
+        game.en_passant = None
+        if fields[3] != "-":
+            match = re.fullmatch(r"([a-h])([36])", fields[3])
+            if not match or match.group(2) != ("6" if game.white_to_move else "3"):
+                raise ValueError(f"bad FEN: {fen!r}")
+            sq = (int(match.group(2)) - 1) * 8 + ord(match.group(1)) - ord("a")
+            sign = 1 if game.white_to_move else -1
+            if not game.pieces(-sign) & (1 << (sq - 8 * sign)) or game.occupied & ((1 << sq) | (1 << (sq + 8 * sign))):
+                raise ValueError(f"bad FEN: {fen!r}")
+            if PAWN_ATTACKS[not game.white_to_move][sq] & game.pieces(sign):
+                game.en_passant = sq
+
+        try:
+            game.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            game.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"bad FEN: {fen!r}")
+        if game.halfmove_clock < 0 or game.fullmove_number < 1:
+            raise ValueError(f"bad FEN: {fen!r}")
+
+        game.sync_hash()
+        return game
+
+    # the position as a FEN string
+    # the en passant square is only written when a pawn can actually take
+    def to_fen(self) -> str:
+
+        rows = []
+        for row in reversed(self.board.tolist()):
+            text = ""
+            empty = 0
+            for value in row:
+                if value == 0:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += FEN_LETTERS[value]
+            if empty:
+                text += str(empty)
+            rows.append(text)
+
+        castling = (
+            ("K" if self.white_can_castle_k else "")
+            + ("Q" if self.white_can_castle_q else "")
+            + ("k" if self.black_can_castle_k else "")
+            + ("q" if self.black_can_castle_q else "")
+        ) or "-"
+
+        if self.en_passant is None:
+            en_passant = "-"
+        else:
+            en_passant = "abcdefgh"[self.en_passant & 7] + str((self.en_passant >> 3) + 1)
+
+        side = "w" if self.white_to_move else "b"
+        return f"{'/'.join(rows)} {side} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+
+    # castling flags packed into 4 bits (white k = 1, white q = 2, black k = 4, black q = 8)
+    def castling_rights(self) -> int:
+        return (
+            self.white_can_castle_k
+            | self.white_can_castle_q << 1
+            | self.black_can_castle_k << 2
+            | self.black_can_castle_q << 3
+        )
+
+    # independent copy of the game (board, bitboards and all the game state)
+    def copy(self) -> "ChessGame":
+
+        game = ChessGame.__new__(ChessGame)
+        for name in ChessGame.__slots__:
+            setattr(game, name, getattr(self, name))
+        game.board = self.board.copy()
+        game.bitboards = list(self.bitboards)
+        game.occupancy = list(self.occupancy)
+        game.moves = self.moves[:]
+        game.hashes = self.hashes[:]
+        game.undo_stack = self.undo_stack[:]
+        return game
+
+    # bitboard of every square holding the given piece value (i.e. -2 -> black knights)
+    def pieces(self, piece):
+        return self.bitboards[piece + 6]
 
     # take in square coords and output value at that square
     def get_square(self, file_idx, rank_idx):
         return self.board[rank_idx, file_idx]
+
+    # write a value to a square, keeping the bitboards in sync
+    def set_square(self, file_idx, rank_idx, value):
+        self._set(rank_idx * 8 + file_idx, value)
+
+    # same as set_square but takes the square index
+    def _set(self, sq, value):
+
+        bit = 1 << sq
+        rank_idx = sq >> 3
+        file_idx = sq & 7
+
+        # clear out whatever was on the square
+        old = int(self.board[rank_idx, file_idx])
+        if old != 0:
+            self.bitboards[old + 6] ^= bit
+            self.occupancy[old > 0] ^= bit
+            self.occupied ^= bit
+            self.hash ^= ZOBRIST_PIECES[old + 6][sq]
+            self.mg_score -= MG_TABLE[old + 6][sq]
+            self.eg_score -= EG_TABLE[old + 6][sq]
+            self.phase -= PHASE_TABLE[old + 6]
+
+        # then place the new piece
+        self.board[rank_idx, file_idx] = value
+        if value != 0:
+            self.bitboards[value + 6] |= bit
+            self.occupancy[value > 0] |= bit
+            self.occupied |= bit
+            self.hash ^= ZOBRIST_PIECES[value + 6][sq]
+            self.mg_score += MG_TABLE[value + 6][sq]
+            self.eg_score += EG_TABLE[value + 6][sq]
+            self.phase += PHASE_TABLE[value + 6]
     
     # check if some square is on the board
     def on_board(self, file_idx, rank_idx):
         return (file_idx >= 0 and file_idx <= 7 and rank_idx >= 0 and rank_idx <= 7)
     
     # determine if a move puts user into check
-    # accept a mutated board (different from self.board)
+    # takes the packed move (see resolve_move) and decides from the checkers and pins
+    # of the current position, without playing the move on a copy of the board
     # return a boolean (True means move is good -> NO CHECK)
-    def validate_check(self, is_white, new_board) -> bool:
+    def validate_check(self, move: int) -> bool:
+
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 12
+
+        is_white = bool(self.board[from_sq >> 3, from_sq & 7] > 0)
+        sign = 1 if is_white else -1
+        king = self.pieces(6 * sign)
+        if not king:
+            return True
+        king_sq = king.bit_length() - 1
+
+        # castles check the king's whole path already
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            return self._can_castle(is_white, flag == KING_CASTLE)
+
+        # the king just can't land on an attacked square (looking through where it stands now)
+        if from_sq == king_sq:
+            return not self._attacked(to_sq, not is_white, self.occupied ^ king, 1 << to_sq)
+
+        # double check -> only the king can move
+        checkers = self.checkers(is_white)
+        if checkers & (checkers - 1):
+            return False
+
+        # en passant moves two pawns at once, just test the resulting position
+        if flag == EN_PASSANT:
+            return self._is_legal(move)
+
+        # single check -> capture the checker or get in the way
+        if checkers:
+            checker_sq = checkers.bit_length() - 1
+            if not ((checkers | BETWEEN[king_sq][checker_sq]) >> to_sq) & 1:
+                return False
+
+        # pinned pieces can only slide along the pin
+        if (self.pinned(is_white) >> from_sq) & 1:
+            return bool((LINE[king_sq][from_sq] >> to_sq) & 1)
+
+        return True
+
+    # enemy pieces giving check to the king of the given color
+    def checkers(self, is_white) -> int:
+
+        sign = 1 if is_white else -1
+        king = self.pieces(6 * sign)
+        if not king:
+            return 0
+        king_sq = king.bit_length() - 1
+        queens = self.pieces(-5 * sign)
+
+        return (
+            (PAWN_ATTACKS[is_white][king_sq] & self.pieces(-sign))
+            | (KNIGHT_ATTACKS[king_sq] & self.pieces(-2 * sign))
+            | (bishop_attacks(king_sq, self.occupied) & (self.pieces(-3 * sign) | queens))
+            | (rook_attacks(king_sq, self.occupied) & (self.pieces(-4 * sign) | queens))
+        )
+
+    # pieces of the given color pinned to their own king
+    # look out from the king as if the board were empty to find enemy sliders on a line with it,
+    # then a piece is pinned if it's the only thing between the two
+    def pinned(self, is_white) -> int:
+
+        sign = 1 if is_white else -1
+        king = self.pieces(6 * sign)
+        if not king:
+            return 0
+        king_sq = king.bit_length() - 1
+        queens = self.pieces(-5 * sign)
+
+        snipers = (
+            (rook_attacks(king_sq, 0) & (self.pieces(-4 * sign) | queens))
+            | (bishop_attacks(king_sq, 0) & (self.pieces(-3 * sign) | queens))
+        )
+
+        pinned = 0
+        own = self.occupancy[is_white]
+        between = BETWEEN[king_sq]
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            blockers = between[bit.bit_length() - 1] & self.occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+        return pinned
+
+    # bitboard of every square the given color attacks
+    # occupied can be swapped out, i.e. with the enemy king removed so it can't hide behind itself
+    def attack_map(self, by_white, occupied = None) -> int:
+
+        if occupied is None:
+            occupied = self.occupied
+        sign = 1 if by_white else -1
+
+        pawns = self.pieces(sign)
+        if by_white:
+            attacks = ((pawns & ~FILE_MASKS[0]) << 7) | ((pawns & ~FILE_MASKS[7]) << 9)
+        else:
+            attacks = ((pawns & ~FILE_MASKS[7]) >> 7) | ((pawns & ~FILE_MASKS[0]) >> 9)
+        attacks &= 0xFFFFFFFFFFFFFFFF
 
-        pass
+        for value, table in ((2, KNIGHT_ATTACKS), (6, KING_ATTACKS)):
+            remaining = self.pieces(value * sign)
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                attacks |= table[bit.bit_length() - 1]
 
+        for value, slider in ((3, bishop_attacks), (4, rook_attacks), (5, queen_attacks)):
+            remaining = self.pieces(value * sign)
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                attacks |= slider(bit.bit_length() - 1, occupied)
+
+        return attacks
 
     # determine if the pawn move is valid  
     # return validity of the pawn move
-    # NOTE -> does not yet consider en passant (we need previous move logic for this )
+    # en passant uses self.en_passant, which make_move sets after every double push
     def validate_pawn_move(self, move: ChessMove) -> bool:
 
 
         # ALGORITHM:
-        # 0. Get the contents of the square that we are moving to 
+        # 0. Get the bit of the square that we are moving to 
         f = move.file_idx
         r = move.rank_idx
-        square = self.get_square(f, r)
+        target = 1 << (r * 8 + f)
+
+        # use color to determine sign (white is pos, black is neg)
+        sign = 1 if move.is_white else -1
+        pawns = self.pieces(sign)
+
         # 1. If the move is NOT a pawn capture, just check if square empty and pawn can move there 
         if not move.is_pawn_capture:
 
             # check if square is empty
-            is_empty = (square == 0)
-            
+            is_empty = not (self.occupied & target)
 
             # white moves in increasing rank idx, black in decreasing
-            # so white needs to start at smaller rank idx, black at larger
-            pawn_exists = False
+            # so white pawns sit one rank (8 bits) below the target, black one rank above
             if move.is_white:
-                # a white pawn can move to the specified square if it's one rank behind
-                # or if it's on the starting rank it can move two ranks given the intermediary rank is empty
-                pawn_exists = (self.get_square(f, r-1) == 1 or (self.get_square(f, 1) == 1 and r == 3 and self.get_square(f, 2) == 0))
+                one_back = target >> 8
+                two_back = target >> 16
+                double_rank = 3
             else:
-                # a black pawn can move to the specified square if it's one rank ahead
-                # or if it's on the starting rank it can move two ranks given the intermediary rank is empty
-                pawn_exists = (self.get_square(f, r+1) == -1 or (self.get_square(f, 6) == -1 and r == 4 and self.get_square(f, 5) == 0))
+                one_back = target << 8
+                two_back = target << 16
+                double_rank = 4
+
+            # a pawn can move to the specified square if it's one rank behind
+            # or if it's on the starting rank it can move two ranks given the intermediary rank is empty
+            pawn_exists = bool(pawns & one_back) or (
+                r == double_rank and bool(pawns & two_back) and not (self.occupied & one_back)
+            )
 
             # returns true if the square is empty and a paawn can go there
             return is_empty and pawn_exists
@@ -329,21 +939,16 @@ class ChessGame:
         # 2. If the move IS a pawn capture, the square should be occupied by a piece of the other color
         #       and there needs to be a pawn that can move diagonally there
         else:
-            # make sure square is occupied
-            is_occupied = False
+            # make sure square is occupied by the opponent (or is the en passant square)
+            is_occupied = bool(self.occupancy[not move.is_white] & target) or self.en_passant == r * 8 + f
 
-            pawn_exists = False
-            if move.is_white:
-                is_occupied = (square < 0)
-                # With pawn captures, the file of the pawn is provided
-                #   and the rank is implied
-                f_start = move.starting_file_idx
-                pawn_exists = (self.get_square(f_start, r-1) == 1)
-
-            else:
-                is_occupied = (square > 0)
-                f_start = move.starting_file_idx
-                pawn_exists = (self.get_square(f_start, r+1) == 1)
+            # With pawn captures, the file of the pawn is provided
+            #   and the rank is implied
+            f_start = move.starting_file_idx
+            r_start = r - sign
+            if abs(f_start - f) != 1 or not self.on_board(f_start, r_start):
+                return False
+            pawn_exists = bool(pawns & (1 << (r_start * 8 + f_start)))
 
             return is_occupied and pawn_exists
         
@@ -351,351 +956,517 @@ class ChessGame:
     # does NOT worry about check status
     def validate_king_move(self, move: ChessMove) -> bool:
 
-        # get contents of square we are moving to
-        f = move.file_idx
-        r = move.rank_idx
-
-        square = self.get_square(f, r)
-
-        # use color to determine sign (white is pos, black is neg)
-        sign = 1 if move.is_white else -1 
-            
-        # check if square is empty
-        is_empty = (square == 0)
-        is_opponent = square < 0 if move.is_white else square>0
-
-        # check that king can move theres
-        # iterate over adjacent squares
-
-        king_exists = False
-
-        # iterate over ranks
-        for i in range(3):
-
-            # iterate over files
-            for j in range(3):
-
-                # get coords of square to check
-                # i -> rank
-                # j -> file
-
-                check_rank = r + i - 2
-                check_file = f + j - 2
+        # the king has to be on one of the squares adjacent to the target
+        return bool(self._candidates(move, 6))
 
-                # make sure square is on board
-                if self.on_board(check_file, check_rank):
-                    if self.get_square(check_file, check_rank) == 6 * sign:
-                        king_exists = True
-        
-        # if capturing, the square shouldn't be empty
-        # otherwise, it should be
-        if move.is_capture:
-            return king_exists and (is_opponent)
-        else:
-            return is_empty and king_exists
-        
 
     # determine if a knight move is valid
     def validate_knight_move(self, move: ChessMove) -> bool:
 
-        # get contents of square we are moving to
-        f = move.file_idx
-        r = move.rank_idx
-
-        square = self.get_square(f, r)
-
-        # use color to determine sign (white is pos, black is neg)
-        sign = 1 if move.is_white else -1 
-            
-        # check if square is empty
-        is_empty = (square == 0)
-        is_opponent = (square < 0) if move.is_white else (square > 0)
-
-        # check that knight can move there
-        # we have to check 8 squares 
-        
-        # (file, rank)
-        movable_squares = [
-            (f+2, r+1), (f+1, r+2),
-            (f-2, r+1), (f-1, r+2),
-            (f+2, r-1), (f+1, r-2),
-            (f-2, r-1), (f-1, r-2),
-        ]
-
-        knight_exists = False
-        for s in movable_squares:
-
-            if not self.on_board(s[0], s[1]):
-                continue
-
-            if self.get_square(s[0], s[1]) == 2*sign:
-                knight_exists = True
+        # any of our knights a knight jump away from the target can make the move
+        return bool(self._candidates(move, 2))
 
-        return (knight_exists and (is_opponent)) if move.is_capture else (knight_exists and is_empty)
-    
 
+    # determine if a bishop move is valid
     def validate_bishop_move(self, move: ChessMove) -> bool:
+        return bool(self._candidates(move, 3))
 
-        # get contents of square we are moving to
-        f = move.file_idx
-        r = move.rank_idx
-
-        square = self.get_square(f, r)
-
-        # use color to determine sign (white is pos, black is neg)
-        sign = 1 if move.is_white else -1 
-            
-        # check if square is empty
-        is_empty = (square == 0)
-        is_opponent = square < 0 if move.is_white else square>0
-  
-
-        # diagonals have slope of 1 and -1
-        # r = f + b and r = -f + c
-
-        # find items on positive diagonal
-        b = r-f
-        positive = []
-        
-        x = 0 if b > 0 else -1*b
-        y = b if b > 0 else 0
-        while y < 8 and x < 8:
-            positive.append((x,y))
-            x+=1
-            y+=1
-
-        # now check if move is valid on pos diagonal
-        bishop_exists_pos = False
-        bishop_square = (0,0) #(f,r)
-        for s in positive:
-            if self.get_square(s[0], s[1]) == sign*3:
-                bishop_exists_pos = True
-                bishop_square = s
-
-        # then check for blockers
-        blocked_pos = False
-        capture_valid_pos = False
-        if bishop_exists_pos:
-
-            # see if we are moving down diagonal
-            if bishop_square[0] < f:
-
-                while bishop_square != (f,r):
-                    bishop_square = (bishop_square[0]+1, bishop_square[1]+1)
-
-                    # if (f,r) == bishop square and (f,r) is not empty, then should be a capture
-                    if bishop_square == (f,r):
-                        capture_valid_pos = True if ((move.is_capture and is_opponent) or ((not move.is_capture) and is_empty) ) else False
-                    
-                    # otherwise, make sure no blockers
-                    else:
-                        p = self.get_square(*bishop_square)
-                        if p != 0:
-                            blocked_pos = True
-            
-            # moving up diagonal
-            else:
-
-                while bishop_square != (f,r):
-                    bishop_square = (bishop_square[0]-1, bishop_square[1]-1)
-
-                    # if (f,r) == bishop square and (f,r) is not empty, then should be a capture
-                    if bishop_square == (f,r):
-                        capture_valid_pos = True if ((move.is_capture and is_opponent) or ((not move.is_capture) and is_empty) ) else False
-                    
-                    # otherwise, make sure no blockers
-                    else:
-                        p = self.get_square(*bishop_square)
-                        if p != 0:
-                            blocked_pos = True
-
-
-
-
-        # find items on negative diagonal
-        c = f+r
-        negative = []
-        x = 0 if c<8 else c-8
-        y = c if c<8 else 7
-        while y >= 0 and x < 8:
-            negative.append((x,y))
-            x+=1
-            y-=1
-        
-        # now check if move is valid on pos diagonal
-        bishop_exists_neg = False
-        bishop_square = (0,0) #(f,r)
-        for s in negative:
-            if self.get_square(s[0], s[1]) == sign*3:
-                bishop_exists_neg = True
-                bishop_square = s
-
-        # then check for blockers
-        blocked_neg = False
-        capture_valid_neg = False
-        if bishop_exists_neg:
-
-            # see if we are moving down diagonal
-            if bishop_square[0] < f:
-
-                while bishop_square != (f,r):
-                    bishop_square = (bishop_square[0]+1, bishop_square[1]-1)
-
-                    # if (f,r) == bishop square and (f,r) is not empty, then should be a capture
-                    if bishop_square == (f,r):
-                        capture_valid_neg = True if ((move.is_capture and is_opponent) or ((not move.is_capture) and is_empty) ) else False
-                    
-                    # otherwise, make sure no blockers
-                    else:
-                        p = self.get_square(*bishop_square)
-                        if p != 0:
-                            blocked_neg = True
-
-            # moving up
-            else:
-
-                while bishop_square != (f,r):
-                    bishop_square = (bishop_square[0]-1, bishop_square[1]+1)
-
-                    # if (f,r) == bishop square and (f,r) is not empty, then should be a capture
-                    if bishop_square == (f,r):
-                        capture_valid_neg = True if ((move.is_capture and is_opponent) or ((not move.is_capture) and is_empty) ) else False
-                    
-                    # otherwise, make sure no blockers
-                    else:
-                        p = self.get_square(*bishop_square)
-                        if p != 0:
-                            blocked_neg = True
-
-        # if either neg or pos works return True
-        return ((not blocked_pos) and capture_valid_pos and bishop_exists_pos) or ((not blocked_neg) and capture_valid_neg and bishop_exists_neg)
-
-
-
-
+    # determine if a rook move is valid
     def validate_rook_move(self, move: ChessMove) -> bool:
+        return bool(self._candidates(move, 4))
+    
+    # determine if a queen move is valid
+    def validate_queen_move(self, move: ChessMove) -> bool:
+        return bool(self._candidates(move, 5))
+
+    # bitboard of the squares a piece of the given color and (white) piece value could move to square from
+    # every set bit is a candidate origin, so callers get the exact piece instead of just "one exists"
+    # pawns count the squares they'd capture from (pushes aren't attacks)
+    # doesn't look at pins, see validate_check
+    def attackers_to(self, square, is_white, piece) -> int:
+
+        pieces = self.pieces(piece if is_white else -piece)
+        if piece == 1:
+            return PAWN_ATTACKS[not is_white][square] & pieces
+        if piece == 2:
+            return KNIGHT_ATTACKS[square] & pieces
+        if piece == 6:
+            return KING_ATTACKS[square] & pieces
+
+        # slider attacks are symmetric, so looking outwards from the target
+        # (stopping at the first blocker on each ray) finds every piece that can reach it unblocked
+        if piece == 3:
+            return bishop_attacks(square, self.occupied) & pieces
+        if piece == 4:
+            return rook_attacks(square, self.occupied) & pieces
+        return queen_attacks(square, self.occupied) & pieces
+
+    # candidate origins for a knight, bishop, rook, queen or king notation move
+    # the target has to hold an enemy piece for a capture and be empty otherwise,
+    # and a file/rank given in the notation (Nbd7, R1e2) narrows the attackers down
+    def _candidates(self, move: ChessMove, piece) -> int:
+
+        sq = move.rank_idx * 8 + move.file_idx
+        target = 1 << sq
 
-        f = move.file_idx
-        r = move.rank_idx
-
-        square = self.get_square(f,r)
-
-        is_empty = (square==0)
-        is_opponent = (square < 0) if move.is_white else (square>0)
-        sign = 1 if move.is_white else -1
-
-        # find rook
-        rook_on_rank = False
-        rook_on_file = False
-        rook_square_file = (0,0)
-        rook_square_rank = (0,0)
-
-        # check file
-        for i in range(8):
-
-            s = self.get_square(f,i)
-            if s == sign*4:
-                rook_on_file = True
-                rook_square_file = (f,i)
-
-
-        # check rank
-        for i in range(8):
+        if move.is_capture:
+            if not self.occupancy[not move.is_white] & target:
+                return 0
+        elif self.occupied & target:
+            return 0
+
+        candidates = self.attackers_to(sq, move.is_white, piece)
+        if move.starting_file_idx is not None:
+            candidates &= FILE_MASKS[move.starting_file_idx]
+        if move.starting_rank_idx is not None:
+            candidates &= RANK_MASKS[move.starting_rank_idx]
+        return candidates
+
+    # check if a square is attacked by any piece of the given color
+    # every piece type is a single table lookup, so this is what check detection builds on
+    def is_attacked(self, file_idx, rank_idx, by_white) -> bool:
+        return self._attacked(rank_idx * 8 + file_idx, by_white, self.occupied)
+
+    # same as is_attacked, but against a made up occupancy (the board after some move)
+    # removed is a bitboard of attackers to ignore, i.e. a piece that move would capture
+    def _attacked(self, sq, by_white, occupied, removed = 0) -> bool:
+
+        sign = 1 if by_white else -1
+        keep = ~removed
+        queens = self.pieces(5 * sign)
+
+        return bool(
+            (PAWN_ATTACKS[not by_white][sq] & self.pieces(sign) & keep)
+            or (KNIGHT_ATTACKS[sq] & self.pieces(2 * sign) & keep)
+            or (KING_ATTACKS[sq] & self.pieces(6 * sign))
+            or (bishop_attacks(sq, occupied) & (self.pieces(3 * sign) | queens) & keep)
+            or (rook_attacks(sq, occupied) & (self.pieces(4 * sign) | queens) & keep)
+        )
 
-            s = self.get_square(i,r)
-            if s == sign*4:
-                rook_on_rank = True
-                rook_square_rank = (i,r)
+    # determine if a castle is valid
+    def validate_castle(self, move: ChessMove) -> bool:
+        return self._can_castle(move.is_white, move.is_king_side)
 
+    # king and rook haven't moved, nothing in between, and the king doesn't castle out of/through/into check
+    def _can_castle(self, is_white, king_side) -> bool:
 
-        # move across file
-        blocked_on_file = False
-        if rook_on_file:
+        sign = 1 if is_white else -1
+        r = 0 if is_white else 7
 
-            # low rank to high
-            if rook_square_file[1] < r:
+        if king_side:
+            has_right = self.white_can_castle_k if is_white else self.black_can_castle_k
+            rook_file = 7
+            empty_files = (5, 6)
+            king_path = (4, 5, 6)
+        else:
+            has_right = self.white_can_castle_q if is_white else self.black_can_castle_q
+            rook_file = 0
+            empty_files = (1, 2, 3)
+            king_path = (4, 3, 2)
+
+        if not has_right:
+            return False
+        if self.get_square(4, r) != 6 * sign or self.get_square(rook_file, r) != 4 * sign:
+            return False
+        for f in empty_files:
+            if self.get_square(f, r) != 0:
+                return False
+        for f in king_path:
+            if self.is_attacked(f, r, not is_white):
+                return False
+
+        return True
+
+    # find the exact square a notation move starts from and pack it into an int move
+    # does everything the validators do on the way, returns None if no piece can make the move
+    def resolve_move(self, move: ChessMove):
+
+        is_white = move.is_white
+        sign = 1 if is_white else -1
+
+        # castles are always the same king move
+        if move.is_castle:
+            if not self._can_castle(is_white, move.is_king_side):
+                return None
+            from_sq = 4 if is_white else 60
+            if move.is_king_side:
+                return encode_move(from_sq, from_sq + 2, KING_CASTLE)
+            return encode_move(from_sq, from_sq - 2, QUEEN_CASTLE)
+
+        to_sq = move.rank_idx * 8 + move.file_idx
+        target = 1 << to_sq
+        flag = CAPTURE if self.occupancy[not is_white] & target else QUIET
+        piece = move.piece
 
-                y = rook_square_file[1]
-                while y < r:
-                    
-                    y+=1
-                    if y < r and self.get_square(f,y) != 0:
-                        blocked_on_file = True
-            
-            # high rank to low
+        # pawns: the starting square is implied by the notation
+        if piece == "":
+            pawns = self.pieces(sign)
+
+            # captures come from the attacker on the file the notation gives, onto an enemy piece or en passant
+            if move.is_pawn_capture:
+                if flag == QUIET:
+                    if to_sq != self.en_passant:
+                        return None
+                    flag = EN_PASSANT
+                candidates = self.attackers_to(to_sq, is_white, 1) & FILE_MASKS[move.starting_file_idx]
+                if not candidates:
+                    return None
+                from_sq = candidates.bit_length() - 1
+
+            # pushes go to an empty square from one rank back, or two from the starting rank
             else:
-
-                y = rook_square_file[1]
-                while y > r:
-                    
-                    y-=1
-                    if y < r and self.get_square(f,y) != 0:
-                        blocked_on_file = True
-
-
-        # move across rank
-        blocked_on_rank = False
-        if rook_on_rank:
-
-                # low rank to high
-            if rook_square_rank[1] < r:
-
-                y = rook_square_rank[1]
-                while y < r:
-                    
-                    y+=1
-                    if y < r and self.get_square(f,y) != 0:
-                        blocked_on_rank = True
-            
-            # high rank to low
+                if self.occupied & target:
+                    return None
+                from_sq = to_sq - 8 * sign
+                if 0 <= from_sq < 64 and not pawns & (1 << from_sq):
+                    if self.occupied & (1 << from_sq) or move.rank_idx != (3 if is_white else 4):
+                        return None
+                    from_sq -= 8 * sign
+                    flag = DOUBLE_PUSH
+                if not 0 <= from_sq < 64 or not pawns & (1 << from_sq):
+                    return None
+
+            # reaching the last rank has to promote (the parsers make sure the notation names the piece)
+            if move.rank_idx == 0 or move.rank_idx == 7:
+                flag |= PROMOTION | PROMOTION_CODES[move.promotion]
+
+            return encode_move(from_sq, to_sq, flag)
+
+        # everything else: every piece of the right kind that reaches the target, narrowed by the notation
+        candidates = self._candidates(move, PIECE_VALUES[piece])
+
+        # notation leaves out the file/rank when the other piece is pinned, so drop pinned ones
+        if candidates & (candidates - 1):
+            remaining = candidates
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                if not self.validate_check(encode_move(bit.bit_length() - 1, to_sq, flag)):
+                    candidates ^= bit
+
+        # nothing can make the move, or the notation doesn't say which of two legal pieces moves (Nd2 with
+        # knights on b1 and f3 has to be Nbd2 or Nfd2)
+        if not candidates or candidates & (candidates - 1):
+            return None
+
+        from_sq = candidates.bit_length() - 1
+        return encode_move(from_sq, to_sq, flag)
+
+    # does a packed move leave our own king safe
+    # works out the occupancy after the move and asks whether the king square is attacked, no board copy
+    # castles aren't handled here since _can_castle already checks the king's path
+    def _is_legal(self, move: int) -> bool:
+
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 12
+
+        piece = int(self.board[from_sq >> 3, from_sq & 7])
+        is_white = piece > 0
+        sign = 1 if is_white else -1
+        to_bit = 1 << to_sq
+
+        # en passant removes a pawn that isn't on the target square
+        captured = to_bit
+        if flag == EN_PASSANT:
+            captured = 1 << (to_sq - 8 * sign)
+
+        occupied = (self.occupied & ~(1 << from_sq) & ~captured) | to_bit
+
+        if piece == 6 * sign:
+            king_sq = to_sq
+        else:
+            king_sq = self.pieces(6 * sign).bit_length() - 1
+            if king_sq < 0:
+                return True
+
+        return not self._attacked(king_sq, not is_white, occupied, captured)
+
+    # every legal move for the side to move, as packed ints (see encode_move)
+    # generates moves straight off the bitboards, then only checks the ones that could possibly expose the king
+    def generate_moves(self) -> list:
+
+        is_white = self.white_to_move
+        sign = 1 if is_white else -1
+        own = self.occupancy[is_white]
+        enemy = self.occupancy[not is_white]
+        occupied = self.occupied
+        empty = ~occupied & 0xFFFFFFFFFFFFFFFF
+
+        moves = []
+        append = moves.append
+
+        # PAWNS
+        pawns = self.pieces(sign)
+        if is_white:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_MASKS[2]) << 8) & empty
+            last_rank = RANK_MASKS[7]
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_MASKS[5]) >> 8) & empty
+            last_rank = RANK_MASKS[0]
+
+        while single:
+            bit = single & -single
+            single ^= bit
+            to_sq = bit.bit_length() - 1
+            from_sq = to_sq - 8 * sign
+            if bit & last_rank:
+                for code in (3, 0, 1, 2):
+                    append(from_sq | (to_sq << 6) | ((PROMOTION | code) << 12))
             else:
-
-                y = rook_square_rank[1]
-                while y > r:
-                    
-                    y-=1
-                    if y < r and self.get_square(f,y) != 0:
-                        blocked_on_rank = True
-
-        return (
-            (rook_on_file and (not blocked_on_file) and ((move.is_capture and is_opponent) or ((not move.is_capture) and is_empty))) 
-            or (rook_on_rank and (not blocked_on_rank) and ((move.is_capture and is_opponent) or ((not move.is_capture) and is_empty)))
+                append(from_sq | (to_sq << 6))
+
+        while double:
+            bit = double & -double
+            double ^= bit
+            to_sq = bit.bit_length() - 1
+            append((to_sq - 16 * sign) | (to_sq << 6) | (DOUBLE_PUSH << 12))
+
+        pawn_attacks = PAWN_ATTACKS[is_white]
+        remaining = pawns
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            from_sq = bit.bit_length() - 1
+            targets = pawn_attacks[from_sq] & enemy
+            while targets:
+                to_bit = targets & -targets
+                targets ^= to_bit
+                to_sq = to_bit.bit_length() - 1
+                if to_bit & last_rank:
+                    for code in (3, 0, 1, 2):
+                        append(from_sq | (to_sq << 6) | ((PROMOTION | CAPTURE | code) << 12))
+                else:
+                    append(from_sq | (to_sq << 6) | (CAPTURE << 12))
+
+        if self.en_passant is not None:
+            attackers = PAWN_ATTACKS[not is_white][self.en_passant] & pawns
+            while attackers:
+                bit = attackers & -attackers
+                attackers ^= bit
+                append((bit.bit_length() - 1) | (self.en_passant << 6) | (EN_PASSANT << 12))
+
+        # KNIGHTS, BISHOPS, ROOKS, QUEENS, KING
+        not_own = ~own
+        for value in (2, 3, 4, 5, 6):
+            remaining = self.pieces(value * sign)
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                from_sq = bit.bit_length() - 1
+
+                if value == 2:
+                    targets = KNIGHT_ATTACKS[from_sq]
+                elif value == 3:
+                    targets = bishop_attacks(from_sq, occupied)
+                elif value == 4:
+                    targets = rook_attacks(from_sq, occupied)
+                elif value == 5:
+                    targets = queen_attacks(from_sq, occupied)
+                else:
+                    targets = KING_ATTACKS[from_sq]
+                targets &= not_own
+
+                while targets:
+                    to_bit = targets & -targets
+                    targets ^= to_bit
+                    flag = CAPTURE if to_bit & enemy else QUIET
+                    append(from_sq | ((to_bit.bit_length() - 1) << 6) | (flag << 12))
+
+        # LEGALITY
+        # decided from the attack map, checkers and pins of this position, nothing gets played
+        #   king moves: target can't be attacked (looking through the king's current square)
+        #   double check: only the king moves
+        #   single check: everything else has to capture the checker or block
+        #   pinned pieces: have to stay on the line through the king
+        #   en passant: can uncover the king along a rank, so it gets tested on its own
+        king = self.pieces(6 * sign)
+        if not king:
+            legal = moves
+        else:
+            king_sq = king.bit_length() - 1
+            danger = self.attack_map(not is_white, occupied ^ king)
+            checkers = self.checkers(is_white)
+            double_check = checkers & (checkers - 1)
+            pinned = self.pinned(is_white)
+            line = LINE[king_sq]
+
+            if checkers:
+                evasions = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+            else:
+                evasions = ~0
+
+            legal = []
+            for m in moves:
+                from_sq = m & 63
+                to_sq = (m >> 6) & 63
+
+                if from_sq == king_sq:
+                    if not (danger >> to_sq) & 1:
+                        legal.append(m)
+                elif double_check:
+                    continue
+                elif (m >> 12) == EN_PASSANT:
+                    if self._is_legal(m):
+                        legal.append(m)
+                elif (evasions >> to_sq) & 1 and (not (pinned >> from_sq) & 1 or (line[from_sq] >> to_sq) & 1):
+                    legal.append(m)
+
+        # castles last (they already check the squares the king passes over)
+        r = 0 if is_white else 56
+        if self._can_castle(is_white, True):
+            legal.append(encode_move(r + 4, r + 6, KING_CASTLE))
+        if self._can_castle(is_white, False):
+            legal.append(encode_move(r + 4, r + 2, QUEEN_CASTLE))
+
+        return legal
+
+    # play a packed move on the board in place (see encode_move)
+    # updates the bitboards, hash, castling rights, en passant square and side to move
+    # and pushes what unmake_move needs onto the undo stack, so nothing gets copied
+    # doesn't check the move at all, validate_move is the way in for notation moves
+    def make_move(self, move: int):
+
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 12
+
+        piece = int(self.board[from_sq >> 3, from_sq & 7])
+        sign = 1 if piece > 0 else -1
+
+        captured = int(self.board[to_sq >> 3, to_sq & 7])
+        en_passant = NO_EN_PASSANT if self.en_passant is None else self.en_passant
+        self.undo_stack.append(
+            captured + 6 | self.castling_rights() << 4 | en_passant << 8
+            | self.white_to_move << 15 | self.halfmove_clock << 16
         )
-    
-    def validate_queen_move(self, move: ChessMove) -> bool:
-        return self.validate_bishop_move(move) or self.validate_rook_move(move)
+        self.hashes.append(self.hash)
+
+        # pawn moves and captures reset the fifty move count, black moving starts a new move number
+        if piece == sign or captured != 0 or flag == EN_PASSANT:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if sign < 0:
+            self.fullmove_number += 1
+
+        # en passant takes the pawn that just moved past the target square
+        if flag == EN_PASSANT:
+            self._set(to_sq - 8 * sign, 0)
+
+        # castles move the rook as well (king goes e -> g or e -> c)
+        elif flag == KING_CASTLE:
+            self._set(to_sq + 1, 0)
+            self._set(to_sq - 1, 4 * sign)
+        elif flag == QUEEN_CASTLE:
+            self._set(to_sq - 2, 0)
+            self._set(to_sq + 1, 4 * sign)
+
+        if flag & PROMOTION:
+            piece = PROMOTION_PIECES[flag & 3] * sign
+
+        self._set(from_sq, 0)
+        self._set(to_sq, piece)
+
+        # anything leaving or landing on a king/rook home square loses that castling right
+        touched = (1 << from_sq) | (1 << to_sq)
+        if touched & CASTLING_SQUARES:
+            rights = self.castling_rights()
+            if touched & WHITE_KING_SIDE:
+                self.white_can_castle_k = False
+            if touched & WHITE_QUEEN_SIDE:
+                self.white_can_castle_q = False
+            if touched & BLACK_KING_SIDE:
+                self.black_can_castle_k = False
+            if touched & BLACK_QUEEN_SIDE:
+                self.black_can_castle_q = False
+            self.hash ^= ZOBRIST_CASTLING[rights] ^ ZOBRIST_CASTLING[self.castling_rights()]
+
+        # swap out the old en passant file for the new one
+        # only kept if an enemy pawn can actually take, so positions that only differ by a dead en passant square hash the same
+        if self.en_passant is not None:
+            self.hash ^= ZOBRIST_EN_PASSANT[self.en_passant & 7]
+            self.en_passant = None
+        if flag == DOUBLE_PUSH:
+            skipped = (from_sq + to_sq) // 2
+            if PAWN_ATTACKS[sign > 0][skipped] & self.pieces(-sign):
+                self.en_passant = skipped
+                self.hash ^= ZOBRIST_EN_PASSANT[skipped & 7]
+
+        # the side to move only flips if the other side actually moved
+        # (validate_move lets either color move, so this isn't always a toggle)
+        if self.white_to_move != (sign < 0):
+            self.white_to_move = sign < 0
+            self.hash ^= ZOBRIST_BLACK_TO_MOVE
+
+        self.moves.append(move)
+
+    # take back the last make_move, restoring the board and all the game state exactly
+    def unmake_move(self):
+
+        undo = self.undo_stack.pop()
+        h = self.hashes.pop()
+        move = self.moves.pop()
+
+        captured = (undo & 15) - 6
+        rights = (undo >> 4) & 15
+        en_passant = (undo >> 8) & 127
+        white_to_move = bool(undo >> 15 & 1)
+        self.halfmove_clock = undo >> 16
+
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 12
+
+        piece = int(self.board[to_sq >> 3, to_sq & 7])
+        sign = 1 if piece > 0 else -1
+        if sign < 0:
+            self.fullmove_number -= 1
+
+        # promotions turn back into a pawn
+        if flag & PROMOTION:
+            piece = sign
+
+        self._set(to_sq, captured)
+        self._set(from_sq, piece)
+
+        # put back the pawn taken en passant, or the rook that castled
+        if flag == EN_PASSANT:
+            self._set(to_sq - 8 * sign, -sign)
+        elif flag == KING_CASTLE:
+            self._set(to_sq - 1, 0)
+            self._set(to_sq + 1, 4 * sign)
+        elif flag == QUEEN_CASTLE:
+            self._set(to_sq + 1, 0)
+            self._set(to_sq - 2, 4 * sign)
+
+        self.white_can_castle_k = bool(rights & 1)
+        self.white_can_castle_q = bool(rights & 2)
+        self.black_can_castle_k = bool(rights & 4)
+        self.black_can_castle_q = bool(rights & 8)
+        self.en_passant = None if en_passant == NO_EN_PASSANT else en_passant
+        self.white_to_move = white_to_move
+        self.hash = h
 
     # checks if a move is valid
     # if returning true, the move has been made
-    # NOTE still must check for en passant, pawn promotion, and castling
     def validate_move(self, move: ChessMove) -> bool:
 
-        # 1. Make sure the move is valid for the given piece/move type
-        piece = move.piece
-
-        valid_move = False
-        if piece == "":
-            valid_move = self.validate_pawn_move(move)
-        elif piece == "N":
-            valid_move = self.validate_knight_move(move)
-        elif piece == "B":
-            valid_move = self.validate_bishop_move(move)
-        elif piece == "R":
-            valid_move = self.validate_rook_move(move)
-        elif piece == "Q":
-            valid_move = self.validate_queen_move(move)
-        elif piece == "K":
-            valid_move = self.validate_king_move(move)
-        else:
-            # handle castling, edge cases, etc here.
-            pass
-
-        # 2. Create a new board with the move made to test for check
-
-        # 3. Make sure the move doesn't place the user into check 
+        # 1. Find the exact move (from square, flags)
+        #    resolve_move runs the same checks as the validate_*_move methods while it looks for the
+        #    piece, so the attackers of the target square only get worked out once
+        resolved = self.resolve_move(move)
+        if resolved is None:
+            return False
 
-        # 4. Make the move (overwrite self.board with new board)
+        # 2. Make sure the move doesn't place the user into check 
+        if not self.validate_check(resolved):
+            return False
 
-        return valid_move
+        # 3. Make the move
+        self.make_move(resolved)
 
+        return True
 
@@ -0,0 +1,215 @@
+
+# Load test for server.py
+# lots of connections, each playing lots of games at once, timing how long every move takes to be acknowledged
+
+# HOW IT WORKS:
+#   two player games replay a scripted game (the Opera Game, or the games in a PGN file) with the client
+#   moving for both sides, one move every think seconds or so (randomized so the games don't move in step)
+#   bot games play random legal moves as white (from/to notation, worked out from the FEN in each update)
+#   and wait for the bot's answer, so the executor is busy while the move latencies are measured
+#   a server answers one connection's commands in order, so replies are matched to commands first in
+#   first out, the ack latency is from writing a move to reading its reply
+#   finished games leave and start over until the duration is up
+
+# USAGE:
+#   python server.py &
+#   python load_test.py --games 2000 --connections 50 --think 1.0 --duration 30
+#   python load_test.py --games 2000 --bot-games 20
+
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+from chess_game import ChessGame, move_to_uci
+from server import DEFAULT_PORT
+
+
+# Morphy vs the Duke and the Count, Paris 1858
+OPERA_GAME = (
+    "e4 e5 Nf3 d6 d4 Bg4 dxe5 Bxf3 Qxf3 dxe5 Bc4 Nf6 Qb3 Qe7 Nc3 c6 Bg5 b5 Nxb5 cxb5 "
+    "Bxb5+ Nbd7 O-O-O Rd8 Rxd7 Rxd7 Rd1 Qe6 Bxd7+ Nxd7 Qb8+ Nxb8 Rd8#"
+).split()
+
+
+# one connection, shared by many games
+class Client:
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        # futures waiting on replies, in the order the commands were sent
+        self.pending = collections.deque()
+        # game id -> queue of update pushes
+        self.updates = {}
+        self.task = asyncio.get_running_loop().create_task(self.read())
+
+    async def read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message["type"] in ("update", "bot_error"):
+                queue = self.updates.get(message["game"])
+                if queue is not None:
+                    queue.put_nowait(message)
+            else:
+                self.pending.popleft().set_result(message)
+
+        for future in self.pending:
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    # send a command, returns its reply
+    async def request(self, command) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(command.encode() + b"\n")
+        return await future
+
+    async def new_game(self, color = None):
+        state = await self.request("new" if color is None else f"new {color}")
+        self.updates[state["game"]] = asyncio.Queue()
+        return state
+
+    async def leave(self, game):
+        await self.request(f"leave {game}")
+        self.updates.pop(game, None)
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+
+class Stats:
+
+    def __init__(self):
+        self.latencies = []
+        self.bot_replies = []
+        self.errors = 0
+        self.games = 0
+
+    def report(self, elapsed):
+
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+        latencies = sorted(self.latencies)
+        print(f"{len(latencies)} moves in {elapsed:.1f}s ({len(latencies) / elapsed:.0f} moves/s), {self.games} games finished, {self.errors} errors")
+        print(
+            f"ack latency: p50 {percentile(latencies, 0.5):.2f}ms  p90 {percentile(latencies, 0.9):.2f}ms  "
+            f"p99 {percentile(latencies, 0.99):.2f}ms  max {percentile(latencies, 1.0):.2f}ms"
+        )
+        if self.bot_replies:
+            replies = sorted(self.bot_replies)
+            print(f"bot replies: {len(replies)}, p50 {percentile(replies, 0.5):.0f}ms  p99 {percentile(replies, 0.99):.0f}ms")
+
+
+async def timed_move(client, stats, game, move) -> dict:
+    start = time.perf_counter()
+    reply = await client.request(f"move {game} {move}")
+    stats.latencies.append(time.perf_counter() - start)
+    if reply["type"] != "ack":
+        stats.errors += 1
+    return reply
+
+
+# replay scripted games as both players until the deadline
+async def play_scripted(client, stats, scripts, think, deadline):
+
+    await asyncio.sleep(random.uniform(0, think))
+    while time.perf_counter() < deadline:
+        game = (await client.new_game())["game"]
+        for move in random.choice(scripts):
+            await asyncio.sleep(random.uniform(0.5, 1.5) * think)
+            if time.perf_counter() >= deadline:
+                break
+            if (await timed_move(client, stats, game, move))["type"] != "ack":
+                break
+        else:
+            stats.games += 1
+        await client.leave(game)
+
+
+# random moves against the bot until the deadline
+async def play_bot(client, stats, think, deadline):
+
+    await asyncio.sleep(random.uniform(0, think))
+    while time.perf_counter() < deadline:
+        state = await client.new_game("white")
+        game = state["game"]
+        updates = client.updates[game]
+
+        while time.perf_counter() < deadline and state["status"] == "active":
+            moves = ChessGame.from_fen(state["fen"]).generate_moves()
+            await asyncio.sleep(random.uniform(0.5, 1.5) * think)
+            reply = await timed_move(client, stats, game, move_to_uci(random.choice(moves)))
+            if reply["type"] != "ack":
+                break
+
+            # skip the update for our own move, wait for the bot's
+            start = time.perf_counter()
+            while True:
+                state = await updates.get()
+                if state["type"] != "update" or state["ply"] > reply["ply"] or state["status"] != "active":
+                    break
+            if state["type"] != "update":
+                stats.errors += 1
+                break
+            if state["ply"] > reply["ply"]:
+                stats.bot_replies.append(time.perf_counter() - start)
+
+        if state["status"] != "active":
+            stats.games += 1
+        await client.leave(game)
+
+
+async def run(host, port, connections, games, bot_games, think, duration, scripts) -> Stats:
+
+    clients = []
+    for _ in range(connections):
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+        clients.append(Client(reader, writer))
+
+    stats = Stats()
+    deadline = time.perf_counter() + duration
+    players = []
+    for i in range(games):
+        client = clients[i % connections]
+        if i < bot_games:
+            players.append(play_bot(client, stats, think, deadline))
+        else:
+            players.append(play_scripted(client, stats, scripts, think, deadline))
+
+    start = time.perf_counter()
+    await asyncio.gather(*players)
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        await client.close()
+    stats.report(elapsed)
+    return stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="load test a running chess game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--games", type=int, default=2000, help="games played at once, spread over the connections")
+    parser.add_argument("--bot-games", type=int, default=0, help="how many of the games are against the bot")
+    parser.add_argument("--think", type=float, default=1.0, help="average seconds between a game's moves")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--pgn", default=None, help="replay the games in a PGN file instead of the Opera Game")
+    args = parser.parse_args()
+
+    scripts = [OPERA_GAME]
+    if args.pgn:
+        from pgn_reader import read_pgn
+        scripts = [[m.split(".", 1)[1] for m in game.moves] for game in read_pgn(args.pgn)]
+
+    asyncio.run(run(args.host, args.port, args.connections, args.games, args.bot_games, args.think, args.duration, scripts))
@@ -0,0 +1,165 @@
+
+# Opening book
+# on disk table of (position hash -> move, weight), read straight out of a memory mapped file
+
+# FILE FORMAT:
+#   fixed width little endian records, sorted by key (ties: highest weight first)
+#       key:    u64, zobrist hash of the position before the move (ChessGame.hash)
+#       move:   u16, packed move (see encode_move)
+#       weight: u16, how often the move was played (scaled down to fit if needed)
+#   12 bytes a record, stored column by column (every key, then every move, then every weight)
+#   so the keys are one contiguous array that can be binary searched in place
+#   no header, the record count is just the file size / 12
+
+# HOW IT WORKS:
+#   opening a book maps the file and does nothing else, so there's no load step in any process
+#   a lookup is a binary search (np.searchsorted) over the mapped keys, which only touches the
+#   handful of pages on the search path, the OS page cache shares them between every process
+#   the builder replays games through ChessGame and counts (position, move) pairs over the first plies
+
+# USAGE:
+#   python opening_book.py games.pgn book.bin --plies 20 --min-count 2
+
+
+import argparse
+import mmap
+import os
+import random
+import time
+from collections import Counter
+from typing import Iterable
+
+import numpy as np
+
+from chess_game import ChessGame, ChessMove, move_to_uci
+from pgn_reader import read_pgn
+
+
+# key + move + weight
+RECORD_BYTES = 8 + 2 + 2
+
+
+class OpeningBook:
+
+    def __init__(self, path):
+
+        self.path = path
+        count = os.path.getsize(path) // RECORD_BYTES
+
+        # mmap can't map an empty file, an empty book is just no records
+        if count == 0:
+            self.keys = np.zeros(0, dtype="<u8")
+            self.moves = np.zeros(0, dtype="<u2")
+            self.weights = np.zeros(0, dtype="<u2")
+            return
+
+        # three plain arrays over the same mapping, nothing is read until it's looked at
+        # (np.frombuffer instead of np.memmap, the memmap subclass costs more than the search itself)
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.keys = np.frombuffer(self.mmap, dtype="<u8", count=count)
+        self.moves = np.frombuffer(self.mmap, dtype="<u2", count=count, offset=count * 8)
+        self.weights = np.frombuffer(self.mmap, dtype="<u2", count=count, offset=count * 10)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # every book move for a position hash, as (move, weight) pairs with the heaviest first
+    def lookup(self, key) -> list:
+
+        keys = self.keys
+        lo = int(keys.searchsorted(np.uint64(key)))
+
+        # a position only has a few book moves, walking them beats a second binary search
+        entries = []
+        while lo < len(keys) and keys[lo] == key:
+            entries.append((int(self.moves[lo]), int(self.weights[lo])))
+            lo += 1
+        return entries
+
+    # book moves for the game's current position, dropping anything that isn't legal here
+    # (a hash collision with some other position)
+    def probe(self, game: ChessGame) -> list:
+
+        entries = self.lookup(game.hash)
+        if not entries:
+            return []
+        legal = set(game.generate_moves())
+        return [(move, weight) for move, weight in entries if move in legal]
+
+    # pick a book move at random, weighted by how often it was played (None when out of book)
+    def choose(self, game: ChessGame, rng = random) -> int:
+
+        entries = self.probe(game)
+        if not entries:
+            return None
+        moves, weights = zip(*entries)
+        return rng.choices(moves, weights=weights)[0]
+
+    # the most played book move (None when out of book)
+    def best(self, game: ChessGame) -> int:
+
+        entries = self.probe(game)
+        return entries[0][0] if entries else None
+
+
+# count (position, move) pairs over the first max_plies of every game and write the book
+#   games: iterable of move lists in ChessMove notation (i.e. PgnGame.moves)
+#   min_count: drop moves played fewer times than this
+# returns the number of records written
+def build_book(games: Iterable, path, max_plies = 20, min_count = 1) -> int:
+
+    counts = Counter()
+    for moves in games:
+        game = ChessGame()
+        for ply, move in enumerate(moves[:max_plies]):
+            key = game.hash
+            try:
+                m = ChessMove.parse_fast(move, ply % 2 == 0)
+            except ValueError:
+                break
+            if not game.validate_move(m):
+                break
+            counts[(key, game.moves[-1])] += 1
+
+    records = np.array(
+        [(key, move, count) for (key, move), count in counts.items() if count >= min_count],
+        dtype=[("key", "<u8"), ("move", "<u2"), ("weight", "<i8")],
+    )
+
+    # weights have to fit in 16 bits, scale everything down together if the top count doesn't
+    if len(records) and records["weight"].max() > 0xFFFF:
+        scaled = records["weight"] * 0xFFFF // records["weight"].max()
+        records["weight"] = np.maximum(scaled, 1)
+
+    # by key, heaviest move first within a key
+    records = records[np.lexsort((-records["weight"], records["key"]))]
+
+    with open(path, "wb") as f:
+        f.write(records["key"].astype("<u8").tobytes())
+        f.write(records["move"].astype("<u2").tobytes())
+        f.write(records["weight"].astype("<u2").tobytes())
+    return len(records)
+
+
+# build a book from every game in a PGN file
+def build_book_from_pgn(pgn_path, path, max_plies = 20, min_count = 1) -> int:
+    return build_book((game.moves for game in read_pgn(pgn_path)), path, max_plies=max_plies, min_count=min_count)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="build an opening book from a PGN file")
+    parser.add_argument("pgn")
+    parser.add_argument("book")
+    parser.add_argument("--plies", type=int, default=20)
+    parser.add_argument("--min-count", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = build_book_from_pgn(args.pgn, args.book, max_plies=args.plies, min_count=args.min_count)
+    print(f"{count} book entries written to {args.book} in {time.perf_counter() - start:.2f}s")
+
+    book = OpeningBook(args.book)
+    for move, weight in book.probe(ChessGame()):
+        print(f"  {move_to_uci(move)}  {weight}")
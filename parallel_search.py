@@ -0,0 +1,212 @@
+
+# Parallel search (lazy SMP)
+# several processes search the same position at once and share what they find through one transposition table
+
+# HOW IT WORKS:
+#   threads don't help a python search (the GIL runs one at a time), so every worker is its own process
+#   the transposition table lives in multiprocessing.shared_memory and every worker lays a
+#   TranspositionTable over it, so a position one worker finished is a free cutoff for the others
+#   there's no other communication: workers just run the normal iterative deepening search, with every
+#   other helper starting one iteration deeper so they aren't all searching the same depth in lockstep
+#   worker 0 is the main one and the only one held to the node limit, as soon as any worker
+#   finishes (limit hit or max depth done) the rest are told to stop
+#   the answer comes from whichever worker completed the deepest iteration (main wins ties)
+#   writes from different processes can interleave, the TT's xor'd keys (see transposition.py) make
+#   torn entries miss instead of returning garbage, and a bad TT move is only ever used for ordering
+
+# USAGE:
+#   python parallel_search.py kiwipete --workers 8 --time 10
+#   python parallel_search.py kiwipete --workers 8 --depth 5 --speedup
+
+
+import argparse
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing import shared_memory
+
+from chess_game import ChessGame, move_to_uci
+from search import Searcher
+from transposition import TranspositionTable
+
+
+# what a parallel search found
+#   best_move, score, depth, pv: same as SearchResult, taken from the worker that got deepest
+#   worker_nodes: nodes searched by each worker (main first)
+#   worker_depths: deepest completed iteration of each worker
+class ParallelSearchResult:
+
+    __slots__ = ("best_move", "score", "depth", "pv", "elapsed", "worker_nodes", "worker_depths")
+
+    def __init__(self, best_move, score, depth, pv, elapsed, worker_nodes, worker_depths):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.elapsed = elapsed
+        self.worker_nodes = worker_nodes
+        self.worker_depths = worker_depths
+
+    @property
+    def nodes(self) -> int:
+        return sum(self.worker_nodes)
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return (
+            f"ParallelSearchResult(best_move={move_to_uci(self.best_move) if self.best_move else None}, "
+            f"score={self.score}, depth={self.depth}, nodes={self.worker_nodes}, elapsed={self.elapsed:.3f})"
+        )
+
+
+# worker side: attach to the shared table, search, send the result back
+# sends (index, result, error), result is None and error the traceback if anything failed (attaching included)
+def _search_worker(index, game, shm_name, age, max_depth, time_limit, node_limit, stop, results):
+
+    shm = tt = None
+    result = error = None
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        tt = TranspositionTable(buffer=shm.buf)
+
+        # every worker bumps the age once in search(), start them all from the same value
+        tt.age = age
+        searcher = Searcher(tt)
+        searcher.stop_event = stop
+
+        result = searcher.search(
+            game,
+            max_depth=max_depth,
+            time_limit=time_limit,
+            node_limit=node_limit if index == 0 else None,
+            start_depth=1 + index % 2,
+        )
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        # always answer so the parent never waits forever
+        results.put((index, result, error))
+        if tt is not None:
+            tt.release()
+        if shm is not None:
+            shm.close()
+
+
+class ParallelSearcher:
+
+    # keep one around between moves, the shared table (and what's in it) lives as long as this does
+    #   workers: number of processes (defaults to the cpu count)
+    def __init__(self, workers = None, tt_size_mb = 64):
+
+        self.workers = workers or os.cpu_count() or 1
+        self.shm = shared_memory.SharedMemory(create=True, size=TranspositionTable.bytes_for(tt_size_mb))
+
+        # our own view, only used to track the age and to clear
+        self.tt = TranspositionTable(buffer=self.shm.buf)
+        self.tt.clear()
+
+    # same limits as Searcher.search, node_limit counts the main worker's nodes only
+    def search(self, game: ChessGame, max_depth = 64, time_limit = None, node_limit = None) -> ParallelSearchResult:
+
+        context = multiprocessing.get_context()
+        stop = context.Event()
+        results = context.Queue()
+
+        start = time.perf_counter()
+        processes = [
+            context.Process(
+                target=_search_worker,
+                args=(i, game.copy(), self.shm.name, self.tt.age, max_depth, time_limit, node_limit, stop, results),
+            )
+            for i in range(self.workers)
+        ]
+        for p in processes:
+            p.start()
+
+        # the first worker to finish stops the rest, one that failed doesn't cut the others short
+        # drain the queue before joining, a process with queued data won't exit until it's read
+        found = [None] * self.workers
+        errors = []
+        for _ in processes:
+            index, result, error = results.get()
+            found[index] = result
+            if error is None:
+                stop.set()
+            else:
+                errors.append(error)
+        for p in processes:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        finished = [r for r in found if r is not None]
+        if not finished:
+            raise RuntimeError(f"every search worker failed, first error:\n{errors[0] if errors else 'no result'}")
+
+        self.tt.new_search()
+        best = finished[0]
+        for result in finished[1:]:
+            if result.depth > best.depth:
+                best = result
+
+        return ParallelSearchResult(
+            best.best_move, best.score, best.depth, best.pv, elapsed,
+            [r.nodes if r is not None else 0 for r in found],
+            [r.depth if r is not None else 0 for r in found],
+        )
+
+    # free the shared memory (the searcher can't be used after this)
+    def close(self):
+        self.tt.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# how much faster N workers reach a fixed depth than one process with the same size table
+# returns (single process seconds, parallel seconds, speedup)
+def measure_speedup(game: ChessGame, depth, workers = None, tt_size_mb = 64) -> tuple:
+
+    single = Searcher(TranspositionTable(tt_size_mb)).search(game.copy(), max_depth=depth)
+
+    with ParallelSearcher(workers, tt_size_mb) as searcher:
+        parallel = searcher.search(game, max_depth=depth)
+
+    return single.elapsed, parallel.elapsed, single.elapsed / parallel.elapsed
+
+
+if __name__ == "__main__":
+
+    from perft import REFERENCE_POSITIONS, reference_game
+
+    parser = argparse.ArgumentParser(description="lazy SMP search of one of the reference positions")
+    parser.add_argument("position", nargs="?", default="start", choices=list(REFERENCE_POSITIONS))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--time", type=float, default=None)
+    parser.add_argument("--depth", type=int, default=64)
+    parser.add_argument("--hash", type=int, default=64, help="transposition table size in MB")
+    parser.add_argument("--speedup", action="store_true", help="also time a single process to the same depth")
+    args = parser.parse_args()
+
+    game = reference_game(args.position)
+    time_limit = args.time if args.time is not None or args.depth != 64 else 5.0
+
+    with ParallelSearcher(args.workers, args.hash) as searcher:
+        result = searcher.search(game, max_depth=args.depth, time_limit=time_limit)
+
+    for i, (nodes, depth) in enumerate(zip(result.worker_nodes, result.worker_depths)):
+        print(f"worker {i:2d}  depth {depth:2d}  nodes {nodes:9d}")
+    print(f"best move {move_to_uci(result.best_move)}  score {result.score}  depth {result.depth}")
+    print(f"{result.nodes} nodes in {result.elapsed:.2f}s ({result.nps:.0f} nps)")
+
+    if args.speedup:
+        single, parallel, speedup = measure_speedup(game, result.depth, searcher.workers, args.hash)
+        print(f"depth {result.depth}: 1 process {single:.2f}s, {searcher.workers} processes {parallel:.2f}s, speedup {speedup:.2f}x")
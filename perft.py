@@ -0,0 +1,150 @@
+
+# Perft: count every leaf of the move tree to a fixed depth
+# the standard way to test a move generator, since the counts for well known positions are published
+# and the same run doubles as a speed benchmark (nodes per second)
+
+# USAGE:
+#   python perft.py                       -> run every reference position and check the counts
+#   python perft.py 4                     -> same, to depth 4 (only the positions with known counts that deep)
+#   python perft.py kiwipete 3            -> count one position to depth 3
+#   python perft.py kiwipete 3 --divide   -> break the count down per root move
+
+
+import argparse
+import time
+
+from chess_game import ChessGame, move_to_uci
+
+
+# reference positions with their known counts for depth 1, 2, 3, ...
+#   name: (FEN, counts)
+#   counts are from the chess programming wiki perft results page
+REFERENCE_POSITIONS = {
+    # the normal starting position
+    "start": (
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609],
+    ),
+    # castles, pins, promotions and en passant all at once
+    "kiwipete": (
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603],
+    ),
+    # sparse endgame, lots of en passant and discovered checks
+    "position3": (
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624],
+    ),
+    # promotions and castling with checks
+    "position4": (
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333],
+    ),
+    # promotion by capture, known to catch buggy generators
+    "position5": (
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487],
+    ),
+    # quiet middlegame
+    "position6": (
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890, 3894594],
+    ),
+}
+
+
+# build a ChessGame for one of the reference positions
+def reference_game(name) -> ChessGame:
+    return ChessGame.from_fen(REFERENCE_POSITIONS[name][0])
+
+
+# number of leaf nodes depth plies below this position
+# the last ply just counts the generated moves instead of playing them (bulk counting)
+def perft(game: ChessGame, depth) -> int:
+
+    moves = game.generate_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    nodes = 0
+    for move in moves:
+        game.make_move(move)
+        nodes += perft(game, depth - 1)
+        game.unmake_move()
+    return nodes
+
+
+# perft split up by root move, {"e2e4": 9771, ...}
+# comparing this against another engine's divide is how you find which move is miscounted
+def divide(game: ChessGame, depth) -> dict:
+
+    counts = {}
+    for move in game.generate_moves():
+        game.make_move(move)
+        counts[move_to_uci(move)] = perft(game, depth - 1)
+        game.unmake_move()
+    return counts
+
+
+# run perft and time it, returns (nodes, seconds, nodes per second)
+def timed_perft(game: ChessGame, depth):
+
+    start = time.perf_counter()
+    nodes = perft(game, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0
+
+
+# check every reference position up to max_depth (or as deep as its counts go)
+# prints one line per position/depth and returns True if every count matched
+def run_suite(max_depth = 3) -> bool:
+
+    all_passed = True
+    for name, (_, counts) in REFERENCE_POSITIONS.items():
+        for depth in range(1, min(max_depth, len(counts)) + 1):
+            nodes, elapsed, nps = timed_perft(reference_game(name), depth)
+            ok = nodes == counts[depth - 1]
+            all_passed = all_passed and ok
+            print(f"{name:<10} depth {depth}  {nodes:>10}  {'ok  ' if ok else 'FAIL'}  {elapsed:8.3f}s  {nps:10.0f} nps")
+
+    return all_passed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="perft move generator test and benchmark")
+    parser.add_argument("position", nargs="?", help=f"one of {', '.join(REFERENCE_POSITIONS)}, or the depth for the whole suite")
+    parser.add_argument("depth", nargs="?", type=int, default=None, help="default 3")
+    parser.add_argument("--divide", action="store_true")
+    args = parser.parse_args()
+
+    # a lone number is the suite's depth
+    if args.position is not None and args.position.isdecimal() and args.position.isascii():
+        if args.depth is not None:
+            parser.error(f"expected a position before depth {args.depth}, got {args.position!r}")
+        args.position, args.depth = None, int(args.position)
+    elif args.position is not None and args.position not in REFERENCE_POSITIONS:
+        parser.error(f"unknown position {args.position!r} (choose from {', '.join(REFERENCE_POSITIONS)})")
+    if args.depth is None:
+        args.depth = 3
+
+    if args.position is None:
+        passed = run_suite(args.depth)
+        print("ALL COUNTS MATCH" if passed else "COUNTS DIFFER")
+
+    elif args.divide:
+        start = time.perf_counter()
+        counts = divide(reference_game(args.position), args.depth)
+        elapsed = time.perf_counter() - start
+        for move, nodes in sorted(counts.items()):
+            print(f"{move}: {nodes}")
+        total = sum(counts.values())
+        print(f"\n{len(counts)} moves, {total} nodes in {elapsed:.3f}s ({total / elapsed:.0f} nps)")
+
+    else:
+        nodes, elapsed, nps = timed_perft(reference_game(args.position), args.depth)
+        expected = REFERENCE_POSITIONS[args.position][1]
+        check = ""
+        if args.depth <= len(expected):
+            check = "  ok" if nodes == expected[args.depth - 1] else f"  FAIL (expected {expected[args.depth - 1]})"
+        print(f"{nodes} nodes in {elapsed:.3f}s ({nps:.0f} nps){check}")
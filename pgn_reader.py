@@ -0,0 +1,168 @@
+
+# Streaming PGN reader
+# memory maps the file and hands back one game at a time, so even multi GB databases never sit in memory
+
+# PGN FORMAT:
+#   Headers – one per line, [Key "Value"]
+#   Movetext – after the headers, moves with numbers (1. e4 e5 2. Nf3 ...) ending in the result
+#   Extras we throw away – comments {...} and ; ..., variations (...), NAGs ($1), annotations (!, ?!)
+#   Castles are written with letters (O-O) instead of zeros (0-0)
+
+# OUTPUT:
+#   moves come out in the notation ChessMove accepts, so "1. e4 e5 2. O-O" becomes
+#   ["1.e4", "1.e5", "2.0-0"] (white and black share the move number)
+#   numbers follow the movetext ("12... Nf6" starts a game at black's 12th move), white_starts says
+#   which color played the first move
+
+
+import mmap
+import re
+from typing import Iterator
+
+
+# one game from the file
+class PgnGame:
+
+    __slots__ = ("headers", "moves", "white_starts")
+
+    def __init__(self, headers: dict, moves: list, white_starts = True):
+        self.headers = headers
+        self.moves = moves
+        self.white_starts = white_starts
+
+    def __repr__(self):
+        return f"PgnGame(headers={self.headers!r}, moves={self.moves!r})"
+
+
+HEADER_REGEX = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+
+# comments and NAGs can be removed in one pass, variations can nest so they need a loop
+COMMENT_REGEX = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+")
+VARIATION_REGEX = re.compile(r"\([^()]*\)")
+
+# a single SAN move, ignoring move numbers, results and annotation glyphs around it
+SAN_REGEX = re.compile(
+    r"[O0]-[O0]-[O0][+#]?|[O0]-[O0][+#]?"
+    r"|[KQRBN]?[a-h]?[1-8]?x?[a-h][1-8](?:=[QRBN])?[+#]?"
+)
+
+# a move number ("12." for white, "12..." for black) or a SAN move
+TOKEN_REGEX = re.compile(r"(\d+)\s*(\.(?:\.\.)?)|(" + SAN_REGEX.pattern + ")")
+
+
+# turn the movetext of one game into a move list ChessMove can parse
+#   number, is_white: where the game starts when the movetext doesn't say (i.e. from a FEN header)
+def parse_movetext(text: str, number = 1, is_white = True) -> list:
+    return _parse_movetext(text, number, is_white)[0]
+
+# (moves, whether white played the first one)
+def _parse_movetext(text: str, number = 1, is_white = True):
+
+    text = COMMENT_REGEX.sub(" ", text)
+    while "(" in text:
+        stripped = VARIATION_REGEX.sub(" ", text)
+        if stripped == text:
+            break
+        text = stripped
+
+    moves = []
+    white_starts = None
+    for digits, dots, san in TOKEN_REGEX.findall(text):
+
+        # the movetext's own numbers win over counting
+        if not san:
+            number = int(digits)
+            is_white = dots == "."
+            continue
+
+        if san[0] == "O":
+            san = san.replace("O", "0")
+        moves.append(f"{number}.{san}")
+        if white_starts is None:
+            white_starts = is_white
+
+        if not is_white:
+            number += 1
+        is_white = not is_white
+
+    return moves, is_white if white_starts is None else white_starts
+
+
+# whether a { comment is still open at the end of a line, given whether one was open at the start
+# (a ; comment runs to the end of the line, so a { after it doesn't count)
+def _comment_open(line: bytes, is_open: bool) -> bool:
+
+    i = 0
+    while True:
+        if is_open:
+            i = line.find(b"}", i)
+            if i < 0:
+                return True
+            is_open = False
+        else:
+            brace = line.find(b"{", i)
+            semicolon = line.find(b";", i)
+            if brace < 0 or 0 <= semicolon < brace:
+                return False
+            is_open = True
+            i = brace
+        i += 1
+
+
+# yield every game in the file lazily
+# the file is memory mapped so only the lines of the current game are ever copied out
+def read_pgn(path) -> Iterator[PgnGame]:
+
+    with open(path, "rb") as f:
+
+        # mmap can't map an empty file
+        f.seek(0, 2)
+        if f.tell() == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+            headers = {}
+            movetext = []
+            in_comment = False
+
+            for line in iter(mm.readline, b""):
+                line = line.strip()
+                if not line:
+                    continue
+
+                # header line -> if we already have moves, the previous game just ended
+                # a comment that wraps can put a [ at the start of a line ("[%clk 0:03:00] }"), so
+                # it only counts outside comments and when the whole line is a header
+                if not in_comment and line.startswith(b"["):
+                    match = HEADER_REGEX.fullmatch(line.decode("utf-8", "replace"))
+                    if match:
+                        if movetext:
+                            yield _make_game(headers, movetext)
+                            headers = {}
+                            movetext = []
+                        headers[match.group(1)] = match.group(2)
+                        continue
+
+                movetext.append(line)
+                if in_comment or b"{" in line:
+                    in_comment = _comment_open(line, in_comment)
+
+            # last game in the file has nothing after it to close it off
+            if movetext or headers:
+                yield _make_game(headers, movetext)
+
+
+def _make_game(headers: dict, movetext: list) -> PgnGame:
+
+    # games set up from a position start where the FEN says, unless the movetext numbers say otherwise
+    number, is_white = 1, True
+    fen = headers.get("FEN", "").split()
+    if len(fen) > 1:
+        is_white = fen[1] != "b"
+    if len(fen) > 5 and fen[5].isdecimal():
+        number = int(fen[5])
+
+    text = b"\n".join(movetext).decode("utf-8", "replace")
+    moves, white_starts = _parse_movetext(text, number, is_white)
+    return PgnGame(headers, moves, white_starts)
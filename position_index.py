@@ -0,0 +1,227 @@
+
+# Position index
+# on disk index of position hash -> (game id, ply) for every position of every game in a collection,
+# so "which games reached this position" is a lookup instead of a replay of the whole database
+
+# FILE FORMAT:
+#   an index is a directory of segment files, each one sorted by key and written once
+#       key:     u64, zobrist hash of the position (ChessGame.hash)
+#       game id: u32
+#       ply:     u16, number of moves played before the position (0 is the starting position)
+#   14 bytes a posting, stored column by column like the opening book (keys, then game ids, then plies)
+#   so the keys can be binary searched in place straight out of the mapping
+
+# HOW IT WORKS:
+#   adding games replays them through ChessGame, buffers the postings, sorts them and writes a new
+#   segment, existing segments are never touched so appends are cheap and safe
+#   a lookup binary searches every segment, compact() merges them back into one when there are many
+
+# USAGE:
+#   python position_index.py build games.pgn index/
+#   python position_index.py query index/ "1.e4" "1.c5" "2.Nf3"
+
+
+import argparse
+import mmap
+import os
+import time
+from typing import Iterable
+
+import numpy as np
+
+from chess_game import ChessGame, ChessMove
+from pgn_reader import read_pgn
+
+
+# key + game id + ply
+POSTING_BYTES = 8 + 4 + 2
+
+SEGMENT_SUFFIX = ".postings"
+
+
+# one sorted, memory mapped segment file
+class Segment:
+
+    def __init__(self, path):
+
+        self.path = path
+        count = os.path.getsize(path) // POSTING_BYTES
+        self.mmap = None
+
+        if count == 0:
+            self.keys = np.zeros(0, dtype="<u8")
+            self.game_ids = np.zeros(0, dtype="<u4")
+            self.plies = np.zeros(0, dtype="<u2")
+            return
+
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.keys = np.frombuffer(self.mmap, dtype="<u8", count=count)
+        self.game_ids = np.frombuffer(self.mmap, dtype="<u4", count=count, offset=count * 8)
+        self.plies = np.frombuffer(self.mmap, dtype="<u2", count=count, offset=count * 12)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # (game ids, plies) arrays for one key
+    def lookup(self, key):
+        key = np.uint64(key)
+        lo = int(self.keys.searchsorted(key, side="left"))
+        hi = int(self.keys.searchsorted(key, side="right"))
+        return self.game_ids[lo:hi], self.plies[lo:hi]
+
+    # unmap the file (the arrays can't be used after this)
+    def close(self):
+        self.keys = self.game_ids = self.plies = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+
+# write sorted postings as a segment (written to a temp file first so a crash never leaves half a segment)
+def write_segment(path, keys, game_ids, plies):
+
+    order = np.argsort(keys, kind="stable")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(np.asarray(keys, dtype="<u8")[order].tobytes())
+        f.write(np.asarray(game_ids, dtype="<u4")[order].tobytes())
+        f.write(np.asarray(plies, dtype="<u2")[order].tobytes())
+    os.replace(tmp, path)
+
+
+class PositionIndex:
+
+    # open (or create) the index in directory
+    def __init__(self, directory):
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segments = [
+            Segment(os.path.join(directory, name))
+            for name in sorted(os.listdir(directory))
+            if name.endswith(SEGMENT_SUFFIX)
+        ]
+
+    def __len__(self):
+        return sum(len(s) for s in self.segments)
+
+    # id the next added game gets when ids aren't given
+    def next_game_id(self) -> int:
+        return max((int(s.game_ids.max()) + 1 for s in self.segments if len(s)), default=0)
+
+    def _segment_path(self) -> str:
+        last = max((int(os.path.basename(s.path)[:-len(SEGMENT_SUFFIX)]) for s in self.segments), default=-1)
+        return os.path.join(self.directory, f"{last + 1:06d}{SEGMENT_SUFFIX}")
+
+    # replay games and add every position they reach
+    #   games: move lists in ChessMove notation, or (game_id, moves) pairs if with_ids is set
+    #   segment_postings: postings buffered before a segment is written, bounds the memory used
+    # a game with an illegal move is indexed up to that move, returns the number of games added
+    def add_games(self, games: Iterable, with_ids = False, segment_postings = 4_000_000) -> int:
+
+        if not with_ids:
+            games = enumerate(games, self.next_game_id())
+
+        keys, game_ids, plies = [], [], []
+        added = 0
+        for game_id, moves in games:
+            game = ChessGame()
+            keys.append(game.hash)
+            game_ids.append(game_id)
+            plies.append(0)
+
+            for ply, move in enumerate(moves):
+                try:
+                    m = ChessMove.parse_fast(move, ply % 2 == 0)
+                except ValueError:
+                    break
+                if not game.validate_move(m):
+                    break
+                keys.append(game.hash)
+                game_ids.append(game_id)
+                plies.append(ply + 1)
+            added += 1
+
+            if len(keys) >= segment_postings:
+                self._flush(keys, game_ids, plies)
+                keys, game_ids, plies = [], [], []
+
+        if keys:
+            self._flush(keys, game_ids, plies)
+        return added
+
+    def _flush(self, keys, game_ids, plies):
+        path = self._segment_path()
+        write_segment(path, np.array(keys, dtype=np.uint64), game_ids, plies)
+        self.segments.append(Segment(path))
+
+    # add every game in a PGN file
+    def add_pgn(self, path, segment_postings = 4_000_000) -> int:
+        return self.add_games((game.moves for game in read_pgn(path)), segment_postings=segment_postings)
+
+    # every (game id, ply) that reached a position hash, sorted
+    def lookup(self, key) -> list:
+
+        found = []
+        for segment in self.segments:
+            game_ids, plies = segment.lookup(key)
+            if len(game_ids):
+                found += zip(game_ids.tolist(), plies.tolist())
+        found.sort()
+        return found
+
+    # ids of the games that reached the game's current position
+    def games_reaching(self, game: ChessGame) -> list:
+        return sorted({game_id for game_id, _ in self.lookup(game.hash)})
+
+    # merge every segment into one
+    def compact(self):
+
+        if len(self.segments) <= 1:
+            return
+
+        keys = np.concatenate([s.keys for s in self.segments])
+        game_ids = np.concatenate([s.game_ids for s in self.segments])
+        plies = np.concatenate([s.plies for s in self.segments])
+
+        path = self._segment_path()
+        write_segment(path, keys, game_ids, plies)
+
+        for segment in self.segments:
+            segment.close()
+            os.remove(segment.path)
+        self.segments = [Segment(path)]
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="index the positions of a PGN collection")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="add every game in a PGN file to the index")
+    build.add_argument("pgn")
+    build.add_argument("index")
+    query = commands.add_parser("query", help="games reaching the position after some moves")
+    query.add_argument("index")
+    query.add_argument("moves", nargs="*")
+    args = parser.parse_args()
+
+    index = PositionIndex(args.index)
+    start = time.perf_counter()
+
+    if args.command == "build":
+        added = index.add_pgn(args.pgn)
+        print(f"{added} games indexed in {time.perf_counter() - start:.2f}s ({len(index)} postings, {len(index.segments)} segments)")
+    else:
+        game = ChessGame()
+        for ply, move in enumerate(args.moves):
+            if not game.validate_move(ChessMove.parse_fast(move, ply % 2 == 0)):
+                raise SystemExit(f"illegal move: {move}")
+        found = index.games_reaching(game)
+        print(f"{len(found)} games in {(time.perf_counter() - start) * 1000:.2f}ms")
+        print(" ".join(str(g) for g in found[:50]))
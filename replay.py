@@ -0,0 +1,150 @@
+
+# Bulk game replay
+# replays lots of games through ChessGame.validate_move across a pool of worker processes
+
+# HOW IT WORKS:
+#   games are grouped into chunks so each trip to a worker carries enough work to be worth the pickling
+#   only a few chunks per worker are in flight at once, so a generator of millions of games
+#   (i.e. read_pgn) is never pulled into memory all at once
+#   results come back in the same order the games went in
+
+# USAGE:
+#   python replay.py games.pgn --workers 8 --chunksize 64
+
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from chess_game import ChessGame, ChessMove
+from pgn_reader import read_pgn
+
+
+# result of replaying one game
+#   legal: every move was valid
+#   first_illegal_ply: index into the move list of the first bad move (None if legal)
+#   plies: number of moves that were played
+#   board: final position (8x8 array, same layout as ChessGame.board)
+class ReplayResult:
+
+    __slots__ = ("game_id", "legal", "first_illegal_ply", "plies", "board")
+
+    def __init__(self, game_id, legal, first_illegal_ply, plies, board):
+        self.game_id = game_id
+        self.legal = legal
+        self.first_illegal_ply = first_illegal_ply
+        self.plies = plies
+        self.board = board
+
+    def __repr__(self):
+        return (
+            f"ReplayResult(game_id={self.game_id!r}, legal={self.legal}, "
+            f"first_illegal_ply={self.first_illegal_ply}, plies={self.plies})"
+        )
+
+
+# replay a single game from the starting position
+# moves are in ChessMove notation, white first ("1.e4", "1.e5", ...)
+def replay_game(moves, game_id = None) -> ReplayResult:
+
+    game = ChessGame()
+
+    for ply, move in enumerate(moves):
+        try:
+            m = ChessMove.parse_fast(move, ply % 2 == 0)
+        except ValueError:
+            return ReplayResult(game_id, False, ply, ply, game.board)
+
+        if not game.validate_move(m):
+            return ReplayResult(game_id, False, ply, ply, game.board)
+
+    return ReplayResult(game_id, True, None, len(moves), game.board)
+
+
+# worker side: one chunk of (game_id, moves) pairs -> list of results
+def _replay_chunk(chunk) -> list:
+    return [replay_game(moves, game_id) for game_id, moves in chunk]
+
+
+# group (game_id, moves) pairs into lists of chunksize
+def _chunks(games, chunksize):
+
+    chunk = []
+    for game_id, moves in games:
+        chunk.append((game_id, moves))
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# replay many games in parallel
+#   games: iterable of move lists, or of (game_id, moves) pairs if with_ids is set
+#   workers: number of processes (defaults to the cpu count)
+#   chunksize: games per task, bigger chunks mean less IPC per game
+#   in_flight: chunks queued per worker before we wait for results
+def replay_games(games: Iterable, workers = None, chunksize = 64, in_flight = 4, with_ids = False) -> Iterator[ReplayResult]:
+
+    if not with_ids:
+        games = enumerate(games)
+
+    workers = workers or os.cpu_count() or 1
+
+    # skip the pool entirely for a single worker
+    if workers == 1:
+        for chunk in _chunks(games, chunksize):
+            yield from _replay_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        pending = deque()
+        for chunk in _chunks(games, chunksize):
+            pending.append(pool.submit(_replay_chunk, chunk))
+
+            # keep the queue bounded, hand results back as the oldest chunk finishes
+            if len(pending) >= workers * in_flight:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+
+# replay every game in a PGN file
+def replay_pgn(path, workers = None, chunksize = 64) -> Iterator[ReplayResult]:
+
+    return replay_games((game.moves for game in read_pgn(path)), workers=workers, chunksize=chunksize)
+
+
+# totals over a batch of results
+def summarize(results: Iterable[ReplayResult]) -> dict:
+
+    games = 0
+    legal = 0
+    plies = 0
+    for result in results:
+        games += 1
+        legal += result.legal
+        plies += result.plies
+
+    return {"games": games, "legal": legal, "illegal": games - legal, "plies": plies}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="replay and validate every game in a PGN file")
+    parser.add_argument("pgn")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=64)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    totals = summarize(replay_pgn(args.pgn, workers=args.workers, chunksize=args.chunksize))
+    elapsed = time.perf_counter() - start
+
+    print(f"{totals['games']} games ({totals['illegal']} illegal), {totals['plies']} plies in {elapsed:.2f}s")
+    print(f"{totals['games'] / elapsed:.0f} games/s, {totals['plies'] / elapsed:.0f} plies/s")
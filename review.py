@@ -0,0 +1,197 @@
+
+# Game review
+# replays a game, searches every position to a fixed depth and grades each move by how much it gave away
+
+# HOW IT WORKS:
+#   every position in the game gets searched once, the score before a move is what the best move was
+#   worth, the score after is what the played move was actually worth, and the difference is the
+#   centipawn loss that the move is graded by
+#   analysis is cached by position hash on the Reviewer, across games: club games share most of
+#   their openings, so a batch only pays for the opening positions once
+#   (the cache ignores how a position was reached, so a repetition draw one game saw isn't remembered)
+
+# CLASSIFICATION (centipawn loss):
+#   best: played the engine's move, or lost nothing
+#   excellent <= 20, good <= 50, inaccuracy <= 100, mistake <= 300, blunder beyond that
+
+# USAGE:
+#   python review.py games.pgn --depth 4
+
+
+import argparse
+import time
+from typing import Iterable, Iterator
+
+from chess_game import ChessGame, ChessMove, move_to_uci
+from pgn_reader import read_pgn
+from search import Searcher, MATE_BOUND
+
+
+# (upper bound on centipawn loss, label), checked in order
+CLASSIFICATIONS = (
+    (0, "best"),
+    (20, "excellent"),
+    (50, "good"),
+    (100, "inaccuracy"),
+    (300, "mistake"),
+)
+BLUNDER = "blunder"
+
+# mate scores are capped so one missed mate doesn't swamp a whole game's average
+MATE_CP = 2000
+
+
+def classify(loss) -> str:
+    for limit, label in CLASSIFICATIONS:
+        if loss <= limit:
+            return label
+    return BLUNDER
+
+def _clamp(score) -> int:
+    if score >= MATE_BOUND:
+        return MATE_CP
+    if score <= -MATE_BOUND:
+        return -MATE_CP
+    return max(-MATE_CP, min(MATE_CP, score))
+
+
+# one reviewed move, scores are centipawns for the side that played it
+class MoveReview:
+
+    __slots__ = ("ply", "move", "best_move", "best_score", "played_score", "loss", "classification")
+
+    def __init__(self, ply, move, best_move, best_score, played_score):
+        self.ply = ply
+        self.move = move
+        self.best_move = best_move
+        self.best_score = best_score
+        self.played_score = played_score
+        self.loss = 0 if move == best_move else max(0, best_score - played_score)
+        self.classification = classify(self.loss)
+
+    def __repr__(self):
+        return (
+            f"MoveReview(ply={self.ply}, move={move_to_uci(self.move)}, best_move={move_to_uci(self.best_move)}, "
+            f"loss={self.loss}, classification={self.classification!r})"
+        )
+
+
+# a whole game's review
+class GameReview:
+
+    __slots__ = ("moves",)
+
+    def __init__(self, moves: list):
+        self.moves = moves
+
+    # average centipawn loss for one side
+    def average_loss(self, is_white) -> float:
+        losses = [m.loss for m in self.moves if (m.ply % 2 == 0) == is_white]
+        return sum(losses) / len(losses) if losses else 0.0
+
+    # how many moves one side made of each classification
+    def counts(self, is_white) -> dict:
+        counts = {label: 0 for _, label in CLASSIFICATIONS}
+        counts[BLUNDER] = 0
+        for m in self.moves:
+            if (m.ply % 2 == 0) == is_white:
+                counts[m.classification] += 1
+        return counts
+
+
+class Reviewer:
+
+    # keep one Reviewer for a whole batch of games, that's what makes the cache pay off
+    #   depth: search depth for every position
+    #   tablebase: tablebase.Tablebase, solved endgames are scored from the tables
+    def __init__(self, depth = 4, tablebase = None, tt_size_mb = 16):
+
+        self.depth = depth
+        self.searcher = Searcher(tt_size_mb=tt_size_mb, tablebase=tablebase)
+
+        # position hash -> (best move, score for the side to move)
+        self.cache = {}
+        self.cache_hits = 0
+        self.positions_searched = 0
+
+    # best move and score of the game's current position (from the cache when we've seen it)
+    def analyze(self, game: ChessGame):
+
+        cached = self.cache.get(game.hash)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        result = self.searcher.search(game, max_depth=self.depth)
+        self.positions_searched += 1
+        analysis = (result.best_move, _clamp(result.score))
+        self.cache[game.hash] = analysis
+        return analysis
+
+    # review a game given as packed moves (ChessGame.moves) from the starting position
+    def review(self, moves: list) -> GameReview:
+
+        game = ChessGame()
+        reviewed = []
+
+        best_move, best_score = self.analyze(game)
+        for ply, move in enumerate(moves):
+            game.make_move(move)
+            reply, reply_score = self.analyze(game)
+
+            # the position after the move is scored for the opponent, so flip it
+            reviewed.append(MoveReview(ply, move, best_move, best_score, -reply_score))
+            best_move, best_score = reply, reply_score
+
+        return GameReview(reviewed)
+
+    # review a finished ChessGame
+    def review_game(self, game: ChessGame) -> GameReview:
+        return self.review(game.moves)
+
+    # review a batch, games are move lists in ChessMove notation (i.e. PgnGame.moves)
+    # games with an illegal move are reviewed up to that move
+    def review_many(self, games: Iterable) -> Iterator[GameReview]:
+        for moves in games:
+            yield self.review(to_packed(moves))
+
+
+# ChessMove notation -> packed moves, stopping at the first move that doesn't parse or isn't legal
+def to_packed(moves) -> list:
+
+    game = ChessGame()
+    for ply, move in enumerate(moves):
+        try:
+            m = ChessMove.parse_fast(move, ply % 2 == 0)
+        except ValueError:
+            break
+        if not game.validate_move(m):
+            break
+    return game.moves
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="review every game in a PGN file")
+    parser.add_argument("pgn")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--tablebases", default=None, help="directory of generated endgame tables")
+    args = parser.parse_args()
+
+    tablebase = None
+    if args.tablebases:
+        from tablebase import Tablebase
+        tablebase = Tablebase(args.tablebases)
+
+    reviewer = Reviewer(args.depth, tablebase)
+    start = time.perf_counter()
+    for i, (pgn, review) in enumerate(zip(read_pgn(args.pgn), reviewer.review_many(g.moves for g in read_pgn(args.pgn)))):
+        white = pgn.headers.get("White", "?")
+        black = pgn.headers.get("Black", "?")
+        print(f"game {i + 1}: {white} vs {black}")
+        for is_white, name in ((True, white), (False, black)):
+            counts = ", ".join(f"{n} {label}" for label, n in review.counts(is_white).items() if n)
+            print(f"  {name}: average loss {review.average_loss(is_white):.0f}cp ({counts})")
+
+    elapsed = time.perf_counter() - start
+    print(f"{reviewer.positions_searched} positions searched, {reviewer.cache_hits} from the cache, {elapsed:.2f}s")
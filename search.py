@@ -0,0 +1,406 @@
+
+# Search
+# finds the best move for the side to move with alpha-beta on top of ChessGame's make/unmake
+
+# HOW IT WORKS:
+#   negamax alpha-beta: every score is from the side to move's point of view, so one function handles both colors
+#   iterative deepening: search depth 1, 2, 3, ... until time runs out, each iteration fills the
+#       transposition table and move ordering tables that make the next one much cheaper
+#   principal variation search: the first (best looking) move gets a full window, every other move
+#       is first searched with a null window just to prove it's worse, and only re-searched if it isn't
+#   quiescence search: at depth 0 keep playing captures so we don't evaluate in the middle of a trade
+#   move ordering: TT move, then captures by MVV-LVA (most valuable victim, least valuable attacker),
+#       then killer moves (quiet moves that caused a cutoff at the same ply), then history scores
+
+# USAGE:
+#   python search.py kiwipete --time 5
+
+
+import argparse
+import time
+
+from chess_game import ChessGame, CAPTURE, EN_PASSANT, PROMOTION, move_to_uci
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from evaluation import evaluate
+
+
+MATE = 30000
+INF = 32000
+
+# scores beyond this are "mate in n"
+MATE_BOUND = MATE - 1000
+
+MAX_PLY = 128
+
+
+# thrown from inside the tree when a node/time limit is hit
+class SearchStopped(Exception):
+    pass
+
+
+# what a search found
+#   best_move: packed move (see encode_move), 0 if there are no legal moves
+#   score: centipawns for the side to move (+/- MATE - plies for forced mates)
+#   depth: deepest completed iteration
+#   pv: expected line of play starting with best_move
+class SearchResult:
+
+    __slots__ = ("best_move", "score", "depth", "nodes", "elapsed", "pv")
+
+    def __init__(self, best_move, score, depth, nodes, elapsed, pv):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return (
+            f"SearchResult(best_move={move_to_uci(self.best_move) if self.best_move else None}, "
+            f"score={self.score}, depth={self.depth}, nodes={self.nodes}, elapsed={self.elapsed:.3f})"
+        )
+
+
+class Searcher:
+
+    # keep one Searcher around per game/bot so the TT and history carry over between moves
+    # tablebase: a tablebase.Tablebase, positions it covers are scored exactly instead of searched
+    def __init__(self, tt: TranspositionTable = None, tt_size_mb = 16, tablebase = None):
+
+        self.tt = tt if tt is not None else TranspositionTable(tt_size_mb)
+        self.tablebase = tablebase
+        self.tb_hits = 0
+
+        # two killer moves per ply
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+
+        # history[from_sq * 64 + to_sq], bumped whenever a quiet move causes a cutoff
+        self.history = [0] * 4096
+
+        self.nodes = 0
+        self.node_limit = None
+        self.deadline = None
+
+        # set from outside (i.e. a multiprocessing.Event) to stop the search early
+        self.stop_event = None
+
+    # search the game's position (the game is left exactly as it was passed in)
+    #   max_depth: stop after this iteration
+    #   time_limit: seconds, an iteration that's unlikely to finish isn't started
+    #   node_limit: stop once this many nodes have been searched
+    #   on_iteration: called with a SearchResult after each completed depth
+    #   start_depth: first iteration to run (helpers in parallel_search.py start deeper)
+    def search(self, game: ChessGame, max_depth = 64, time_limit = None, node_limit = None, on_iteration = None, start_depth = 1) -> SearchResult:
+
+        start = time.perf_counter()
+        self.nodes = 0
+        self.tb_hits = 0
+        self.node_limit = node_limit
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [h >> 3 for h in self.history]
+        self.tt.new_search()
+
+        root_moves = game.generate_moves()
+        if not root_moves:
+            score = -MATE if game.checkers(game.white_to_move) else 0
+            return SearchResult(0, score, 0, 0, 0.0, [])
+
+        # solved endgame: the table already knows the best move
+        if self.tablebase is not None:
+            solved = self.tablebase.best_move(game)
+            if solved is not None:
+                move, wdl, dtm = solved
+                self.tb_hits += 1
+                return SearchResult(move, tablebase_score(wdl, dtm, 0), 0, 0, time.perf_counter() - start, [move])
+
+        best = SearchResult(root_moves[0], 0, 0, 0, 0.0, [root_moves[0]])
+        root_depth = len(game.undo_stack)
+
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            self.root_best = 0
+            try:
+                score = self.negamax(game, depth, -INF, INF, 0)
+            except SearchStopped:
+                # put the board back, keep whatever the unfinished iteration had already proven
+                while len(game.undo_stack) > root_depth:
+                    game.unmake_move()
+                if self.root_best:
+                    best.best_move = self.root_best
+                    best.pv = [self.root_best]
+                break
+
+            elapsed = time.perf_counter() - start
+            best = SearchResult(self.root_best or best.best_move, score, depth, self.nodes, elapsed, self.principal_variation(game, depth))
+            if on_iteration is not None:
+                on_iteration(best)
+
+            # forced mate found, or the next iteration (usually several times longer) won't fit
+            if abs(score) >= MATE_BOUND:
+                break
+            if self.deadline is not None and time.perf_counter() + 2 * elapsed > self.deadline:
+                break
+
+        best.nodes = self.nodes
+        best.elapsed = time.perf_counter() - start
+        return best
+
+    # stop the search from inside the tree when a limit is hit (checked every 1024 nodes)
+    def check_limits(self):
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchStopped()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchStopped()
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchStopped()
+
+    def negamax(self, game: ChessGame, depth, alpha, beta, ply) -> int:
+
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+
+        # repeating a position from earlier in the game or search counts as a draw
+        if ply > 0 and self.is_repetition(game):
+            return 0
+
+        # exact score for solved endgames, no need to search them
+        if self.tablebase is not None and game.occupied.bit_count() <= self.tablebase.max_pieces:
+            solved = self.tablebase.probe(game)
+            if solved is not None:
+                self.tb_hits += 1
+                return tablebase_score(solved[0], solved[1], ply)
+
+        is_white = game.white_to_move
+        in_check = game.checkers(is_white) != 0
+
+        # don't drop into quiescence while in check
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self.quiesce(game, alpha, beta, ply)
+
+        pv_node = beta - alpha > 1
+        key = game.hash
+
+        # TT: a deep enough stored result can end this node right away
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_move, tt_score, tt_depth, tt_bound = entry
+            if tt_depth >= depth and ply > 0 and not pv_node:
+                tt_score = score_from_tt(tt_score, ply)
+                if tt_bound == EXACT:
+                    return tt_score
+                if tt_bound == LOWER and tt_score >= beta:
+                    return tt_score
+                if tt_bound == UPPER and tt_score <= alpha:
+                    return tt_score
+
+        moves = game.generate_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        moves = self.order_moves(game, moves, tt_move, ply)
+
+        alpha_start = alpha
+        best_score = -INF
+        best_move = 0
+
+        for i, move in enumerate(moves):
+
+            game.make_move(move)
+            if i == 0:
+                score = -self.negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                # null window first, full window only if it might be better
+                score = -self.negamax(game, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            game.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if ply == 0:
+                    self.root_best = move
+
+            if score > alpha:
+                alpha = score
+
+            if alpha >= beta:
+                # quiet moves that refute a position are worth trying early elsewhere
+                # (check extensions can take a line past MAX_PLY, there are no killer slots that deep)
+                if ply < MAX_PLY and not (move >> 12) & (CAPTURE | PROMOTION):
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self.history[move & 4095] += depth * depth
+                break
+
+        if best_score <= alpha_start:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(key, best_move, score_to_tt(best_score, ply), depth, bound)
+
+        return best_score
+
+    # only captures (and promotions), until the position is quiet
+    def quiesce(self, game: ChessGame, alpha, beta, ply) -> int:
+
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+
+        in_check = game.checkers(game.white_to_move) != 0
+
+        # stand pat: the side to move can usually do at least as well as the static score by not capturing
+        if not in_check:
+            stand_pat = evaluate(game)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            best_score = stand_pat
+        else:
+            best_score = -MATE + ply
+
+        moves = game.generate_moves()
+        if not moves:
+            return -MATE + ply if in_check else best_score
+
+        # in check every evasion has to be looked at, otherwise just the noisy moves
+        if not in_check:
+            moves = [m for m in moves if (m >> 12) & (CAPTURE | PROMOTION)]
+        if ply >= MAX_PLY - 1:
+            return best_score
+
+        for move in self.order_moves(game, moves, 0, ply):
+            game.make_move(move)
+            score = -self.quiesce(game, -beta, -alpha, ply + 1)
+            game.unmake_move()
+
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        return best_score
+
+    # sort moves best first: TT move, captures (MVV-LVA), promotions, killers, then history
+    def order_moves(self, game: ChessGame, moves, tt_move, ply) -> list:
+
+        board = game.board
+        killers = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        history = self.history
+
+        scored = []
+        for move in moves:
+            flag = move >> 12
+            if move == tt_move:
+                score = 10_000_000
+            elif flag & CAPTURE:
+                to_sq = (move >> 6) & 63
+                from_sq = move & 63
+                victim = 1 if flag == EN_PASSANT else abs(int(board[to_sq >> 3, to_sq & 7]))
+                attacker = abs(int(board[from_sq >> 3, from_sq & 7]))
+                score = 1_000_000 + victim * 100 - attacker
+                if flag & PROMOTION:
+                    score += (flag & 3) * 10
+            elif flag & PROMOTION:
+                score = 900_000 + (flag & 3)
+            elif move == killers[0]:
+                score = 800_000
+            elif move == killers[1]:
+                score = 790_000
+            else:
+                score = history[move & 4095]
+            scored.append((score, move))
+
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    # has the current position already happened (same side to move) in the game or search so far
+    def is_repetition(self, game: ChessGame) -> bool:
+
+        key = game.hash
+        hashes = game.hashes
+        # hashes[i] is the position before move i, positions with the same side to move are 2 apart
+        for i in range(len(hashes) - 2, -1, -2):
+            if hashes[i] == key:
+                return True
+        return False
+
+    # follow best moves through the TT to get the expected line
+    def principal_variation(self, game: ChessGame, depth) -> list:
+
+        pv = []
+        for _ in range(depth):
+            entry = self.tt.probe(game.hash)
+            if entry is None or entry[0] == 0 or entry[0] not in game.generate_moves():
+                break
+            pv.append(entry[0])
+            game.make_move(entry[0])
+        for _ in pv:
+            game.unmake_move()
+        return pv
+
+
+# mate scores are stored relative to the node, not the root, so they stay right wherever they're probed
+def score_to_tt(score, ply) -> int:
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply) -> int:
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+# tablebase result -> search score (mates found through the table are exact, counted from the root)
+def tablebase_score(wdl, dtm, ply) -> int:
+    if wdl > 0:
+        return MATE - ply - dtm
+    if wdl < 0:
+        return -MATE + ply + dtm
+    return 0
+
+
+# one-off helper for the bot: best move within a time budget
+def best_move(game: ChessGame, time_limit = 1.0) -> int:
+    return Searcher().search(game, time_limit=time_limit).best_move
+
+
+if __name__ == "__main__":
+
+    from perft import REFERENCE_POSITIONS, reference_game
+
+    parser = argparse.ArgumentParser(description="search one of the reference positions")
+    parser.add_argument("position", nargs="?", default="start", choices=list(REFERENCE_POSITIONS))
+    parser.add_argument("--time", type=float, default=5.0)
+    parser.add_argument("--depth", type=int, default=64)
+    parser.add_argument("--nodes", type=int, default=None)
+    args = parser.parse_args()
+
+    def report(result):
+        pv = " ".join(move_to_uci(m) for m in result.pv)
+        print(f"depth {result.depth:2d}  score {result.score:6d}  nodes {result.nodes:8d}  nps {result.nps:7.0f}  pv {pv}")
+
+    result = Searcher().search(reference_game(args.position), max_depth=args.depth, time_limit=args.time, node_limit=args.nodes, on_iteration=report)
+    print(f"best move {move_to_uci(result.best_move)}")
@@ -0,0 +1,343 @@
+
+# Game server
+# asyncio TCP server hosting lots of ChessGame sessions at once, one line per command in, one JSON object per line out
+
+# PROTOCOL:
+#   commands (text, one per line):
+#       new                 -> new game for two players (anyone subscribed can move for either side)
+#       new white|black     -> new game against the bot, you play the given color
+#       join <game>         -> subscribe to a game's updates
+#       leave <game>        -> unsubscribe (a game nobody is subscribed to is dropped)
+#       state <game>        -> current state of a game
+#       move <game> <move>  -> play a move, SAN like "e4" / "Nxf7+" / "O-O", or from/to like "e2e4" / "e7e8q"
+#       quit
+#   replies / pushes (JSON):
+#       {"type": "ack", "game": 1, "move": "e4", "uci": "e2e4", "ply": 1}
+#       {"type": "state", "game": 1, "fen": "...", "ply": 1, "last": "e2e4", "status": "active", "bot": "black"}
+#       {"type": "error", "game": 1, "error": "illegal move"}
+#       {"type": "left", "game": 1}
+#       {"type": "update", ...same fields as state}
+#       {"type": "bot_error", "game": 1, "error": "..."}
+#   every command gets exactly one reply (ack/error for move, state for new/join/state, left for leave)
+#   and replies come back in the order the commands were sent
+#   updates are pushed to every subscriber whenever a game changes (the mover gets the ack first)
+#   status is active, checkmate, stalemate, repetition or fifty_moves
+
+# HOW IT WORKS:
+#   everything on the event loop is cheap: a move is parse_san + validate_move (SAN) or a lookup in
+#   generate_moves (from/to), then one FEN and a status check, ~100us, so thousands of games share one loop
+#   bot moves are a real search, those go to an executor (processes by default, searching holds the GIL)
+#   with a copy of the game, the loop keeps answering everyone else and applies the move when it comes back
+#   a client that stops reading gets disconnected once its send buffer passes MAX_BUFFER, so one stuck
+#   client can't make the server hold every update it's ever pushed
+
+# USAGE:
+#   python server.py --port 5050 --bot-time 0.5 --bot-workers 2
+#   python load_test.py --port 5050 --games 2000
+
+
+import argparse
+import asyncio
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_game import ChessGame, ChessMove, move_to_uci
+from search import Searcher
+
+
+DEFAULT_PORT = 5050
+
+# bytes queued for one client before it's considered stuck
+MAX_BUFFER = 1 << 20
+
+UCI_REGEX = re.compile(r"[a-h][1-8][a-h][1-8][nbrq]?$")
+
+
+# one game and everyone watching it
+#   bot: None for a two player game, otherwise the color the bot plays (True for white)
+class Session:
+
+    __slots__ = ("id", "game", "bot", "subscribers", "thinking", "closed", "status")
+
+    def __init__(self, id, bot = None):
+        self.id = id
+        self.game = ChessGame()
+        self.bot = bot
+        self.subscribers = set()
+        self.thinking = False
+        self.closed = False
+        self.status = "active"
+
+    def __repr__(self):
+        return f"Session(id={self.id}, ply={len(self.game.moves)}, bot={self.bot}, subscribers={len(self.subscribers)})"
+
+
+# why the game is over, or "active"
+def game_status(game: ChessGame) -> str:
+
+    if not game.generate_moves():
+        return "checkmate" if game.checkers(game.white_to_move) else "stalemate"
+    if game.halfmove_clock >= 100:
+        return "fifty_moves"
+
+    # threefold: the position was already seen twice, only since the last capture or pawn move
+    hashes = game.hashes
+    seen = 0
+    for i in range(len(hashes) - 2, max(-1, len(hashes) - 1 - game.halfmove_clock), -2):
+        if hashes[i] == game.hash:
+            seen += 1
+            if seen == 2:
+                return "repetition"
+    return "active"
+
+
+# play a move given as SAN (without the move number) or from/to, returns the packed move or None
+def play_move(game: ChessGame, text: str):
+
+    if UCI_REGEX.match(text):
+        for move in game.generate_moves():
+            if move_to_uci(move) == text:
+                game.make_move(move)
+                return move
+        return None
+
+    text = text.replace("O", "0")
+    try:
+        move = ChessMove.parse_san(text, game.white_to_move)
+    except ValueError:
+        return None
+    if not game.validate_move(move):
+        return None
+    return game.moves[-1]
+
+
+# searcher for a bot worker, one per process so its TT carries over between moves
+_searcher = None
+
+def _bot_move(game: ChessGame, time_limit) -> int:
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+    return _searcher.search(game, time_limit=time_limit).best_move
+
+
+class GameServer:
+
+    #   bot_time: seconds the bot searches per move
+    #   executor: where bot searches run, a process pool of bot_workers when not given
+    #             (one passed in is left running by close(), the caller owns it)
+    def __init__(self, bot_time = 0.5, bot_workers = None, executor = None):
+
+        self.bot_time = bot_time
+        self._owns_executor = executor is None
+        self.executor = executor if executor is not None else ProcessPoolExecutor(bot_workers)
+        self.sessions = {}
+        self.next_id = 1
+        self.server = None
+        # writer -> task handling that connection
+        self.connections = {}
+        self.moves_played = 0
+
+    async def start(self, host = "127.0.0.1", port = DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    # port actually bound (useful with port 0)
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        # closing the listener leaves open connections alone, their handlers clean up once they see EOF
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        if self._owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # one client connection
+    async def handle(self, reader, writer):
+
+        subscribed = set()
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode(errors="replace").split()
+                if not words:
+                    continue
+                if words[0] == "quit":
+                    break
+                self.command(writer, subscribed, words)
+                if writer.is_closing():
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for session in list(subscribed):
+                self.unsubscribe(session, writer)
+            self.connections.pop(writer, None)
+            writer.close()
+
+    # run one command, replies are written straight to the client
+    def command(self, writer, subscribed, words):
+
+        name, args = words[0], words[1:]
+
+        if name == "new":
+            if args and args[0] not in ("white", "black"):
+                return send(writer, {"type": "error", "error": "color must be white or black"})
+            bot = None if not args else args[0] == "black"
+            session = Session(self.next_id, bot)
+            self.next_id += 1
+            self.sessions[session.id] = session
+            session.subscribers.add(writer)
+            subscribed.add(session)
+            send(writer, self.state(session))
+            if bot is True:
+                self.start_bot(session)
+            return
+
+        if name not in ("join", "leave", "state", "move"):
+            return send(writer, {"type": "error", "error": f"unknown command {name!r}"})
+
+        # isdigit() is true for things int() rejects ("²"), and int() takes other scripts' digits ("٣")
+        game_id = args[0] if args else ""
+        session = self.sessions.get(int(game_id)) if game_id.isdecimal() and game_id.isascii() else None
+        if session is None:
+            return send(writer, {"type": "error", "error": "no such game"})
+
+        if name == "join":
+            session.subscribers.add(writer)
+            subscribed.add(session)
+            send(writer, self.state(session))
+        elif name == "leave":
+            subscribed.discard(session)
+            self.unsubscribe(session, writer)
+            send(writer, {"type": "left", "game": session.id})
+        elif name == "state":
+            send(writer, self.state(session))
+        elif len(args) < 2:
+            send(writer, {"type": "error", "game": session.id, "error": "move needs a game and a move"})
+        else:
+            self.move(writer, session, args[1])
+
+    def move(self, writer, session, text):
+
+        game = session.game
+        if session.thinking or session.bot == game.white_to_move:
+            return send(writer, {"type": "error", "game": session.id, "error": "not your turn"})
+        if session.status != "active":
+            return send(writer, {"type": "error", "game": session.id, "error": "game is over"})
+
+        move = play_move(game, text)
+        if move is None:
+            return send(writer, {"type": "error", "game": session.id, "error": "illegal move"})
+        self.moves_played += 1
+
+        send(writer, {"type": "ack", "game": session.id, "move": text, "uci": move_to_uci(move), "ply": len(game.moves)})
+        state = self.push(session)
+        if session.bot is not None and state["status"] == "active":
+            self.start_bot(session)
+
+    # send the game's state to every subscriber, returns the state
+    def push(self, session) -> dict:
+        state = self.state(session)
+        state["type"] = "update"
+        line = encode(state)
+        for writer in list(session.subscribers):
+            write(writer, line)
+        return state
+
+    def state(self, session) -> dict:
+        game = session.game
+        session.status = game_status(game)
+        return {
+            "type": "state",
+            "game": session.id,
+            "fen": game.to_fen(),
+            "ply": len(game.moves),
+            "last": move_to_uci(game.moves[-1]) if game.moves else None,
+            "status": session.status,
+            "bot": None if session.bot is None else ("white" if session.bot else "black"),
+        }
+
+    def unsubscribe(self, session, writer):
+        session.subscribers.discard(writer)
+        if not session.subscribers:
+            session.closed = True
+            self.sessions.pop(session.id, None)
+
+    def start_bot(self, session):
+        session.thinking = True
+        asyncio.get_running_loop().create_task(self.bot_turn(session))
+
+    # search in the executor, then play the move if anyone is still watching
+    async def bot_turn(self, session):
+
+        loop = asyncio.get_running_loop()
+        try:
+            move = await loop.run_in_executor(self.executor, _bot_move, session.game.copy(), self.bot_time)
+        except Exception as e:
+            session.thinking = False
+            line = encode({"type": "bot_error", "game": session.id, "error": str(e)})
+            for writer in list(session.subscribers):
+                write(writer, line)
+            return
+
+        session.thinking = False
+        if session.closed or move is None:
+            return
+        session.game.make_move(move)
+        self.moves_played += 1
+        self.push(session)
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+def send(writer, message: dict):
+    write(writer, encode(message))
+
+# queue a line for a client, dropping clients that aren't reading
+def write(writer, line: bytes):
+    if writer.is_closing():
+        return
+    if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+        writer.close()
+        return
+    writer.write(line)
+
+
+async def main(args):
+
+    server = GameServer(args.bot_time, args.bot_workers)
+    await server.start(args.host, args.port)
+    print(f"serving on {args.host}:{server.port}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="asyncio chess game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--bot-time", type=float, default=0.5, help="seconds the bot searches per move")
+    parser.add_argument("--bot-workers", type=int, default=None, help="processes for bot searches (default: one per cpu)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
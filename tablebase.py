@@ -0,0 +1,620 @@
+
+# Endgame tablebases
+# solved win/draw/loss and distance to mate for every position of a small endgame (KQK, KRK, KPK, ... up to 4 pieces)
+
+# INDEXING:
+#   a table covers one material balance, i.e. "KQvK" (white pieces v black pieces, strongest side as white)
+#   pieces are listed white then black, each side strongest first, so the white king always comes first
+#   index = side to move * half + king slot * 64^(n-1) + square of every other piece in base 64
+#   the white king is moved into a small slot set by symmetry first:
+#       no pawns -> any of the 8 board symmetries, king ends up in the a1-d1-d4 triangle (10 slots)
+#       pawns -> pawns can't be flipped top to bottom, only mirror left-right, king on files a-d (32 slots)
+#   positions with black stronger are looked up color flipped (swap colors, mirror ranks, flip side to move)
+#   impossible placements (two pieces on a square, side not to move in check, pawns on the back rank)
+#   are part of the index, they're just marked BROKEN
+
+# GENERATION (retrograde analysis):
+#   for every position, the index of every position one legal move away is computed up front with numpy
+#   (captures and promotions lead into smaller tables, which are generated first)
+#   then the result is worked backwards from the mates:
+#       ply 0: no legal moves and in check -> lost, no legal moves otherwise -> stalemate
+#       ply n: a move reaching a position lost in n-1 -> won in n
+#              every move reaching a won position -> lost in n
+#   until a ply finds nothing new, everything still unresolved is a draw
+
+# FILES:
+#   <name>.wdl.npy: int8, WIN / DRAW / LOSS / BROKEN for the side to move
+#   <name>.dtm.npy: uint8, plies to mate (0 for draws, and for the side that's already mated)
+#   plain .npy files so they open with np.load(mmap_mode="r") and cost nothing until probed
+
+# USAGE:
+#   python tablebase.py KQvK KRvK KPvK --dir tables
+
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from chess_game import ChessGame
+from attacks import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, bishop_attacks, rook_attacks, queen_attacks
+
+
+# results, from the side to move's point of view
+WIN = 1
+DRAW = 0
+LOSS = -1
+BROKEN = -2
+
+MAX_PIECES = 4
+
+PIECE_LETTERS = ".PNBRQK"
+
+# codes used while generating (one int16 per position)
+#   win in d plies -> d, loss in d plies -> _LOSS + d, draw -> 0
+_ILLEGAL = -32768
+_UNKNOWN = 32767
+_LOSS = -1000
+
+
+# (castling rights bit, king square, rook square) for every right, see ChessGame.castling_rights
+CASTLING_HOMES = ((1, 4, 7), (2, 4, 0), (4, 60, 63), (8, 60, 56))
+
+# a castling right the tables can't represent: set, with its king and rook still home
+# (for either side, and even if castling is blocked or in check for now, it can come back a move later)
+def _castling_alive(game: ChessGame) -> bool:
+
+    rights = game.castling_rights()
+    for bit, king, rook in CASTLING_HOMES:
+        if rights & bit:
+            sign = 1 if king == 4 else -1
+            if game.pieces(6 * sign) >> king & 1 and game.pieces(4 * sign) >> rook & 1:
+                return True
+    return False
+
+
+def _squares_of(mask) -> list:
+    squares = []
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        squares.append(bit.bit_length() - 1)
+    return squares
+
+
+# BOARD TABLES (as numpy arrays so whole tables of positions can be looked up at once)
+
+# ATTACKS[(piece type, color)][from_sq, to_sq] on an empty board, color 1 is white
+def _attack_matrices() -> dict:
+
+    sources = {
+        2: lambda sq, color: KNIGHT_ATTACKS[sq],
+        3: lambda sq, color: bishop_attacks(sq, 0),
+        4: lambda sq, color: rook_attacks(sq, 0),
+        5: lambda sq, color: queen_attacks(sq, 0),
+        6: lambda sq, color: KING_ATTACKS[sq],
+        1: lambda sq, color: PAWN_ATTACKS[color][sq],
+    }
+    matrices = {}
+    for piece, attacks in sources.items():
+        for color in (0, 1):
+            m = np.zeros((64, 64), dtype=bool)
+            for sq in range(64):
+                m[sq, _squares_of(attacks(sq, color))] = True
+            matrices[(piece, color)] = m
+    return matrices
+
+ATTACKS = _attack_matrices()
+BETWEEN_MASKS = np.array(BETWEEN, dtype=np.uint64)
+
+# kinds of move target
+_NORMAL = 0         # move or capture
+_PUSH = 1           # pawn push, target has to be empty
+_PAWN_CAPTURE = 2   # pawn capture, target has to hold an enemy piece
+
+# MOVES[(piece type, color)] = (targets, kinds), both (64, width) with -1 padding
+# double pushes need the skipped square empty, BETWEEN covers that the same way it covers sliders
+def _move_tables() -> dict:
+
+    tables = {}
+    for (piece, color), attacks in ATTACKS.items():
+        rows = []
+        for sq in range(64):
+            if piece != 1:
+                rows.append([(int(b), _NORMAL) for b in np.flatnonzero(attacks[sq])])
+                continue
+            rank = sq >> 3
+            if rank == 0 or rank == 7:
+                rows.append([])
+                continue
+            step = 8 if color else -8
+            row = [(sq + step, _PUSH)]
+            if rank == (1 if color else 6):
+                row.append((sq + 2 * step, _PUSH))
+            row += [(int(b), _PAWN_CAPTURE) for b in np.flatnonzero(attacks[sq])]
+            rows.append(row)
+
+        width = max(len(row) for row in rows)
+        targets = np.full((64, width), -1, dtype=np.int64)
+        kinds = np.zeros((64, width), dtype=np.int8)
+        for sq, row in enumerate(rows):
+            for k, (target, kind) in enumerate(row):
+                targets[sq, k] = target
+                kinds[sq, k] = kind
+        tables[(piece, color)] = (targets, kinds)
+    return tables
+
+MOVES = _move_tables()
+
+
+# SYMMETRY:
+#   SYMMETRIES[t][sq] maps a square through one of the 8 board symmetries
+#   t = transpose * 4 + mirror files * 2 + mirror ranks, so 0 is the identity and 2 mirrors left-right
+def _symmetries():
+
+    maps = np.zeros((8, 64), dtype=np.int64)
+    for t in range(8):
+        for sq in range(64):
+            f, r = sq & 7, sq >> 3
+            if t & 4:
+                f, r = r, f
+            if t & 2:
+                f = 7 - f
+            if t & 1:
+                r = 7 - r
+            maps[t, sq] = r * 8 + f
+    return maps
+
+SYMMETRIES = _symmetries()
+
+# for tables without (index 0) and with (index 1) pawns:
+#   KING_SQUARES: squares the white king is moved onto, one per slot
+#   KING_SLOTS[sq]: slot of a square in KING_SQUARES (-1 otherwise)
+#   KING_SYMMETRY[sq]: the symmetry that moves a white king on sq into KING_SQUARES
+def _king_tables(pawns):
+
+    if pawns:
+        squares = [sq for sq in range(64) if sq & 7 <= 3]
+        choices = (0, 2)
+    else:
+        squares = [sq for sq in range(64) if sq & 7 <= 3 and sq >> 3 <= sq & 7]
+        choices = range(8)
+
+    slots = np.full(64, -1, dtype=np.int64)
+    slots[squares] = np.arange(len(squares))
+    symmetry = np.zeros(64, dtype=np.int64)
+    for sq in range(64):
+        symmetry[sq] = next(t for t in choices if slots[SYMMETRIES[t, sq]] >= 0)
+    return squares, slots, symmetry
+
+KING_TABLES = (_king_tables(False), _king_tables(True))
+
+
+# MATERIAL:
+#   a side is a tuple of piece types strongest first, i.e. (6, 5) for king and queen
+
+def material_name(white, black) -> str:
+    return "".join(PIECE_LETTERS[p] for p in white) + "v" + "".join(PIECE_LETTERS[p] for p in black)
+
+# "KQvK" (or "KQK") -> ((6, 5), (6,))
+def parse_material(name: str):
+
+    name = name.upper()
+    if "V" in name:
+        white, black = name.split("V")
+    else:
+        split = name.index("K", 1)
+        white, black = name[:split], name[split:]
+
+    white = tuple(sorted((PIECE_LETTERS.index(c) for c in white), reverse=True))
+    black = tuple(sorted((PIECE_LETTERS.index(c) for c in black), reverse=True))
+    if white[:1] != (6,) or black[:1] != (6,) or 6 in white[1:] + black[1:]:
+        raise ValueError(f"not a valid endgame: {name}")
+    return white, black
+
+# (white, black, flipped): stronger side as white
+def canonical_material(white, black):
+    if black > white:
+        return black, white, True
+    return white, black, False
+
+
+# piece layout of one table and its index function
+class TableLayout:
+
+    def __init__(self, white, black):
+
+        self.white = white
+        self.black = black
+        self.name = material_name(white, black)
+        self.types = white + black
+        self.colors = (1,) * len(white) + (0,) * len(black)
+        self.pieces = len(self.types)
+
+        self.king_squares, self.king_slots, self.king_symmetry = KING_TABLES[1 in self.types]
+        self.stride = 64 ** (self.pieces - 1)
+        self.half = len(self.king_squares) * self.stride
+        self.size = 2 * self.half
+
+    # index of positions given every piece's square (numpy arrays or ints, in layout order)
+    # side: 0 white to move, 1 black to move
+    def index(self, squares, side):
+
+        t = self.king_symmetry[squares[0]]
+        index = side * self.half + self.king_slots[SYMMETRIES[t, squares[0]]] * self.stride
+        for i in range(1, self.pieces):
+            index = index + SYMMETRIES[t, squares[i]] * 64 ** (self.pieces - 1 - i)
+        return index
+
+    # squares of every piece for every position in one half of the table
+    def positions(self) -> list:
+
+        rest = np.arange(self.half, dtype=np.int64)
+        squares = [None] * self.pieces
+        for i in range(self.pieces - 1, 0, -1):
+            squares[i] = rest % 64
+            rest = rest // 64
+        squares[0] = np.asarray(self.king_squares, dtype=np.int64)[rest]
+        return squares
+
+
+# GENERATION
+
+# whether each position is possible with `side` to move:
+# no shared squares, no pawns on the back ranks, and the side that just moved isn't in check
+def _legal(layout: TableLayout, squares, side):
+
+    n = layout.pieces
+    legal = np.ones(len(squares[0]), dtype=bool)
+    for i in range(n):
+        for j in range(i + 1, n):
+            legal &= squares[i] != squares[j]
+        if layout.types[i] == 1:
+            rank = squares[i] >> 3
+            legal &= (rank != 0) & (rank != 7)
+
+    mover = 1 - side
+    king = layout.colors.index(1 - mover)
+    for i in range(n):
+        if layout.colors[i] != mover:
+            continue
+        attacked = ATTACKS[(layout.types[i], mover)][squares[i], squares[king]]
+        between = BETWEEN_MASKS[squares[i], squares[king]]
+        for j in range(n):
+            if j != i and j != king:
+                attacked &= ((between >> squares[j].astype(np.uint64)) & np.uint64(1)) == 0
+        legal &= ~attacked
+    return legal
+
+
+# every material balance a move can lead to (captures, promotions, both), as canonical names
+def _successor_materials(layout: TableLayout) -> set:
+
+    names = set()
+    for i, (piece, color) in enumerate(zip(layout.types, layout.colors)):
+        promotions = (None, 2, 3, 4, 5) if piece == 1 else (None,)
+        captures = [None] + [j for j in range(layout.pieces) if layout.colors[j] != color and layout.types[j] != 6]
+        for promotion in promotions:
+            for captured in captures:
+                types, colors = _after(layout, i, promotion, captured)
+                white = tuple(sorted((t for t, c in zip(types, colors) if c), reverse=True))
+                black = tuple(sorted((t for t, c in zip(types, colors) if not c), reverse=True))
+                white, black, _ = canonical_material(white, black)
+                names.add(material_name(white, black))
+    return names
+
+# piece types and colors after piece i moves (maybe promoting) and piece `captured` is taken
+def _after(layout: TableLayout, i, promotion, captured):
+    types = list(layout.types)
+    if promotion is not None:
+        types[i] = promotion
+    keep = [k for k in range(layout.pieces) if k != captured]
+    return [types[k] for k in keep], [layout.colors[k] for k in keep]
+
+
+# turns any set of (type, color, squares) after a move into indexes into the combined value array
+class _Locator:
+
+    def __init__(self, offsets: dict):
+        self.offsets = offsets
+        self.layouts = {}
+
+    def __call__(self, types, colors, squares, side):
+
+        white = sorted(((t, s) for t, c, s in zip(types, colors, squares) if c), key=lambda p: -p[0])
+        black = sorted(((t, s) for t, c, s in zip(types, colors, squares) if not c), key=lambda p: -p[0])
+        white_types = tuple(t for t, _ in white)
+        black_types = tuple(t for t, _ in black)
+
+        if black_types > white_types:
+            white, black = [(t, s ^ 56) for t, s in black], [(t, s ^ 56) for t, s in white]
+            white_types, black_types = black_types, white_types
+            side ^= 1
+
+        name = material_name(white_types, black_types)
+        if name not in self.layouts:
+            self.layouts[name] = TableLayout(white_types, black_types)
+        layout = self.layouts[name]
+        return self.offsets[name] + layout.index([s for _, s in white + black], side)
+
+
+# indexes (into the combined value array) of the position after every possible move,
+# one array per (piece, target column, promotion) with `sentinel` where there's no such move
+def _successors(layout: TableLayout, squares, side, locate: _Locator, sentinel) -> list:
+
+    n = layout.pieces
+    mover = 1 - side
+    slots = []
+
+    for i in range(n):
+        if layout.colors[i] != mover:
+            continue
+        piece = layout.types[i]
+        targets, kinds = MOVES[(piece, mover)]
+
+        for k in range(targets.shape[1]):
+            target = targets[squares[i], k]
+            kind = kinds[squares[i], k]
+            ok = target >= 0
+            target = np.where(ok, target, 0)
+
+            # path has to be clear, the target can't hold our own piece or a king
+            between = BETWEEN_MASKS[squares[i], target]
+            captured = {}
+            any_capture = np.zeros(len(target), dtype=bool)
+            for j in range(n):
+                if j == i:
+                    continue
+                ok &= ((between >> squares[j].astype(np.uint64)) & np.uint64(1)) == 0
+                hit = squares[j] == target
+                if layout.colors[j] == mover or layout.types[j] == 6:
+                    ok &= ~hit
+                else:
+                    captured[j] = hit
+                    any_capture |= hit
+
+            if piece == 1:
+                ok &= ~((kind == _PUSH) & any_capture)
+                ok &= ~((kind == _PAWN_CAPTURE) & ~any_capture)
+                promoting = (target >> 3) == (7 if mover else 0)
+                options = ((None, ~promoting), (5, promoting), (4, promoting), (3, promoting), (2, promoting))
+            else:
+                options = ((None, True),)
+
+            for promotion, allowed in options:
+                result = np.full(len(target), sentinel, dtype=np.int64)
+
+                for j in [None] + list(captured):
+                    mask = ok & allowed & (~any_capture if j is None else captured[j])
+                    if not mask.any():
+                        continue
+                    moved = list(squares)
+                    moved[i] = target
+                    types, colors = _after(layout, i, promotion, j)
+                    kept = [moved[m] for m in range(n) if m != j]
+                    result = np.where(mask, locate(types, colors, kept, side ^ 1), result)
+
+                if (result != sentinel).any():
+                    slots.append(result)
+
+    return slots
+
+
+# value codes for a finished table
+def _codes(wdl, dtm):
+    dtm = dtm.astype(np.int16)
+    codes = np.zeros(len(wdl), dtype=np.int16)
+    codes[wdl == WIN] = dtm[wdl == WIN]
+    codes[wdl == LOSS] = _LOSS + dtm[wdl == LOSS]
+    codes[wdl == BROKEN] = _ILLEGAL
+    return codes
+
+
+def table_paths(directory, name):
+    return os.path.join(directory, f"{name}.wdl.npy"), os.path.join(directory, f"{name}.dtm.npy")
+
+
+# generate one table (and every smaller table it depends on) into directory
+# tables already on disk are left alone, returns the canonical name
+def generate(material: str, directory, verbose = False) -> str:
+
+    white, black, _ = canonical_material(*parse_material(material))
+    layout = TableLayout(white, black)
+    if layout.pieces > MAX_PIECES:
+        raise ValueError(f"{layout.name} has more than {MAX_PIECES} pieces")
+
+    wdl_path, dtm_path = table_paths(directory, layout.name)
+    if os.path.exists(wdl_path) and os.path.exists(dtm_path):
+        return layout.name
+    os.makedirs(directory, exist_ok=True)
+
+    start = time.perf_counter()
+    dependencies = sorted(_successor_materials(layout) - {layout.name})
+    for name in dependencies:
+        generate(name, directory, verbose)
+
+    # one array holding this table and every table a move can reach, plus a "no move" sentinel
+    # so a single gather reads any successor's value
+    offsets = {layout.name: 0}
+    parts = [np.zeros(layout.size, dtype=np.int16)]
+    size = layout.size
+    for name in dependencies:
+        wdl_file, dtm_file = table_paths(directory, name)
+        offsets[name] = size
+        parts.append(_codes(np.load(wdl_file, mmap_mode="r"), np.load(dtm_file, mmap_mode="r")))
+        size += len(parts[-1])
+    parts.append(np.array([_ILLEGAL], dtype=np.int16))
+    values = np.concatenate(parts)
+    sentinel = size
+
+    external = values[layout.size:sentinel]
+    longest = int(max(
+        external[(external > 0) & (external != _UNKNOWN)].max(initial=0),
+        (external[(external < 0) & (external != _ILLEGAL)] - _LOSS).max(initial=0),
+    ))
+
+    squares = layout.positions()
+    halves = [slice(0, layout.half), slice(layout.half, layout.size)]
+    for side in (0, 1):
+        values[halves[side]] = np.where(_legal(layout, squares, side), _UNKNOWN, _ILLEGAL)
+
+    locate = _Locator(offsets)
+    successors = [_successors(layout, squares, side, locate, sentinel) for side in (0, 1)]
+
+    # ply 0: checkmate and stalemate
+    for side in (0, 1):
+        own = values[halves[side]]
+        other = values[halves[1 - side]]
+        has_move = np.zeros(layout.half, dtype=bool)
+        for slot in successors[side]:
+            has_move |= values[slot] != _ILLEGAL
+        stuck = (own == _UNKNOWN) & ~has_move
+        # the same squares with the other side to move are broken exactly when the side to move is in check
+        own[stuck & (other == _ILLEGAL)] = _LOSS
+        own[stuck & (other != _ILLEGAL)] = 0
+
+    # ply n: work backwards from the mates
+    ply = 1
+    while True:
+        updates = []
+        for side in (0, 1):
+            own = values[halves[side]]
+            unknown = own == _UNKNOWN
+            if not unknown.any():
+                continue
+            wins = np.zeros(layout.half, dtype=bool)
+            all_lose = unknown.copy()
+            for slot in successors[side]:
+                v = values[slot]
+                wins |= v == _LOSS + ply - 1
+                all_lose &= (v == _ILLEGAL) | ((v > 0) & (v != _UNKNOWN))
+            updates.append((side, unknown & wins, unknown & all_lose & ~wins))
+
+        found = 0
+        for side, wins, losses in updates:
+            own = values[halves[side]]
+            own[wins] = ply
+            own[losses] = _LOSS + ply
+            found += int(wins.sum() + losses.sum())
+
+        if found == 0 and ply > longest + 1:
+            break
+        ply += 1
+
+    codes = values[:layout.size]
+    wdl = np.full(layout.size, DRAW, dtype=np.int8)
+    dtm = np.zeros(layout.size, dtype=np.uint8)
+    won = (codes > 0) & (codes != _UNKNOWN)
+    lost = (codes < 0) & (codes != _ILLEGAL)
+    wdl[won] = WIN
+    wdl[lost] = LOSS
+    wdl[codes == _ILLEGAL] = BROKEN
+    dtm[won] = codes[won]
+    dtm[lost] = codes[lost] - _LOSS
+
+    np.save(wdl_path, wdl)
+    np.save(dtm_path, dtm)
+
+    if verbose:
+        print(
+            f"{layout.name}: {layout.size} positions, {int(won.sum())} won, {int(lost.sum())} lost, "
+            f"longest mate {int(dtm.max())} plies, {time.perf_counter() - start:.2f}s"
+        )
+    return layout.name
+
+
+# PROBING
+
+class Tablebase:
+
+    # every table found in directory is available, nothing is read until it's probed
+    def __init__(self, directory):
+
+        self.directory = directory
+        self.tables = {}
+        self.available = set()
+        for file in os.listdir(directory):
+            if file.endswith(".wdl.npy"):
+                name = file[:-len(".wdl.npy")]
+                if os.path.exists(table_paths(directory, name)[1]):
+                    self.available.add(name)
+
+        self.max_pieces = max((len(name) - 1 for name in self.available), default=0)
+
+    def _table(self, name):
+        if name not in self.tables:
+            wdl_path, dtm_path = table_paths(self.directory, name)
+            white, black = parse_material(name)
+            self.tables[name] = (
+                TableLayout(white, black),
+                np.load(wdl_path, mmap_mode="r"),
+                np.load(dtm_path, mmap_mode="r"),
+            )
+        return self.tables[name]
+
+    # (wdl, dtm) for the side to move, None if the position isn't covered
+    # (no table for the material, or a live castling right or en passant square, which the tables leave out)
+    def probe(self, game: ChessGame):
+
+        if game.occupied.bit_count() > self.max_pieces or game.en_passant is not None or _castling_alive(game):
+            return None
+
+        white = []
+        black = []
+        for p in range(6, 0, -1):
+            white += [(p, sq) for sq in _squares_of(game.bitboards[p + 6])]
+            black += [(p, sq) for sq in _squares_of(game.bitboards[6 - p])]
+        white_types = tuple(p for p, _ in white)
+        black_types = tuple(p for p, _ in black)
+        side = 0 if game.white_to_move else 1
+
+        white_types, black_types, flipped = canonical_material(white_types, black_types)
+        if flipped:
+            white, black = [(p, sq ^ 56) for p, sq in black], [(p, sq ^ 56) for p, sq in white]
+            side ^= 1
+
+        name = material_name(white_types, black_types)
+        if name not in self.available:
+            return None
+
+        layout, wdl, dtm = self._table(name)
+        i = int(layout.index([sq for _, sq in white + black], side))
+        return int(wdl[i]), int(dtm[i])
+
+    # the fastest win / longest loss: (move, wdl, dtm) for the current position, None if not covered
+    def best_move(self, game: ChessGame):
+
+        here = self.probe(game)
+        if here is None:
+            return None
+
+        best = None
+        best_rank = None
+        for move in game.generate_moves():
+            game.make_move(move)
+            after = self.probe(game)
+            game.unmake_move()
+            if after is None:
+                continue
+
+            # what the move is worth to us: win fast, draw, or lose slowly
+            wdl, dtm = after
+            rank = (-wdl, -dtm if wdl == LOSS else dtm)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+
+        if best is None:
+            return None
+        return best, here[0], here[1]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="generate endgame tablebases")
+    parser.add_argument("materials", nargs="+", help="endgames like KQvK KRvK KPvK")
+    parser.add_argument("--dir", default="tables")
+    args = parser.parse_args()
+
+    for material in args.materials:
+        generate(material, args.dir, verbose=True)
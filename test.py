@@ -1,5 +1,29 @@
-from chess_game import ChessMove, ChessGame
+from chess_game import ChessMove, ChessGame, FastMove, move_to_uci, START_FEN
+from attacks import KNIGHT_ATTACKS, KING_ATTACKS, RANK_MASKS
+from batch import parse_moves, validate_moves, PIECE_CODES
+from pgn_reader import read_pgn, parse_movetext
+from replay import replay_game, replay_games, summarize
+from perft import REFERENCE_POSITIONS, reference_game, perft, divide
+from transposition import TranspositionTable, EXACT, LOWER
+from search import Searcher, MATE, MAX_PLY
+from evaluation import evaluate
+from parallel_search import ParallelSearcher, _search_worker
+from opening_book import OpeningBook, build_book_from_pgn
+from tablebase import Tablebase, table_paths, WIN, DRAW, LOSS, BROKEN
+from tablebase import generate as generate_tablebase
+from review import Reviewer, to_packed
+from position_index import PositionIndex
+from archive import archive_pgn, append_archive, read_archive, RESULT_WHITE, RESULT_BLACK, RESULT_DRAW
+from server import GameServer
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import pickle
+import queue
 import numpy as np
+import os
+import random
+import tempfile
 
 # ================== PAWN TESTS ====================
 
@@ -575,6 +599,1392 @@ def test_rook_blocked_capture():
     return True
 
 
+# ================== BITBOARD TESTS ====================
+
+def test_bitboards_initial():
+
+    game = ChessGame()
+
+    # white pawns fill rank 2, black king sits on e8
+    if game.pieces(1) != 0xFF00 or game.pieces(-6) != 1 << 60 or game.occupied != 0xFFFF00000000FFFF:
+        print("TEST BITBOARDS INITIAL FAILED")
+        return False
+    return True
+
+
+def test_bitboards_set_square():
+
+    game = ChessGame()
+
+    # move the e pawn to e4 by hand
+    game.set_square(4, 1, 0)
+    game.set_square(4, 3, 1)
+
+    e2 = 1 << 12
+    e4 = 1 << 28
+    if (game.pieces(1) & e2) or not (game.pieces(1) & e4) or (game.occupied & e2) or not (game.occupancy[1] & e4):
+        print("TEST BITBOARDS SET SQUARE FAILED")
+        return False
+
+    # bitboards built from scratch should match the incremental ones
+    bitboards = list(game.bitboards)
+    game.sync_bitboards()
+    if bitboards != game.bitboards:
+        print("TEST BITBOARDS SET SQUARE FAILED")
+        return False
+    return True
+
+
+def test_pawn_black_capture():
+
+    board = np.array([
+            [4, 2, 3, 5, 6, 3, 2, 4],
+            [1, 1, 1, 1, 0, 1, 1, 1],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 1, 0, 0, 0],
+            [0, 0, 0, -1, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [-1, -1, -1, 0, -1, -1, -1, -1],
+            [-4, -2, -3, -5, -6, -3, -2, -4]
+        ])
+
+    game = ChessGame(board)
+
+    move = "2." + "dxe4"
+    m = ChessMove(move=move, is_white = False)
+    if not game.validate_move(m):
+        print("TEST PAWN BLACK CAPTURE FAILED")
+        return False
+    return True
+
+
+# ================== ATTACK TABLE TESTS ====================
+
+def test_attack_tables():
+
+    # knight in the corner has 2 moves, in the middle it has 8
+    # king in the corner has 3 moves, on the edge 5, in the middle 8
+    a1, e1, d4 = 0, 4, 27
+    if (
+        bin(KNIGHT_ATTACKS[a1]).count("1") != 2 or bin(KNIGHT_ATTACKS[d4]).count("1") != 8
+        or bin(KING_ATTACKS[a1]).count("1") != 3 or bin(KING_ATTACKS[e1]).count("1") != 5
+        or bin(KING_ATTACKS[d4]).count("1") != 8
+    ):
+        print("TEST ATTACK TABLES FAILED")
+        return False
+    return True
+
+
+def test_king_too_far():
+
+    board = np.array([
+            [4, 2, 3, 5, 6, 0, 0, 4],
+            [1, 1, 1, 1, 1, 1, 1, 1],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [-1, -1, -1, -1, -1, -1, -1, -1],
+            [-4, -2, -3, -5, -6, -3, -2, -4]
+        ])
+
+    game = ChessGame(board)
+
+    # g1 is two files away from the king on e1
+    move = "1." + "Kg1"
+    m = ChessMove(move=move, is_white = True)
+
+    if game.validate_move(m):
+        print("TEST KING TOO FAR FAILED")
+        return False
+    return True
+
+
+# ================== SLIDER TESTS ====================
+
+def test_queen_move():
+
+    board = np.array([
+            [4, 2, 3, 5, 6, 3, 2, 4],
+            [1, 1, 1, 0, 1, 1, 1, 1],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [-1, -1, -1, -1, -1, -1, -1, -1],
+            [-4, -2, -3, -5, -6, -3, -2, -4]
+        ])
+
+    game = ChessGame(board)
+
+    # straight up the open d file, then diagonal is blocked by the c pawn
+    if not game.validate_move(ChessMove(move="1.Qd5", is_white = True)):
+        print("TEST QUEEN MOVE FAILED")
+        return False
+    if game.validate_move(ChessMove(move="1.Qa4", is_white = True)):
+        print("TEST QUEEN MOVE FAILED")
+        return False
+    return True
+
+
+def test_rook_blocked_on_rank():
+
+    board = np.array([
+            [4, 0, 5, 0, 6, 3, 2, 4],
+            [0, 1, 1, 1, 1, 1, 1, 1],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [-1, -1, -1, -1, -1, -1, -1, -1],
+            [-4, -2, -3, -5, -6, -3, -2, -4]
+        ])
+
+    game = ChessGame(board)
+
+    # queen on c1 is in the way of the a1 rook
+    if game.validate_move(ChessMove(move="1.Rd1", is_white = True)):
+        print("TEST ROOK BLOCKED ON RANK FAILED")
+        return False
+    if not game.validate_move(ChessMove(move="1.Rb1", is_white = True)):
+        print("TEST ROOK BLOCKED ON RANK FAILED")
+        return False
+    return True
+
+
+def test_is_attacked():
+
+    game = ChessGame()
+
+    # f3 is covered by the g1 knight and e2/g2 pawns, e4 by nobody yet
+    if not game.is_attacked(5, 2, True) or game.is_attacked(4, 3, True) or game.is_attacked(4, 3, False):
+        print("TEST IS ATTACKED FAILED")
+        return False
+
+    # open the e file and put a black rook on it
+    game.set_square(4, 1, 0)
+    game.set_square(4, 6, -4)
+    if not game.is_attacked(4, 0, False):
+        print("TEST IS ATTACKED FAILED")
+        return False
+    return True
+
+
+# ================== FAST PARSER TESTS ====================
+
+def test_parse_fast_matches():
+
+    # every kind of move from the notation notes, for both colors
+    moves = [
+        "1.b4", "1.Nb3", "7.Bdb2", "9.B3b2", "4.bxc6", "6.Bxg7", "8.Kdxf5",
+        "5.0-0", "5.0-0-0", "5.0-0+", "3.Bc6+", "12.Qxf7#", "2.e4+", "10.R1xa3",
+        "30.e8=Q", "31.dxc1=N+",
+    ]
+
+    # promotions only parse for the color whose last rank they reach, both parsers have to agree on that
+    for is_white in (True, False):
+        for move in moves:
+            try:
+                slow = ChessMove(move=move, is_white = is_white)
+            except ValueError:
+                slow = None
+            try:
+                fast = ChessMove.parse_fast(move, is_white)
+            except ValueError:
+                fast = None
+            rejected = move == ("31.dxc1=N+" if is_white else "30.e8=Q")
+            if (slow is None) != (fast is None) or (slow is None) != rejected:
+                print("TEST PARSE FAST MATCHES FAILED", move)
+                return False
+            if slow is None:
+                continue
+            for name in FastMove.__slots__:
+                if getattr(slow, name) != getattr(fast, name):
+                    print("TEST PARSE FAST MATCHES FAILED", move, name)
+                    return False
+    return True
+
+
+def test_parse_fast_cache():
+
+    # same string and color should hand back the cached object
+    a = ChessMove.parse_fast("1.Nf3", True)
+    b = ChessMove.parse_fast("1.Nf3", True)
+    c = ChessMove.parse_fast("1.Nf3", False)
+
+    if a is not b or a is c or c.is_white:
+        print("TEST PARSE FAST CACHE FAILED")
+        return False
+
+    # the move number isn't part of the cache key, a bad one is still an error
+    if ChessMove.parse_fast("23.Nf3", True) is not a or ChessMove.parse_san("Nf3", True) is not a:
+        print("TEST PARSE FAST CACHE FAILED")
+        return False
+    for bad in ("Nf3", "x.Nf3", "².Nf3", "1.Nf9", "2.xd5", "1.de4", "1.d2e4", "1.a7e4", "2.e4xd5", "1.Ke1e2", "1.Ng1f3"):
+        try:
+            ChessMove.parse_fast(bad, True)
+        except ValueError:
+            continue
+        print("TEST PARSE FAST CACHE FAILED")
+        return False
+
+    # promotions: only pawns, only onto the last rank, and the piece is required there
+    for bad, is_white in (("1.Nf3=Q", True), ("4.e4=Q", True), ("30.e8=Q", False), ("30.e1=Q", True),
+                          ("30.e8", True), ("30.dxe1", False), ("5.0-0=Q", True)):
+        for parse in (ChessMove.parse_fast, lambda m, w: ChessMove(move=m, is_white=w)):
+            try:
+                parse(bad, is_white)
+            except ValueError:
+                continue
+            print("TEST PARSE FAST CACHE FAILED", bad)
+            return False
+    if ChessMove.parse_fast("30.e1=Q", False).promotion != "Q":
+        print("TEST PARSE FAST CACHE FAILED")
+        return False
+
+    # and it should validate just like a ChessMove
+    if not ChessGame().validate_move(a):
+        print("TEST PARSE FAST CACHE FAILED")
+        return False
+    return True
+
+
+# ================== BATCH PARSE TESTS ====================
+
+def test_parse_moves():
+
+    moves = ["1.e4", "1.e5", "2.Nf3", "2.Nc6", "3.Bb5", "3.a6", "4.Bxc6", "4.dxc6", "5.0-0"]
+    parsed = parse_moves(moves)
+
+    # colors alternate and every column lines up with ChessMove
+    if list(parsed["is_white"]) != [True, False] * 4 + [True]:
+        print("TEST PARSE MOVES FAILED")
+        return False
+
+    for row, move in zip(parsed, moves):
+        m = ChessMove(move=move, is_white = bool(row["is_white"]))
+        if m.is_castle:
+            if not (row["is_castle"] and row["is_king_side"] and row["piece"] == 6):
+                print("TEST PARSE MOVES FAILED", move)
+                return False
+            continue
+        if (
+            row["number"] != m.number or row["file_idx"] != m.file_idx or row["rank_idx"] != m.rank_idx
+            or row["is_capture"] != m.is_capture or row["piece"] != PIECE_CODES[m.piece]
+            or row["starting_file_idx"] != (-1 if m.starting_file_idx is None else m.starting_file_idx)
+        ):
+            print("TEST PARSE MOVES FAILED", move)
+            return False
+    return True
+
+
+# ================== PGN READER TESTS ====================
+
+PGN_TEXT = """[Event "Club night"]
+[White "Drake"]
+[Black "Someone"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 {the usual} Nc6 3. Bb5 a6 (3... Nf6 4. O-O) 4. Bxc6 dxc6
+5. O-O f6?! $6 6. d4 1-0
+
+[Event "Club night"]
+[Result "0-1"]
+
+1. a4 e5 2. a5 e4 3. a6 e3 4. axb7 exd2+ 5. Kxd2 Bxb7 6. b4 Qg5+ 7. Ke1 Qxc1# 0-1
+"""
+
+def test_read_pgn():
+
+    path = os.path.join(tempfile.mkdtemp(), "games.pgn")
+    with open(path, "w") as f:
+        f.write(PGN_TEXT)
+
+    games = list(read_pgn(path))
+    if len(games) != 2 or games[0].headers["White"] != "Drake" or games[1].headers["Result"] != "0-1":
+        print("TEST READ PGN FAILED")
+        return False
+
+    # comments, variations and NAGs are gone, castles use zeros, numbers are shared by both colors
+    expected = [
+        "1.e4", "1.e5", "2.Nf3", "2.Nc6", "3.Bb5", "3.a6",
+        "4.Bxc6", "4.dxc6", "5.0-0", "5.f6", "6.d4",
+    ]
+    if games[0].moves != expected or games[1].moves[-1] != "7.Qxc1#":
+        print("TEST READ PGN FAILED")
+        return False
+
+    # everything should parse
+    for game in games:
+        for i, move in enumerate(game.moves):
+            ChessMove.parse_fast(move, i % 2 == 0)
+    return True
+
+
+def test_read_pgn_wrapped_comment():
+
+    path = os.path.join(tempfile.mkdtemp(), "games.pgn")
+    with open(path, "w") as f:
+        f.write('[Event "Blitz"]\n\n1. e4 { a comment that wraps\n[%clk 0:03:00] } 1... e5 2. Nf3 *\n\n')
+        f.write('[Event "Next"]\n\n1. d4 *\n')
+
+    games = list(read_pgn(path))
+    if len(games) != 2 or games[0].moves != ["1.e4", "1.e5", "2.Nf3"] or games[1].moves != ["1.d4"]:
+        print("TEST READ PGN WRAPPED COMMENT FAILED")
+        return False
+    return True
+
+def test_parse_movetext_numbers():
+
+    # numbers and colors come from the movetext, not from counting
+    if parse_movetext("12... Nf6 13. Bg5 Be7") != ["12.Nf6", "13.Bg5", "13.Be7"]:
+        print("TEST PARSE MOVETEXT NUMBERS FAILED")
+        return False
+
+    # a set up position with no numbers starts where its FEN says
+    path = os.path.join(tempfile.mkdtemp(), "games.pgn")
+    with open(path, "w") as f:
+        f.write('[SetUp "1"]\n[FEN "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 7"]\n\ne5 Nf3 *\n')
+    game = next(read_pgn(path))
+    if game.moves != ["7.e5", "8.Nf3"] or game.white_starts:
+        print("TEST PARSE MOVETEXT NUMBERS FAILED")
+        return False
+    return True
+
+
+# ================== REPLAY TESTS ====================
+
+def test_replay_game():
+
+    # Morphy's opera game: castles queen side, disambiguates Nbd7, ends in mate
+    moves = parse_movetext(
+        "1. e4 e5 2. Nf3 d6 3. d4 Bg4 4. dxe5 Bxf3 5. Qxf3 dxe5 6. Bc4 Nf6 7. Qb3 Qe7 "
+        "8. Nc3 c6 9. Bg5 b5 10. Nxb5 cxb5 11. Bxb5+ Nbd7 12. O-O-O Rd8 13. Rxd7 Rxd7 "
+        "14. Rd1 Qe6 15. Bxd7+ Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0"
+    )
+    result = replay_game(moves)
+
+    if not result.legal or result.plies != 33 or result.board[7, 3] != 4 or result.board[0, 2] != 6:
+        print("TEST REPLAY GAME FAILED")
+        return False
+    return True
+
+
+def test_replay_en_passant_promotion():
+
+    game = ChessGame()
+    moves = parse_movetext("1. e4 Nf6 2. e5 d5 3. exd6 e5 4. dxc7 Ke7 5. cxb8=Q Qe8 6. Qxa7")
+
+    for i, move in enumerate(moves):
+        if not game.validate_move(ChessMove.parse_fast(move, i % 2 == 0)):
+            print("TEST REPLAY EN PASSANT PROMOTION FAILED")
+            return False
+
+    # d5 pawn was taken en passant, queen ended up on a7
+    if game.get_square(3, 4) != 0 or game.get_square(0, 6) != 5 or game.white_to_move:
+        print("TEST REPLAY EN PASSANT PROMOTION FAILED")
+        return False
+    return True
+
+
+def test_replay_games_pool():
+
+    games = [
+        ["1.e4", "1.e5", "2.Nf3", "2.Nc6"],
+        ["1.e4", "1.e5", "2.Ke3"],
+        ["1.d4", "1.d5", "2.c4", "2.dxc4"],
+    ] * 5
+
+    results = list(replay_games(games, workers=2, chunksize=2))
+
+    if [r.game_id for r in results] != list(range(15)) or [r.legal for r in results] != [True, False, True] * 5:
+        print("TEST REPLAY GAMES POOL FAILED")
+        return False
+    if results[1].first_illegal_ply != 2 or summarize(results)["illegal"] != 5:
+        print("TEST REPLAY GAMES POOL FAILED")
+        return False
+    return True
+
+
+# ================== MOVE GENERATION TESTS ====================
+
+# "kiwipete", the standard move generator torture test (castles, pins, promotions, en passant)
+KIWIPETE = np.array([
+            [4, 0, 0, 0, 6, 0, 0, 4],
+            [1, 1, 1, 3, 3, 1, 1, 1],
+            [0, 0, 2, 0, 0, 5, 0, -1],
+            [0, -1, 0, 0, 1, 0, 0, 0],
+            [0, 0, 0, 1, 2, 0, 0, 0],
+            [-3, -2, 0, 0, -1, -2, -1, 0],
+            [-1, 0, -1, -1, -5, -1, -3, 0],
+            [-4, 0, 0, 0, -6, 0, 0, -4]
+        ])
+
+def test_generate_moves_start():
+
+    game = ChessGame()
+    moves = game.generate_moves()
+
+    # 16 pawn moves + 4 knight moves
+    if len(moves) != 20 or "e2e4" not in [move_to_uci(m) for m in moves]:
+        print("TEST GENERATE MOVES START FAILED")
+        return False
+    return True
+
+
+def test_generate_moves_kiwipete():
+
+    game = ChessGame(KIWIPETE.copy())
+    moves = [move_to_uci(m) for m in game.generate_moves()]
+
+    if len(moves) != 48 or "e1g1" not in moves or "e1c1" not in moves:
+        print("TEST GENERATE MOVES KIWIPETE FAILED")
+        return False
+
+    # after a2a4 the b4 pawn can take en passant
+    for m in game.generate_moves():
+        if move_to_uci(m) == "a2a4":
+            game.make_move(m)
+    black = [move_to_uci(m) for m in game.generate_moves()]
+    if "b4a3" not in black or len(black) != 44:
+        print("TEST GENERATE MOVES KIWIPETE FAILED")
+        return False
+    return True
+
+
+def test_generate_moves_pinned():
+
+    board = np.array([
+            [0, 0, 0, 0, 6, 0, 0, 0],
+            [0, 0, 0, 0, 2, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, -4, 0, 0, -6]
+        ])
+
+    game = ChessGame(board)
+    game.white_can_castle_k = game.white_can_castle_q = False
+
+    # the e2 knight is pinned by the e8 rook, so only the king can move (and not along the e file)
+    moves = [move_to_uci(m) for m in game.generate_moves()]
+    if sorted(moves) != ["e1d1", "e1d2", "e1f1", "e1f2"]:
+        print("TEST GENERATE MOVES PINNED FAILED")
+        return False
+    return True
+
+
+# ================== PERFT TESTS ====================
+
+def test_perft_reference():
+
+    # every reference position to depth 2 (depth 3 takes a while in python)
+    for name, (_, counts) in REFERENCE_POSITIONS.items():
+        if perft(reference_game(name), 2) != counts[1]:
+            print("TEST PERFT REFERENCE FAILED", name)
+            return False
+    return True
+
+
+def test_perft_divide():
+
+    counts = divide(reference_game("kiwipete"), 2)
+    if len(counts) != 48 or sum(counts.values()) != 2039 or counts["a2a4"] != 44:
+        print("TEST PERFT DIVIDE FAILED")
+        return False
+    return True
+
+
+# ================== HASHING TESTS ====================
+
+def play(game, moves):
+    for i, move in enumerate(moves):
+        if not game.validate_move(ChessMove.parse_fast(move, i % 2 == 0)):
+            return False
+    return True
+
+
+def test_zobrist_transpositions():
+
+    start = ChessGame()
+
+    # knights out and back is the start position again
+    a = ChessGame()
+    play(a, ["1.Nf3", "1.Nf6", "2.Ng1", "2.Ng8"])
+
+    # same position by two move orders
+    b = ChessGame()
+    play(b, ["1.e4", "1.e5", "2.Nf3", "2.Nc6"])
+    c = ChessGame()
+    play(c, ["1.Nf3", "1.Nc6", "2.e4", "2.e5"])
+
+    if a.hash != start.hash or b.hash != c.hash or b.hash == start.hash:
+        print("TEST ZOBRIST TRANSPOSITIONS FAILED")
+        return False
+
+    # and the incremental hash agrees with hashing from scratch
+    if b.hash != b.compute_hash():
+        print("TEST ZOBRIST TRANSPOSITIONS FAILED")
+        return False
+    return True
+
+
+def test_zobrist_state():
+
+    # same pieces, but black can only take en passant in the second game
+    a = ChessGame()
+    play(a, ["1.e4", "1.d5", "2.e5", "2.d4", "3.c4", "3.Nf6", "4.Nc3", "4.Ng8", "5.Nb1"])
+    b = ChessGame()
+    play(b, ["1.e4", "1.d5", "2.e5", "2.d4", "3.Nc3", "3.Nf6", "4.Nb1", "4.Ng8", "5.c4"])
+    if not (a.board == b.board).all() or a.en_passant is not None or b.en_passant != 18 or a.hash == b.hash:
+        print("TEST ZOBRIST STATE FAILED")
+        return False
+
+    # losing castling rights changes the hash
+    c = ChessGame()
+    play(c, ["1.Nf3", "1.Nf6", "2.Rg1", "2.Ng8", "3.Rh1", "3.Nf6", "4.Ng1", "4.Ng8"])
+    if c.hash == ChessGame().hash or c.hash != c.compute_hash():
+        print("TEST ZOBRIST STATE FAILED")
+        return False
+    return True
+
+
+def test_transposition_table():
+
+    table = TranspositionTable(1)
+    table.store(0xDEADBEEF, 123, -45, 6, EXACT)
+    if table.probe(0xDEADBEEF) != (123, -45, 6, EXACT) or table.probe(0xBEEF) is not None:
+        print("TEST TRANSPOSITION TABLE FAILED")
+        return False
+
+    # storing again without a move keeps the old best move
+    table.store(0xDEADBEEF, 0, 10, 7, LOWER)
+    if table.probe(0xDEADBEEF) != (123, 10, 7, LOWER):
+        print("TEST TRANSPOSITION TABLE FAILED")
+        return False
+
+    # a full bucket throws out its shallowest entry
+    keys = [5 + table.buckets * i for i in range(1, 6)]
+    for depth, key in enumerate(keys[:4]):
+        table.store(key, 1, 0, depth + 3, EXACT)
+    table.store(keys[4], 2, 0, 10, EXACT)
+    if table.probe(keys[0]) is not None or table.probe(keys[4]) is None or table.probe(keys[1]) is None:
+        print("TEST TRANSPOSITION TABLE FAILED")
+        return False
+    return True
+
+
+# ================== MAKE/UNMAKE TESTS ====================
+
+def test_make_unmake_restores():
+
+    # every kiwipete move (castles, promotions, captures) and every reply, then undo both
+    game = ChessGame(KIWIPETE.copy())
+    board = game.board.copy()
+    bitboards = list(game.bitboards)
+    state = (game.hash, game.castling_rights(), game.en_passant, game.white_to_move)
+
+    for move in game.generate_moves():
+        game.make_move(move)
+        for reply in game.generate_moves():
+            game.make_move(reply)
+            game.unmake_move()
+        game.unmake_move()
+
+        if (
+            not (game.board == board).all() or game.bitboards != bitboards
+            or (game.hash, game.castling_rights(), game.en_passant, game.white_to_move) != state
+            or game.moves or game.undo_stack
+        ):
+            print("TEST MAKE UNMAKE RESTORES FAILED", move_to_uci(move))
+            return False
+    return True
+
+
+def play_one(game, move, is_white):
+    return game.validate_move(ChessMove.parse_fast(move, is_white))
+
+
+def test_unmake_en_passant():
+
+    game = ChessGame()
+    play(game, ["1.e4", "1.Nf6", "2.e5", "2.d5"])
+    before = game.board.copy()
+    h = game.hash
+
+    # exd6 en passant, then take it back
+    if not play_one(game, "3.exd6", True) or game.get_square(3, 4) != 0:
+        print("TEST UNMAKE EN PASSANT FAILED")
+        return False
+    game.unmake_move()
+    if not (game.board == before).all() or game.hash != h or game.en_passant != 43:
+        print("TEST UNMAKE EN PASSANT FAILED")
+        return False
+    return True
+
+
+# ================== CHECK TESTS ====================
+
+def test_validate_check_pinned():
+
+    board = np.array([
+            [0, 0, 0, 0, 6, 0, 0, 0],
+            [0, 0, 0, 0, 2, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, -4, 0, 0, -6]
+        ])
+
+    game = ChessGame(board)
+
+    # the knight can't leave the e file, the king can't step onto it
+    if game.validate_move(ChessMove(move="1.Nc3", is_white = True)) or game.validate_move(ChessMove(move="1.Ke2", is_white = True)):
+        print("TEST VALIDATE CHECK PINNED FAILED")
+        return False
+    if game.pinned(True) != 1 << 12 or not game.validate_move(ChessMove(move="1.Kf1", is_white = True)):
+        print("TEST VALIDATE CHECK PINNED FAILED")
+        return False
+    return True
+
+
+def test_validate_check_evasions():
+
+    board = np.array([
+            [0, 2, 0, 0, 6, 0, 0, 0],
+            [0, 0, 0, 1, 0, 1, 0, 0],
+            [3, 0, 0, 0, 0, 0, 0, 0],
+            [0, -3, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, -6]
+        ])
+
+    # black bishop on b4 is lined up with the king on e1, but the d2 pawn is in the way (and pinned)
+    game = ChessGame(board)
+    if game.checkers(True) != 0 or game.pinned(True) != 1 << 11:
+        print("TEST VALIDATE CHECK EVASIONS FAILED")
+        return False
+
+    # take the pawn away: now it's check, and only blocking, capturing or moving the king is allowed
+    game.set_square(3, 1, 0)
+    if game.checkers(True) != 1 << 25:
+        print("TEST VALIDATE CHECK EVASIONS FAILED")
+        return False
+    moves = sorted(move_to_uci(m) for m in game.generate_moves())
+    if moves != ["a3b4", "b1c3", "b1d2", "e1d1", "e1e2", "e1f1"]:
+        print("TEST VALIDATE CHECK EVASIONS FAILED", moves)
+        return False
+    if game.validate_move(ChessMove(move="1.f3", is_white = True)):
+        print("TEST VALIDATE CHECK EVASIONS FAILED")
+        return False
+    return True
+
+
+def test_attack_map():
+
+    game = ChessGame()
+
+    # white covers ranks 2 and 3 (plus everything on rank 1 except the rook corners)
+    attacked = game.attack_map(True)
+    if attacked & RANK_MASKS[2] != RANK_MASKS[2] or attacked & RANK_MASKS[3] or attacked & 1:
+        print("TEST ATTACK MAP FAILED")
+        return False
+    return True
+
+
+# ================== BATCH VALIDATION TESTS ====================
+
+def test_validate_moves_batch():
+
+    # start position (twice, once without the d pawn) and kiwipete (twice)
+    def make_games():
+        games = [ChessGame(), ChessGame(), ChessGame(KIWIPETE.copy()), ChessGame(KIWIPETE.copy())]
+        games[1].set_square(3, 1, 0)
+        return games * 2
+
+    moves = ["1.e4", "1.Qd4", "1.Bxa6", "1.0-0", "1.e5", "1.Qd7", "1.Bxb5", "1.Nxf8"]
+    parsed = np.concatenate([parse_moves([move]) for move in moves])
+
+    # all at once, then one game at a time
+    valid = validate_moves(np.stack([game.board for game in make_games()]), parsed)
+    expected = [
+        game.copy().validate_move(ChessMove(move=move, is_white = True))
+        for game, move in zip(make_games(), moves)
+    ]
+
+    if list(valid) != expected or list(valid) != [True, True, True, True, False, False, False, False]:
+        print("TEST VALIDATE MOVES BATCH FAILED", list(valid), expected)
+        return False
+
+    # disambiguated moves only count the piece on the given file/rank, same as the piece validators
+    # (an ambiguous move still finds a piece, the validators don't decide which one moves)
+    cases = [
+        ("rnbqkbnr/pppppppp/8/8/8/5N2/PPP1PPPP/RNBQKB1R w KQkq - 0 1", ["1.Nbd2", "1.Nfd2", "1.N3d2", "1.Ncd2", "1.N2d2", "1.Nd2"]),
+        ("R7/8/7k/8/8/8/8/R3K3 w - - 0 1", ["1.R8a4", "1.R1a4", "1.R5a4", "1.Rba4", "1.Ra4"]),
+    ]
+    for fen, moves in cases:
+        parsed = np.concatenate([parse_moves([move]) for move in moves])
+        valid = validate_moves(np.stack([ChessGame.from_fen(fen).board] * len(moves)), parsed)
+        expected = []
+        for move in moves:
+            m = ChessMove(move=move, is_white = True)
+            game = ChessGame.from_fen(fen)
+            expected.append(game.validate_knight_move(m) if m.piece == "N" else game.validate_rook_move(m))
+        if list(valid) != expected or expected.count(False) != 2:
+            print("TEST VALIDATE MOVES BATCH FAILED", list(valid), expected)
+            return False
+    return True
+
+
+def test_search_mate_in_one():
+
+    # back rank: Ra8#
+    board = np.zeros((8, 8), dtype=int)
+    board[0, 0] = 4
+    board[0, 6] = 6
+    board[1, 5] = board[1, 6] = board[1, 7] = 1
+    board[7, 6] = -6
+    board[6, 5] = board[6, 6] = board[6, 7] = -1
+    game = ChessGame(board)
+
+    result = Searcher(tt_size_mb=1).search(game, max_depth=3)
+    if move_to_uci(result.best_move) != "a1a8" or result.score != MATE - 1:
+        print("TEST SEARCH MATE IN ONE FAILED")
+        return False
+    return True
+
+def test_search_hanging_piece():
+
+    # black queen on d5 with nothing defending it
+    board = np.zeros((8, 8), dtype=int)
+    board[0, 4] = 6
+    board[0, 3] = 4
+    board[7, 4] = -6
+    board[4, 3] = -5
+    board[6, 0] = -1
+    game = ChessGame(board)
+
+    result = Searcher(tt_size_mb=1).search(game, max_depth=3)
+    if move_to_uci(result.best_move) != "d1d5" or result.score < 400:
+        print("TEST SEARCH HANGING PIECE FAILED")
+        return False
+    return True
+
+def test_search_limits():
+
+    game = ChessGame(KIWIPETE.copy())
+    key = game.hash
+    board = game.board.copy()
+
+    # the node limit cuts the search off mid iteration, the position has to come back untouched
+    result = Searcher(tt_size_mb=1).search(game, node_limit=3000)
+    if result.nodes > 3000 + 1024 or result.best_move not in game.generate_moves():
+        print("TEST SEARCH LIMITS FAILED")
+        return False
+    if game.hash != key or not np.array_equal(game.board, board) or game.undo_stack:
+        print("TEST SEARCH LIMITS FAILED")
+        return False
+
+    result = Searcher(tt_size_mb=1).search(ChessGame(), time_limit=0.2)
+    if result.elapsed > 1.0 or result.depth < 1:
+        print("TEST SEARCH LIMITS FAILED")
+        return False
+
+    # a line extended past MAX_PLY can still fail high on a quiet move, there's just no killer to store
+    searcher = Searcher(tt_size_mb=1)
+    if searcher.negamax(ChessGame(), 1, -MATE, -MATE + 1, MAX_PLY) < -MATE + 1:
+        print("TEST SEARCH LIMITS FAILED")
+        return False
+    return True
+
+
+def test_eval_incremental():
+
+    game = ChessGame(KIWIPETE.copy())
+    start = (game.mg_score, game.eg_score, game.phase)
+
+    # play a few random lines, the running sums have to match a full recount every ply
+    rng = random.Random(7)
+    for _ in range(20):
+        played = 0
+        for _ in range(12):
+            moves = game.generate_moves()
+            if not moves:
+                break
+            game.make_move(rng.choice(moves))
+            played += 1
+            running = (game.mg_score, game.eg_score, game.phase)
+            game.sync_eval()
+            if running != (game.mg_score, game.eg_score, game.phase):
+                print("TEST EVAL INCREMENTAL FAILED")
+                return False
+        for _ in range(played):
+            game.unmake_move()
+
+    if (game.mg_score, game.eg_score, game.phase) != start:
+        print("TEST EVAL INCREMENTAL FAILED")
+        return False
+    return True
+
+def test_eval_symmetry():
+
+    game = ChessGame()
+    if evaluate(game) != 0 or game.phase != 24:
+        print("TEST EVAL SYMMETRY FAILED")
+        return False
+
+    # flipping the board and the colors should give the side to move the same score
+    mirrored = ChessGame(-KIWIPETE[::-1].copy())
+    mirrored.white_to_move = False
+    if evaluate(ChessGame(KIWIPETE.copy())) != evaluate(mirrored):
+        print("TEST EVAL SYMMETRY FAILED")
+        return False
+
+    # an extra queen is worth more than a pawn's worth of squares
+    board = np.zeros((8, 8), dtype=int)
+    board[0, 4] = 6
+    board[7, 4] = -6
+    board[3, 3] = 5
+    if evaluate(ChessGame(board)) < 900:
+        print("TEST EVAL SYMMETRY FAILED")
+        return False
+    return True
+
+
+def test_tt_torn_entry():
+
+    tt = TranspositionTable(1)
+    tt.store(12345, 77, 10, 3, EXACT)
+    tt.store(12345 + tt.buckets * 7, 88, -20, 5, LOWER)
+
+    # key word from one entry, data word from another (what a race between two writers leaves behind)
+    words = tt.words
+    i = (12345 & tt.mask) * 8
+    words[i + 1] = words[i + 3]
+    if tt.probe(12345) is not None or tt.probe(12345 + tt.buckets * 7) != (88, -20, 5, LOWER):
+        print("TEST TT TORN ENTRY FAILED")
+        return False
+    return True
+
+def test_parallel_search():
+
+    game = ChessGame(KIWIPETE.copy())
+    with ParallelSearcher(workers=2, tt_size_mb=1) as searcher:
+        result = searcher.search(game, max_depth=3)
+        again = searcher.search(game, max_depth=3)
+
+    if len(result.worker_nodes) != 2 or min(result.worker_nodes) == 0 or result.depth != 3:
+        print("TEST PARALLEL SEARCH FAILED")
+        return False
+    if result.best_move not in game.generate_moves() or again.best_move not in game.generate_moves():
+        print("TEST PARALLEL SEARCH FAILED")
+        return False
+
+    # the table is shared, so the second search should mostly be TT hits
+    if again.nodes >= result.nodes:
+        print("TEST PARALLEL SEARCH FAILED")
+        return False
+
+    # a worker that can't attach to the table still answers, with the error
+    results = queue.Queue()
+    _search_worker(0, game.copy(), "no_such_table_" + str(os.getpid()), 0, 2, None, None, None, results)
+    index, found, error = results.get_nowait()
+    if index != 0 or found is not None or "FileNotFoundError" not in error:
+        print("TEST PARALLEL SEARCH FAILED")
+        return False
+
+    # and when they all fail the parent raises instead of hanging (the table is gone after close)
+    try:
+        searcher.search(game, max_depth=2)
+    except RuntimeError as e:
+        if "FileNotFoundError" not in str(e):
+            print("TEST PARALLEL SEARCH FAILED")
+            return False
+    else:
+        print("TEST PARALLEL SEARCH FAILED")
+        return False
+    return True
+
+
+def test_opening_book():
+
+    path = os.path.join(tempfile.mkdtemp(), "games.pgn")
+    with open(path, "w") as f:
+        f.write(PGN_TEXT + "\n" + PGN_TEXT)
+    book_path = path + ".book"
+
+    # 4 games, e4 twice and a4 twice from the start, only the first 6 plies
+    if build_book_from_pgn(path, book_path, max_plies=6) != 12:
+        print("TEST OPENING BOOK FAILED")
+        return False
+
+    book = OpeningBook(book_path)
+    game = ChessGame()
+    start = sorted((move_to_uci(m), w) for m, w in book.probe(game))
+    if start != [("a2a4", 2), ("e2e4", 2)] or len(book) != 12:
+        print("TEST OPENING BOOK FAILED")
+        return False
+
+    # follow the book: after 1.e4 the only reply in it is e5
+    play(game, ["1.e4"])
+    if move_to_uci(book.best(game)) != "e7e5" or move_to_uci(book.choose(game)) != "e7e5":
+        print("TEST OPENING BOOK FAILED")
+        return False
+
+    # out of book
+    game = ChessGame()
+    play(game, ["1.e4", "1.e5", "2.Nf3", "2.Nc6", "3.Bb5", "3.a6", "4.Bxc6"])
+    if book.probe(game) or book.best(game) is not None:
+        print("TEST OPENING BOOK FAILED")
+        return False
+
+    # keys are sorted so searchsorted works
+    if not np.all(book.keys[:-1] <= book.keys[1:]):
+        print("TEST OPENING BOOK FAILED")
+        return False
+    return True
+
+
+TABLEBASE_DIR = None
+
+# the tables are generated once and shared by the tablebase tests
+def tablebase_dir():
+    global TABLEBASE_DIR
+    if TABLEBASE_DIR is None:
+        TABLEBASE_DIR = tempfile.mkdtemp()
+        for material in ("KQvK", "KRvK", "KPvK"):
+            generate_tablebase(material, TABLEBASE_DIR)
+    return TABLEBASE_DIR
+
+def test_tablebase_longest_mates():
+
+    # known longest mates: KQK 10 moves, KRK 16, KPK 28 (in plies for the side with the extra piece)
+    for name, plies in (("KQvK", 19), ("KRvK", 31), ("KPvK", 55)):
+        wdl_path, dtm_path = table_paths(tablebase_dir(), name)
+        wdl = np.load(wdl_path, mmap_mode="r")
+        dtm = np.load(dtm_path, mmap_mode="r")
+        if int(dtm[wdl == WIN].max()) != plies or int(dtm[wdl == LOSS].max()) != plies + 1:
+            print("TEST TABLEBASE LONGEST MATES FAILED")
+            return False
+    return True
+
+def test_tablebase_probe():
+
+    tb = Tablebase(tablebase_dir())
+
+    # rook pawn with the defending king in the corner is a draw whoever moves
+    board = np.zeros((8, 8), dtype=int)
+    board[0, 7] = 6
+    board[5, 0] = 1
+    board[7, 0] = -6
+    game = ChessGame(board)
+    if tb.probe(game) != (DRAW, 0):
+        print("TEST TABLEBASE PROBE FAILED")
+        return False
+
+    # black queen instead of a white one is looked up color flipped: Qb7 is mate
+    board = np.zeros((8, 8), dtype=int)
+    board[7, 0] = 6
+    board[5, 2] = -6
+    board[1, 1] = -5
+    game = ChessGame(board)
+    game.white_to_move = False
+    game.sync_hash()
+    if tb.probe(game) != (WIN, 1) or move_to_uci(tb.best_move(game)[0]) != "b2b7":
+        print("TEST TABLEBASE PROBE FAILED")
+        return False
+
+    # a castling right with its king and rook still home isn't in the tables, whoever has it
+    # and even while castling is blocked (the black king covers f1)
+    for fen in ("7k/8/8/8/8/8/8/4K2R b K - 0 1", "8/8/8/8/8/8/6k1/4K2R w K - 0 1"):
+        game = ChessGame.from_fen(fen)
+        if tb.probe(game) is not None or tb.probe(ChessGame.from_fen(fen.replace(" K ", " - "))) is None:
+            print("TEST TABLEBASE PROBE FAILED")
+            return False
+
+    # out of the tables
+    if tb.probe(ChessGame()) is not None:
+        print("TEST TABLEBASE PROBE FAILED")
+        return False
+
+    # every won/lost result agrees with the results one move later
+    rng = random.Random(3)
+    checked = 0
+    while checked < 100:
+        squares = rng.sample(range(64), 3)
+        board = np.zeros((8, 8), dtype=int)
+        for sq, piece in zip(squares, (6, 4, -6)):
+            board[sq >> 3, sq & 7] = piece
+        game = ChessGame(board)
+        game.white_to_move = rng.random() < 0.5
+        game.white_can_castle_k = game.white_can_castle_q = False
+        game.black_can_castle_k = game.black_can_castle_q = False
+        game.sync_hash()
+        result = tb.probe(game)
+        if result is None or result[0] == BROKEN:
+            continue
+        children = []
+        for move in game.generate_moves():
+            game.make_move(move)
+            children.append(tb.probe(game))
+            game.unmake_move()
+        wdl, dtm = result
+        if wdl == WIN and min(d for w, d in children if w == LOSS) != dtm - 1:
+            print("TEST TABLEBASE PROBE FAILED")
+            return False
+        if wdl == LOSS and (any(w != WIN for w, _ in children) or max((d for _, d in children), default=-1) != dtm - 1):
+            print("TEST TABLEBASE PROBE FAILED")
+            return False
+        checked += 1
+    return True
+
+def test_search_tablebase():
+
+    # KRK with the king off its start square (so no castling): solved at the root, no search needed
+    board = np.zeros((8, 8), dtype=int)
+    board[0, 3] = 6
+    board[0, 0] = 4
+    board[4, 4] = -6
+    game = ChessGame(board)
+    tb = Tablebase(tablebase_dir())
+    wdl, dtm = tb.probe(game)
+
+    searcher = Searcher(tt_size_mb=1, tablebase=tb)
+    result = searcher.search(game, max_depth=5)
+    if result.score != MATE - dtm or result.nodes != 0 or searcher.tb_hits != 1:
+        print("TEST SEARCH TABLEBASE FAILED")
+        return False
+
+    # the best move keeps the mate one ply shorter for the other side
+    game.make_move(result.best_move)
+    if tb.probe(game) != (LOSS, dtm - 1):
+        print("TEST SEARCH TABLEBASE FAILED")
+        return False
+    return True
+
+
+def test_review():
+
+    reviewer = Reviewer(depth=2, tt_size_mb=1)
+
+    # 3.Qxf7+ just gives the queen away
+    review = reviewer.review(to_packed(["1.e4", "1.e5", "2.Qh5", "2.Nc6", "3.Qxf7+", "3.Kxf7"]))
+    grades = [m.classification for m in review.moves]
+    if len(grades) != 6 or grades[4] != "blunder" or grades[5] != "best":
+        print("TEST REVIEW FAILED")
+        return False
+    if review.counts(True)["blunder"] != 1 or review.average_loss(True) <= review.average_loss(False):
+        print("TEST REVIEW FAILED")
+        return False
+
+    # the second game shares its first four positions with the first, so they come from the cache
+    searched = reviewer.positions_searched
+    reviewer.review(to_packed(["1.e4", "1.e5", "2.Qh5", "2.g6"]))
+    if reviewer.positions_searched - searched != 1 or reviewer.cache_hits != 4:
+        print("TEST REVIEW FAILED")
+        return False
+
+    # the second PGN game ends in "Qxc1#", which isn't mate, the queen just hangs to Qxc1
+    path = os.path.join(tempfile.mkdtemp(), "games.pgn")
+    with open(path, "w") as f:
+        f.write(PGN_TEXT)
+    reviews = list(reviewer.review_many(game.moves for game in read_pgn(path)))
+    if len(reviews) != 2 or len(reviews[1].moves) != 14 or reviews[1].moves[-1].classification != "blunder":
+        print("TEST REVIEW FAILED")
+        return False
+    return True
+
+
+def test_position_index():
+
+    directory = tempfile.mkdtemp()
+    index = PositionIndex(directory)
+    games = [
+        ["1.e4", "1.e5", "2.Nf3", "2.Nc6"],
+        ["1.Nf3", "1.Nc6", "2.e4", "2.e5"],
+        ["1.d4", "1.d5"],
+    ]
+    if index.add_games(games) != 3 or len(index) != 5 + 5 + 3:
+        print("TEST POSITION INDEX FAILED")
+        return False
+
+    # the first two games transpose into the same position at ply 4
+    game = ChessGame()
+    play(game, games[0])
+    if index.lookup(game.hash) != [(0, 4), (1, 4)] or index.games_reaching(ChessGame()) != [0, 1, 2]:
+        print("TEST POSITION INDEX FAILED")
+        return False
+
+    # appending writes a new segment and keeps numbering the games, reopening sees everything
+    index.add_games([["1.e4", "1.e5", "2.Nf3", "2.Nc6", "3.Bb5"]])
+    index = PositionIndex(directory)
+    if len(index.segments) != 2 or index.games_reaching(game) != [0, 1, 3]:
+        print("TEST POSITION INDEX FAILED")
+        return False
+
+    index.compact()
+    index = PositionIndex(directory)
+    if len(index.segments) != 1 or len(index) != 19 or index.games_reaching(game) != [0, 1, 3]:
+        print("TEST POSITION INDEX FAILED")
+        return False
+    if not np.all(index.segments[0].keys[:-1] <= index.segments[0].keys[1:]):
+        print("TEST POSITION INDEX FAILED")
+        return False
+    return True
+
+
+def test_archive():
+
+    path = os.path.join(tempfile.mkdtemp(), "games.pgn")
+    with open(path, "w") as f:
+        f.write(PGN_TEXT)
+    archive_path = path + ".arc"
+
+    if archive_pgn(path, archive_path) != 2:
+        print("TEST ARCHIVE FAILED")
+        return False
+
+    # 8 byte magic, then 4 bytes + 2 per ply for each game
+    games = list(read_archive(archive_path))
+    if os.path.getsize(archive_path) != 8 + (4 + 2 * 11) + (4 + 2 * 14):
+        print("TEST ARCHIVE FAILED")
+        return False
+    if [g.result for g in games] != [RESULT_WHITE, RESULT_BLACK] or [len(g.moves) for g in games] != [11, 14]:
+        print("TEST ARCHIVE FAILED")
+        return False
+
+    # decoding gives back the exact history and position (castles included)
+    original = ChessGame()
+    play(original, read_pgn(path).__next__().moves)
+    restored = games[0].to_game()
+    if restored.moves != original.moves or restored.hash != original.hash or not np.array_equal(restored.board, original.board):
+        print("TEST ARCHIVE FAILED")
+        return False
+
+    # appending keeps the earlier games
+    append_archive(archive_path, [(restored, RESULT_DRAW), ChessGame()])
+    games = list(read_archive(archive_path))
+    if len(games) != 4 or games[2].result != RESULT_DRAW or len(games[3].moves) != 0 or games[2].moves.tolist() != original.moves.tolist():
+        print("TEST ARCHIVE FAILED")
+        return False
+    return True
+
+
+def test_fen_round_trip():
+
+    if ChessGame.from_fen(START_FEN).to_fen() != START_FEN or ChessGame().to_fen() != START_FEN:
+        print("TEST FEN ROUND TRIP FAILED")
+        return False
+    if ChessGame.from_fen(START_FEN).hash != ChessGame().hash:
+        print("TEST FEN ROUND TRIP FAILED")
+        return False
+
+    for fen, _ in REFERENCE_POSITIONS.values():
+        if ChessGame.from_fen(fen).to_fen() != fen:
+            print("TEST FEN ROUND TRIP FAILED")
+            return False
+
+    # side to move, en passant and both counters all come through, and moves keep the counters going
+    fen = "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"
+    game = ChessGame.from_fen(fen)
+    if game.to_fen() != fen or "e5f6" not in [move_to_uci(m) for m in game.generate_moves()]:
+        print("TEST FEN ROUND TRIP FAILED")
+        return False
+
+    game = ChessGame()
+    play(game, ["1.e4", "1.e5", "2.Nf3", "2.Nc6"])
+    if game.to_fen() != "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3":
+        print("TEST FEN ROUND TRIP FAILED")
+        return False
+    game.unmake_move()
+    game.unmake_move()
+    if game.to_fen() != "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2":
+        print("TEST FEN ROUND TRIP FAILED")
+        return False
+
+    # same position reached by moves and by FEN hashes (and evaluates) the same
+    loaded = ChessGame.from_fen(game.to_fen())
+    if loaded.hash != game.hash or loaded.mg_score != game.mg_score or loaded.phase != game.phase:
+        print("TEST FEN ROUND TRIP FAILED")
+        return False
+    return True
+
+def test_fen_errors():
+
+    for fen in (
+        "",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+        "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQxq - 0 1",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e4 0 1",
+        # en passant square on the wrong side for the side to move, or with no pawn that just double pushed
+        "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e3 0 1",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e3 0 1",
+        "rnbqkbnr/pppp1ppp/8/4pP2/8/8/PPPPP1PP/RNBQKBNR w KQkq d6 0 1",
+        "rnbqkbnr/pppppppp/8/4pP2/8/8/PPPPP1PP/RNBQKBNR w KQkq e6 0 1",
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - zero 1",
+    ):
+        try:
+            ChessGame.from_fen(fen)
+        except ValueError:
+            continue
+        print("TEST FEN ERRORS FAILED")
+        return False
+    return True
+
+
+def test_server():
+
+    executor = ThreadPoolExecutor(1)
+
+    async def session():
+        server = GameServer(bot_time=0.05, executor=executor)
+        await server.start(port=0)
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        watcher_reader, watcher_writer = await asyncio.open_connection("127.0.0.1", server.port)
+
+        # replies to commands, skipping the updates pushed in between
+        async def ask(line, r = reader, w = writer):
+            w.write(line.encode() + b"\n")
+            while True:
+                message = json.loads(await r.readline())
+                if message["type"] != "update":
+                    return message
+
+        async def update(r = reader):
+            return json.loads(await r.readline())
+
+        try:
+            state = await ask("new")
+            game = state["game"]
+            watched = await ask(f"join {game}", watcher_reader, watcher_writer)
+            ack = await ask(f"move {game} e4")
+            mine, theirs = await update(), await update(watcher_reader)
+            illegal = await ask(f"move {game} e4")
+            uci = await ask(f"move {game} c7c5")
+            castle = [await ask(f"move {game} {m}") for m in ("Nf3", "Nc6", "Bb5", "e6", "O-O")]
+            bad_ids = [await ask(line) for line in ("state \u00b2", "move \u0661 e4", "join 1x", "leave -1", "state")]
+
+            bot_state = await ask("new black")
+            bot_update = await update()
+            return state, watched, ack, mine, theirs, illegal, uci, castle, bad_ids, bot_state, bot_update
+        finally:
+            writer.close()
+            watcher_writer.close()
+            await server.close()
+
+    state, watched, ack, mine, theirs, illegal, uci, castle, bad_ids, bot_state, bot_update = asyncio.run(session())
+
+    # the executor was passed in, so closing the server leaves it running
+    try:
+        still_running = executor.submit(int, "7").result() == 7
+    except RuntimeError:
+        still_running = False
+    executor.shutdown()
+    if not still_running:
+        print("TEST SERVER FAILED")
+        return False
+
+    if state["fen"] != START_FEN or watched["game"] != state["game"] or state["status"] != "active":
+        print("TEST SERVER FAILED")
+        return False
+    if ack["type"] != "ack" or ack["uci"] != "e2e4" or ack["ply"] != 1:
+        print("TEST SERVER FAILED")
+        return False
+
+    # both subscribers get the update
+    if mine != theirs or mine["type"] != "update" or mine["fen"] != "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1":
+        print("TEST SERVER FAILED")
+        return False
+    if illegal["type"] != "error" or uci["type"] != "ack" or uci["move"] != "c7c5":
+        print("TEST SERVER FAILED")
+        return False
+
+    # replies come back in order even with updates in between
+    if [r.get("uci") for r in castle if r["type"] == "ack"] != ["g1f3", "b8c6", "f1b5", "e7e6", "e1g1"]:
+        print("TEST SERVER FAILED")
+        return False
+
+    # game ids that aren't plain ascii numbers get an error reply, the connection carries on
+    if [r.get("error") for r in bad_ids] != ["no such game"] * 5:
+        print("TEST SERVER FAILED")
+        return False
+
+    # the bot plays white as soon as the game starts
+    if bot_state["bot"] != "white" or bot_update["ply"] != 1 or bot_update["game"] != bot_state["game"]:
+        print("TEST SERVER FAILED")
+        return False
+    return True
+
+
+def test_compact_storage():
+
+    game = ChessGame()
+    play(game, ["1.e4", "1.e5", "2.Nf3", "2.Nc6", "3.Bb5", "3.a6"])
+    if game.board.dtype != np.int8 or hasattr(game, "__dict__") or ChessGame(KIWIPETE.copy()).board.dtype != np.int8:
+        print("TEST COMPACT STORAGE FAILED")
+        return False
+
+    # hashes[i] is the position before moves[i]
+    replayed = ChessGame()
+    for i, move in enumerate(game.moves):
+        if game.hashes[i] != replayed.hash:
+            print("TEST COMPACT STORAGE FAILED")
+            return False
+        replayed.make_move(move)
+
+    # copies and pickles don't share history with the original
+    copy = game.copy()
+    copy.unmake_move()
+    restored = pickle.loads(pickle.dumps(game))
+    if len(game.moves) != 6 or len(copy.hashes) != 5 or restored.to_fen() != game.to_fen() or restored.moves != game.moves:
+        print("TEST COMPACT STORAGE FAILED")
+        return False
+    return True
+
+
+def test_attackers_to():
+
+    # knights on b1 and f3 can both reach the empty d2
+    fen = "rnbqkbnr/pppppppp/8/8/8/5N2/PPP1PPPP/RNBQKB1R w KQkq - 0 1"
+    game = ChessGame.from_fen(fen)
+    d2, e3 = 11, 20
+    if game.attackers_to(d2, True, 2) != (1 << 1) | (1 << 21) or game.attackers_to(d2, True, 5) != 1 << 3:
+        print("TEST ATTACKERS TO FAILED")
+        return False
+    if game.attackers_to(e3, True, 1) != 1 << 13 or game.attackers_to(d2, False, 2) != 0:
+        print("TEST ATTACKERS TO FAILED")
+        return False
+
+    # the disambiguation picks the knight, a file with no knight on it isn't a legal move
+    for notation, expected in (("1.Nbd2", "b1d2"), ("1.Nfd2", "f3d2"), ("1.N1d2", "b1d2"), ("1.N3d2", "f3d2")):
+        game = ChessGame.from_fen(fen)
+        if not game.validate_move(ChessMove.parse_fast(notation, True)) or move_to_uci(game.moves[-1]) != expected:
+            print("TEST ATTACKERS TO FAILED")
+            return False
+    game = ChessGame.from_fen(fen)
+    if game.validate_move(ChessMove.parse_fast("1.Ncd2", True)) or game.validate_knight_move(ChessMove.parse_fast("1.Ncd2", True)):
+        print("TEST ATTACKERS TO FAILED")
+        return False
+
+    # without the file or rank it's ambiguous, unless one of the knights is pinned
+    if game.validate_move(ChessMove.parse_fast("1.Nd2", True)) or game.moves:
+        print("TEST ATTACKERS TO FAILED")
+        return False
+    pinned = ChessGame.from_fen("4k3/8/8/8/8/8/8/1N2KN1r w - - 0 1")
+    if not pinned.validate_move(ChessMove.parse_fast("1.Nd2", True)) or move_to_uci(pinned.moves[-1]) != "b1d2":
+        print("TEST ATTACKERS TO FAILED")
+        return False
+    return True
+
+
 
 
 def tests():
@@ -616,8 +2026,109 @@ def tests():
     if not test_rook_bad_capture(): all_passed = False
     if not test_rook_blocked_capture(): all_passed = False
 
+    # BITBOARD TESTS
+    if not test_bitboards_initial(): all_passed = False
+    if not test_bitboards_set_square(): all_passed = False
+    if not test_pawn_black_capture(): all_passed = False
+
+    # ATTACK TABLE TESTS
+    if not test_attack_tables(): all_passed = False
+    if not test_king_too_far(): all_passed = False
+
+    # SLIDER TESTS
+    if not test_queen_move(): all_passed = False
+    if not test_rook_blocked_on_rank(): all_passed = False
+    if not test_is_attacked(): all_passed = False
+
+    # FAST PARSER TESTS
+    if not test_parse_fast_matches(): all_passed = False
+    if not test_parse_fast_cache(): all_passed = False
+
+    # BATCH PARSE TESTS
+    if not test_parse_moves(): all_passed = False
+
+    # PGN READER TESTS
+    if not test_read_pgn(): all_passed = False
+    if not test_read_pgn_wrapped_comment(): all_passed = False
+    if not test_parse_movetext_numbers(): all_passed = False
+
+    # REPLAY TESTS
+    if not test_replay_game(): all_passed = False
+    if not test_replay_en_passant_promotion(): all_passed = False
+    if not test_replay_games_pool(): all_passed = False
+
+    # MOVE GENERATION TESTS
+    if not test_generate_moves_start(): all_passed = False
+    if not test_generate_moves_kiwipete(): all_passed = False
+    if not test_generate_moves_pinned(): all_passed = False
+
+    # PERFT TESTS
+    if not test_perft_reference(): all_passed = False
+    if not test_perft_divide(): all_passed = False
+
+    # HASHING TESTS
+    if not test_zobrist_transpositions(): all_passed = False
+    if not test_zobrist_state(): all_passed = False
+    if not test_transposition_table(): all_passed = False
+
+    # MAKE/UNMAKE TESTS
+    if not test_make_unmake_restores(): all_passed = False
+    if not test_unmake_en_passant(): all_passed = False
+
+    # CHECK TESTS
+    if not test_validate_check_pinned(): all_passed = False
+    if not test_validate_check_evasions(): all_passed = False
+    if not test_attack_map(): all_passed = False
+
+    # BATCH VALIDATION TESTS
+    if not test_validate_moves_batch(): all_passed = False
+
+    # SEARCH
+    if not test_search_mate_in_one(): all_passed = False
+    if not test_search_hanging_piece(): all_passed = False
+    if not test_search_limits(): all_passed = False
+
+    # EVALUATION
+    if not test_eval_incremental(): all_passed = False
+    if not test_eval_symmetry(): all_passed = False
+
+    # PARALLEL SEARCH
+    if not test_tt_torn_entry(): all_passed = False
+    if not test_parallel_search(): all_passed = False
+
+    # OPENING BOOK
+    if not test_opening_book(): all_passed = False
+
+    # TABLEBASE
+    if not test_tablebase_longest_mates(): all_passed = False
+    if not test_tablebase_probe(): all_passed = False
+    if not test_search_tablebase(): all_passed = False
+
+    # REVIEW
+    if not test_review(): all_passed = False
+
+    # POSITION INDEX
+    if not test_position_index(): all_passed = False
+
+    # ARCHIVE
+    if not test_archive(): all_passed = False
+
+    # FEN
+    if not test_fen_round_trip(): all_passed = False
+    if not test_fen_errors(): all_passed = False
+
+    # SERVER
+    if not test_server(): all_passed = False
+
+    # COMPACT STORAGE
+    if not test_compact_storage(): all_passed = False
+
+    # ATTACKERS
+    if not test_attackers_to(): all_passed = False
+
 
     # all passed
     if all_passed: print("ALL TESTS PASSED!!")
 
-tests()
\ No newline at end of file
+if __name__ == "__main__":
+    tests()
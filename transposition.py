@@ -0,0 +1,145 @@
+
+# Transposition table
+# fixed size hash table from zobrist hash -> what a search already found out about that position
+
+# LAYOUT:
+#   one flat array of 64 bit words, two words per entry (key, data), four entries per bucket
+#   a bucket is 64 bytes, so probing one position touches a single cache line
+#   the bucket is picked by the low bits of the hash, the full hash is stored to catch collisions
+#   the key word holds hash ^ data, so an entry half written by another process (see parallel_search.py)
+#   just doesn't match instead of handing back another position's data, no locks needed
+#   the words live in a plain buffer (bytearray by default) read through a memoryview,
+#   which hands back python ints directly and can sit on top of any other buffer (shared memory, mmap)
+
+# DATA WORD:
+#   bits 0-15:  best move (packed move, 0 if none)
+#   bits 16-31: score + 32768
+#   bits 32-39: depth searched
+#   bits 40-41: bound type (EXACT, LOWER, UPPER)
+#   bits 48-55: age (which search wrote it)
+
+# REPLACEMENT:
+#   same position -> overwrite it
+#   otherwise replace the slot with the lowest depth, counting stale entries from older searches as shallower
+#   so deep results survive, but not forever
+
+
+# bound types
+EXACT = 1   # score is the real value
+LOWER = 2   # search failed high, real value >= score
+UPPER = 3   # search failed low, real value <= score
+
+ENTRY_BYTES = 16
+BUCKET_ENTRIES = 4
+BUCKET_BYTES = ENTRY_BYTES * BUCKET_ENTRIES
+
+
+class TranspositionTable:
+
+    # size_mb is rounded down to a power of two number of buckets
+    # pass buffer to lay the table over existing memory instead of allocating (size_mb is ignored then)
+    def __init__(self, size_mb = 16, buffer = None):
+
+        if buffer is None:
+            buffer = bytearray(TranspositionTable.bytes_for(size_mb))
+        buckets = len(buffer) // BUCKET_BYTES
+        buckets = 1 << (buckets.bit_length() - 1)
+
+        self.buffer = buffer
+        self.bytes = memoryview(buffer).cast("B")[:buckets * BUCKET_BYTES]
+        self.words = self.bytes.cast("Q")
+        self.buckets = buckets
+        self.mask = buckets - 1
+        self.age = 0
+
+    # bytes needed for a table of a given size (for callers allocating their own buffer)
+    @staticmethod
+    def bytes_for(size_mb) -> int:
+        buckets = max(1, (int(size_mb * 1024 * 1024)) // BUCKET_BYTES)
+        return (1 << (buckets.bit_length() - 1)) * BUCKET_BYTES
+
+    # call once per search so older entries become easier to replace
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    # wipe everything
+    def clear(self):
+        self.bytes[:] = bytes(len(self.bytes))
+        self.age = 0
+
+    # look a position up
+    # returns (move, score, depth, bound) or None if it isn't stored
+    def probe(self, key):
+
+        words = self.words
+        i = (key & self.mask) * (BUCKET_ENTRIES * 2)
+        for slot in range(i, i + BUCKET_ENTRIES * 2, 2):
+            data = words[slot + 1]
+            if words[slot] ^ data == key:
+                if data == 0:
+                    return None
+                return (
+                    data & 0xFFFF,
+                    ((data >> 16) & 0xFFFF) - 32768,
+                    (data >> 32) & 0xFF,
+                    (data >> 40) & 0x3,
+                )
+        return None
+
+    # store a search result
+    def store(self, key, move, score, depth, bound):
+
+        words = self.words
+        age = self.age
+        i = (key & self.mask) * (BUCKET_ENTRIES * 2)
+
+        victim = i
+        victim_value = 1 << 30
+        for slot in range(i, i + BUCKET_ENTRIES * 2, 2):
+            data = words[slot + 1]
+
+            # same position: keep its old best move if we don't have one
+            if words[slot] ^ data == key:
+                if move == 0:
+                    move = data & 0xFFFF
+                victim = slot
+                break
+
+            # empty slot, take it
+            if data == 0:
+                victim = slot
+                break
+
+            # otherwise the least valuable: shallow and/or old
+            value = ((data >> 32) & 0xFF) - 8 * ((age - (data >> 48)) & 0xFF)
+            if value < victim_value:
+                victim_value = value
+                victim = slot
+
+        score = max(-32767, min(32767, score))
+        data = (
+            move
+            | (score + 32768) << 16
+            | min(depth, 255) << 32
+            | bound << 40
+            | age << 48
+        )
+        words[victim] = key ^ data
+        words[victim + 1] = data
+
+    # drop the views into the buffer (shared memory can't be closed while they're alive)
+    def release(self):
+        self.words.release()
+        self.bytes.release()
+
+    # permille of sampled entries written during the current search (same idea as UCI hashfull)
+    def hashfull(self) -> int:
+
+        words = self.words
+        sample = min(self.buckets, 250)
+        used = 0
+        for slot in range(1, sample * BUCKET_ENTRIES * 2, 2):
+            data = words[slot]
+            if data != 0 and (data >> 48) == self.age:
+                used += 1
+        return used * 1000 // (sample * BUCKET_ENTRIES)